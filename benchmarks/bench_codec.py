@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/29
+# @File    : bench_codec.py
+# @Software: PyCharm
+# @Desc    : JSON编解码微基准测试
+# @Author  : Kevin Chang
+
+"""JSON编解码微基准测试。
+
+对比旧的收发路径（json.dumps整个数据包再encode、先decode为str再json.loads）
+与codec模块中各编解码器（预编码外层 + 直接从bytes解析）的开销。
+
+语料可以是一个或多个文件：capture.py录制的文件，或连续的"4字节大端长度 + JSON"帧；
+不指定时使用内置的代表性语料（文本消息、base64图片、离线消息批量、心跳）。
+
+运行方式：
+    python benchmarks/bench_codec.py [语料文件 ...]
+"""
+
+import base64
+import json
+import os
+import sys
+import timeit
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import capture  # noqa: E402
+import codec  # noqa: E402
+
+ROUNDS = 2000
+
+
+def load_corpus(paths: List[str]) -> List[Dict[str, Any]]:
+    """从录制文件或长度前缀帧文件读取并解析数据包。"""
+    packets = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        if data.startswith(capture.MAGIC):
+            packets.extend(json.loads(record.body) for record in capture.read_capture(path))
+            continue
+        offset = 0
+        while offset + 4 <= len(data):
+            length = int.from_bytes(data[offset:offset + 4], byteorder="big")
+            packets.append(json.loads(data[offset + 4:offset + 4 + length]))
+            offset += 4 + length
+    return packets
+
+
+def builtin_corpus() -> List[Dict[str, Any]]:
+    """生成内置的代表性语料。"""
+    token = "a1b2c3d4" * 4
+    text = {"type": "send_message", "token": token,
+            "payload": {"to_user": "100002", "content": "今天下午的会议改到三点，记得带上论文初稿。",
+                        "time": "2025-08-29 14:03:21", "message_type": "text"}}
+    image = {"type": "send_message", "token": token,
+             "payload": {"to_user": "100002", "content": base64.b64encode(os.urandom(96 * 1024)).decode(),
+                         "time": "2025-08-29 14:05:02", "message_type": "image"}}
+    offline = {"type": "offline_messages", "token": None,
+               "payload": {"messages": [{"from_user": "100003", "content": f"离线消息{i}",
+                                         "time": "2025-08-29 09:00:00", "message_type": "text"}
+                                        for i in range(200)]}}
+    heartbeat = {"type": "heartbeat", "token": token, "payload": {"content": "ping"}, "request_id": 42}
+    return [text, image, offline, heartbeat]
+
+
+def legacy_encode(packet: Dict[str, Any]) -> bytes:
+    """旧实现：整个数据包json.dumps后再编码为bytes。"""
+    body = json.dumps(packet).encode("utf-8")
+    return len(body).to_bytes(4, byteorder="big") + body
+
+
+def legacy_decode(body: bytes) -> Any:
+    """旧实现：先解码为str再解析。"""
+    return json.loads(body.decode("utf-8"))
+
+
+def main() -> None:
+    """运行基准测试并打印每个数据包的平均编解码耗时。"""
+    packets = load_corpus(sys.argv[1:]) if len(sys.argv) > 1 else builtin_corpus()
+    bodies = [legacy_encode(packet)[4:] for packet in packets]
+    total_bytes = sum(len(body) for body in bodies)
+    print(f"语料: {len(packets)}个数据包，共{total_bytes / 1024:.1f} KiB")
+
+    def run_legacy_encode():
+        for packet in packets:
+            legacy_encode(packet)
+
+    def run_legacy_decode():
+        for body in bodies:
+            legacy_decode(body)
+
+    results = [("旧实现", timeit.timeit(run_legacy_encode, number=ROUNDS),
+                timeit.timeit(run_legacy_decode, number=ROUNDS))]
+
+    for name, impl in codec.CODECS.items():
+        envelopes = codec.EnvelopeEncoder(impl)
+
+        def run_encode():
+            for packet in packets:
+                envelopes.frame(packet["type"], packet.get("token"), packet.get("payload"), packet.get("request_id"))
+
+        def run_decode():
+            for body in bodies:
+                impl.loads(body)
+
+        results.append((name, timeit.timeit(run_encode, number=ROUNDS), timeit.timeit(run_decode, number=ROUNDS)))
+
+    baseline_encode, baseline_decode = results[0][1], results[0][2]
+    per_packet = ROUNDS * len(packets)
+    print(f"{'实现':<10}{'编码µs/包':>12}{'解码µs/包':>12}{'编码加速':>10}{'解码加速':>10}")
+    for name, encode, decode in results:
+        print(f"{name:<10}{encode / per_packet * 1e6:>12.2f}{decode / per_packet * 1e6:>12.2f}"
+              f"{baseline_encode / encode:>9.1f}x{baseline_decode / decode:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/25
+# @File    : bench_config.py
+# @Software: PyCharm
+# @Desc    : 配置读取微基准测试
+# @Author  : Kevin Chang
+
+"""配置读取微基准测试。
+
+对比每次调用都重新解析client.xml的旧实现与内存配置存储的开销。
+send_packet/receive_packet每处理一个数据包都会调用一次is_debug()，
+因此这里的单次读取耗时就是每个数据包额外付出的配置开销。
+
+运行方式：
+    python benchmarks/bench_config.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import paperlib as lib  # noqa: E402
+
+SOURCE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "data", "client.xml")
+ROUNDS = 20000
+
+
+def legacy_read_xml(xml_path: str, keyword: str) -> str:
+    """旧实现：每次调用都打开并解析整个文件。"""
+    tree = ElementTree.parse(xml_path)
+    return tree.getroot().find(f".//{keyword}").text
+
+
+def main() -> None:
+    """运行基准测试并打印每次读取的平均耗时。"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        xml_path = os.path.join(temp_dir, "client.xml")
+        shutil.copyfile(SOURCE_XML, xml_path)
+        store = lib.ConfigStore(xml_path)
+
+        legacy = timeit.timeit(lambda: legacy_read_xml(xml_path, "debug/enabled"), number=ROUNDS)
+        cached = timeit.timeit(lambda: store.get_bool("debug/enabled"), number=ROUNDS)
+
+        print(f"每次解析XML:   {legacy / ROUNDS * 1e6:8.2f} µs/次")
+        print(f"内存配置存储:  {cached / ROUNDS * 1e6:8.2f} µs/次")
+        print(f"加速比:        {legacy / cached:8.1f}x")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
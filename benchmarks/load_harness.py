@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/30
+# @File    : load_harness.py
+# @Software: PyCharm
+# @Desc    : 多客户端压力测试
+# @Author  : Kevin Chang
+
+"""多客户端压力测试。
+
+在多个进程中以无界面模式运行真实的Client（每个客户端一个独立的SQLite文件），
+客户端排成一个环：每个客户端按给定速率向下一个客户端发送文本消息，并把上一个客户端设为当前聊天对象，
+这样每条收到的消息都会走完 接收 -> 解析 -> 写数据库 -> 显示 的完整路径。
+消息内容带有发送时刻，显示时计算端到端延迟，最后汇总延迟分位数和消息吞吐量。
+
+默认在本进程中启动local_server.LocalServer；指定--server时连接已有的服务器，
+该服务器需要预先注册压力测试账号（python local_server.py --accounts N）。
+
+运行方式：
+    python benchmarks/load_harness.py --clients 100 --processes 4 --messages 50 --rate 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+import local_server  # noqa: E402
+
+# 等待所有客户端登录完成的最长时间（秒）
+BARRIER_TIMEOUT = 60.0
+
+
+def _wait(barrier) -> None:
+    """等待所有客户端到达同步点，超时或有客户端提前退出时不再等待。"""
+    try:
+        barrier.wait(BARRIER_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+
+
+def run_client(index: int, count: int, args: argparse.Namespace, host: str, port: int, db_dir: str,
+               uids: Dict[int, Optional[int]], barrier, results) -> None:
+    """运行一个无界面客户端：登录、按速率发送消息并收集端到端延迟。"""
+    import client
+    import headless
+
+    latencies: List[float] = []
+    last_render = [0.0]
+    done = threading.Event()
+
+    def on_render(rendered: headless.Rendered) -> None:
+        message = rendered.message
+        if rendered.sent or message.type != "text":
+            return
+        _, _, stamp = str(message.content).partition("|")
+        try:
+            latencies.append(rendered.at - float(stamp))
+        except ValueError:
+            return
+        last_render[0] = rendered.at
+        if len(latencies) >= args.messages:
+            done.set()
+
+    ui = headless.RecordingUI(on_render, record=False)
+    instance = client.Client(headless=True, database_file=os.path.join(db_dir, f"client{index}.sqlite"))
+    instance.net.server_host, instance.net.server_port = host, port
+    username = f"{local_server.LOAD_ACCOUNT_PREFIX}{index}"
+    ok = instance.run_headless(username, local_server.LOAD_ACCOUNT_PASSWORD, gui=ui)
+    uids[index] = int(instance.uid) if ok else None
+
+    result: Dict[str, Any] = {"index": index, "ok": ok, "sent": 0, "latencies": latencies,
+                              "first_send": None, "last_render": None}
+    # 第一次同步：所有客户端登录完成，uids已经齐全
+    _wait(barrier)
+    previous, following = uids.get((index - 1) % count), uids.get((index + 1) % count)
+    ready = ok and previous is not None and following is not None
+    if ready:
+        # 环上的相邻客户端互为好友：保存为联系人，收到的消息才能找到发送者的昵称
+        for neighbour, uid in (((index - 1) % count, previous), ((index + 1) % count, following)):
+            if not instance.contacts.is_friend(uid):
+                name = f"{local_server.LOAD_ACCOUNT_PREFIX}{neighbour}"
+                instance.save_contact(uid, name, name, "")
+        ui.current_chat = {"id": previous}
+    # 第二次同步：所有客户端都打开了与上一个客户端的聊天后才开始发送，否则最先发出的消息不会显示而被算作丢失
+    _wait(barrier)
+    if not ready:
+        result["ok"] = False
+        results.put(result)
+        return
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    result["first_send"] = time.time()
+    next_send = time.monotonic()
+    for sequence in range(args.messages):
+        delay = next_send - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if instance.send_text(following, f"{sequence}|{time.time():.6f}"):
+            result["sent"] += 1
+        next_send += interval
+
+    done.wait(args.drain)
+    result["latencies"] = list(latencies)
+    result["last_render"] = last_render[0] or None
+    results.put(result)
+
+
+def worker(indices: List[int], count: int, args: argparse.Namespace, host: str, port: int, db_dir: str,
+           uids, barrier, results) -> None:
+    """压力测试进程：在各自的线程中运行分配给本进程的客户端。"""
+    # 客户端按相对路径读取data/client.xml
+    os.chdir(SRC_DIR)
+    import log_setup
+    log_setup.configure("warning", use_queue=False)
+
+    threads = [threading.Thread(target=run_client, args=(index, count, args, host, port, db_dir,
+                                                         uids, barrier, results), daemon=True)
+               for index in indices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """已排序数据的分位数（最近秩法）。"""
+    if not values:
+        return float("nan")
+    rank = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def report(results: List[Dict[str, Any]], args: argparse.Namespace) -> None:
+    """打印压力测试结果。"""
+    logged_in = sum(1 for result in results if result["ok"])
+    sent = sum(result["sent"] for result in results)
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    starts = [result["first_send"] for result in results if result["first_send"]]
+    ends = [result["last_render"] for result in results if result["last_render"]]
+    elapsed = max(ends) - min(starts) if starts and ends else 0.0
+
+    print(f"客户端: {logged_in}/{args.clients}个登录成功，{args.processes}个进程")
+    print(f"消息:   发送{sent}条，显示{len(latencies)}条，丢失{sent - len(latencies)}条")
+    if elapsed > 0:
+        print(f"吞吐量: {len(latencies) / elapsed:.1f}条/秒（用时{elapsed:.2f}秒）")
+    if latencies:
+        print("端到端延迟(ms): " + "  ".join(
+            f"p{q}={percentile(latencies, q) * 1000:.1f}" for q in (50, 90, 99))
+            + f"  max={latencies[-1] * 1000:.1f}")
+
+
+def main() -> None:
+    """启动服务器（可选）和各压力测试进程，汇总结果。"""
+    parser = argparse.ArgumentParser(description="WritePapers多客户端压力测试")
+    parser.add_argument("--clients", type=int, default=20, help="客户端总数")
+    parser.add_argument("--processes", type=int, default=4, help="进程数")
+    parser.add_argument("--messages", type=int, default=50, help="每个客户端发送的消息数")
+    parser.add_argument("--rate", type=float, default=5.0, help="每个客户端每秒发送的消息数，0表示尽快发送")
+    parser.add_argument("--drain", type=float, default=30.0, help="发送结束后等待消息到达的最长时间（秒）")
+    parser.add_argument("--server", help="已有服务器的地址（host:port），不指定时在本进程中启动本地服务器")
+    args = parser.parse_args()
+
+    server = None
+    if args.server:
+        host, _, port = args.server.rpartition(":")
+        port = int(port)
+    else:
+        server = local_server.LocalServer(port=0, heartbeat_interval=0)
+        local_server.provision_load_accounts(server.store, args.clients)
+        host, port = server.host, server.start()
+
+    db_dir = tempfile.mkdtemp(prefix="writepapers-load-")
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    uids = manager.dict()
+    barrier = context.Barrier(args.clients)
+    results_queue = context.Queue()
+    processes = [context.Process(target=worker, args=(list(range(p, args.clients, args.processes)), args.clients,
+                                                      args, host, port, db_dir, uids, barrier, results_queue))
+                 for p in range(min(args.processes, args.clients))]
+    try:
+        for process in processes:
+            process.start()
+        results = []
+        deadline = BARRIER_TIMEOUT + args.messages / max(args.rate, 1e-3) + args.drain + 30
+        while len(results) < args.clients:
+            try:
+                results.append(results_queue.get(timeout=deadline))
+            except queue.Empty:
+                print(f"等待结果超时，只收到{len(results)}个客户端的结果", file=sys.stderr)
+                break
+        report(results, args)
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        manager.shutdown()
+        if server is not None:
+            server.stop()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
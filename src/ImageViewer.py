@@ -8,9 +8,28 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import io
-from typing import Union, Optional, List
+from typing import Optional, Tuple, Union
 import os
 
+import frame_cache
+import image_decoder
+import image_tiles
+
+
+def _open_image(image_data: bytes) -> Tuple[Image.Image, int]:
+    """在后台线程中解码图片。
+
+    Args:
+        :param image_data: 图片的二进制数据
+
+    Returns:
+        :return (解码后的图片, 动图的帧数)，静态图片的帧数为0
+    """
+    image = Image.open(io.BytesIO(image_data))
+    image.load()
+    frame_count = image.n_frames if getattr(image, 'is_animated', False) else 0
+    return image, frame_count
+
 
 class ImageViewer:
     """
@@ -20,12 +39,14 @@ class ImageViewer:
     可通过二进制数据或PIL图片对象调用
     """
 
-    def __init__(self, master: Optional[tk.Tk] = None, need_menu: bool = True) -> None:
+    def __init__(self, master: Optional[tk.Tk] = None, need_menu: bool = True,
+                 decoder: Optional[image_decoder.ImageDecoder] = None) -> None:
         """初始化图片查看器。
 
         Args:
             :param master: 父窗口，如果为None则创建新的根窗口
             :param need_menu: 是否需要菜单栏
+            :param decoder: 后台解码服务，为None时自行创建
             
         Returns:
             :return 无返回值
@@ -41,11 +62,17 @@ class ImageViewer:
         self.scale_factor = 1.0
         self.rotation = 0
 
-        # GIF动画相关
-        self.gif_frames: List[Image.Image] = []
+        # 后台解码服务，自行创建的在关闭窗口时一起关闭
+        self.decoder = decoder if decoder else image_decoder.ImageDecoder(self.master)
+        self._owns_decoder = decoder is None
+
+        # GIF动画相关，变换好的帧由帧缓存在后台填充
+        self.gif_frame_count = 0
         self.current_frame = 0
         self.animation_job: Optional[str] = None
         self.frame_duration = 100  # 默认帧间隔
+        self.frame_cache = frame_cache.GifFrameCache(self.decoder, on_frame_ready=self._on_frame_ready)
+        self._gif_item: Optional[int] = None
 
         # 界面组件
         self.window: Optional[tk.Toplevel] = None
@@ -92,12 +119,12 @@ class ImageViewer:
         self.scrollbar_v = ttk.Scrollbar(
             canvas_frame,
             orient="vertical",
-            command=self.canvas.yview
+            command=self._on_scroll_y
         )
         self.scrollbar_h = ttk.Scrollbar(
             canvas_frame,
             orient="horizontal",
-            command=self.canvas.xview
+            command=self._on_scroll_x
         )
 
         self.canvas.configure(
@@ -105,6 +132,9 @@ class ImageViewer:
             xscrollcommand=self.scrollbar_h.set
         )
 
+        # 静态图片使用分块渲染器，只渲染可视区域
+        self.renderer = image_tiles.TiledRenderer(self.canvas, self.decoder)
+
         # 布局画布和滚动条
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar_v.pack(side="right", fill="y")
@@ -227,6 +257,9 @@ class ImageViewer:
         self.canvas.bind('<Control-Button-5>', lambda e: self.zoom_out())
         self.canvas.bind('<Control-MouseWheel>', self._on_mousewheel)
 
+        # 画布尺寸变化时补充渲染新露出的图块
+        self.canvas.bind('<Configure>', lambda e: self._render_viewport())
+
         # 窗口关闭事件
         self.window.protocol("WM_DELETE_WINDOW", self.close)
 
@@ -237,6 +270,21 @@ class ImageViewer:
         else:
             self.zoom_out()
 
+    def _on_scroll_x(self, *args) -> None:
+        """水平滚动条事件处理"""
+        self.canvas.xview(*args)
+        self._render_viewport()
+
+    def _on_scroll_y(self, *args) -> None:
+        """垂直滚动条事件处理"""
+        self.canvas.yview(*args)
+        self._render_viewport()
+
+    def _render_viewport(self) -> None:
+        """渲染滚动或调整窗口后新露出的图块"""
+        if self.original_image and not self.gif_frame_count:
+            self.renderer.render()
+
     def open_file(self) -> None:
         """打开文件对话框选择图片"""
         file_types = [
@@ -269,9 +317,11 @@ class ImageViewer:
             bool: 加载成功返回True，失败返回False
         """
         try:
-            with Image.open(filepath) as img:
-                self.load_image(img.copy())
-            self.status_bar.config(text=f"已加载: {os.path.basename(filepath)}")
+            # 以二进制数据加载，保留动图的全部帧
+            with open(filepath, 'rb') as image_file:
+                if not self.load_image(image_file.read()):
+                    return False
+            self.status_bar.config(text=f"正在加载: {os.path.basename(filepath)}")
             return True
         except Exception as e:
             messagebox.showerror("错误", f"无法加载图片: {str(e)}")
@@ -280,58 +330,73 @@ class ImageViewer:
     def load_image(self, image_data: Union[bytes, Image.Image]) -> bool:
         """加载图片数据。
 
+        二进制数据在后台线程中解码，解码完成后才显示，原图很大时界面也不会卡住。
+
         Args:
             :param image_data: 图片的二进制数据或PIL图片对象
 
         Returns:
-            :return 加载成功返回True，失败返回False
+            :return 开始加载返回True，数据类型不支持时返回False
         """
-        try:
-            # 停止当前的GIF动画
-            self._stop_animation()
-
-            # 处理输入数据
-            if isinstance(image_data, bytes):
-                # 二进制数据
-                image = Image.open(io.BytesIO(image_data))
-            elif isinstance(image_data, Image.Image):
-                # PIL图片对象
-                image = image_data.copy()
-            else:
-                raise ValueError("不支持的图片数据类型")
-
-            self.original_image = image
-            self.scale_factor = 1.0
-            self.rotation = 0
+        # 取消上一次尚未完成的加载
+        self.decoder.cancel_group(self._load_group)
+        if isinstance(image_data, bytes):
+            self.decoder.submit(_open_image, image_data, group=self._load_group,
+                                callback=lambda result: self._show_image(result[0], result[1], image_data),
+                                on_error=self._on_load_error)
+            return True
+        if isinstance(image_data, Image.Image):
+            # PIL图片对象已经解码
+            self._show_image(image_data.copy(), 0, None)
+            return True
+        self._on_load_error(ValueError("不支持的图片数据类型"))
+        return False
 
-            # 检查是否为GIF动画
-            if hasattr(image, 'is_animated') and image.is_animated:
-                self._load_gif_frames()
-            else:
-                self.gif_frames = []
-                self.current_frame = 0
+    @property
+    def _load_group(self) -> Tuple[str, int]:
+        """本窗口的图片加载任务在解码服务中的分组。"""
+        return "viewer", id(self)
 
-            self._update_display()
-            self._update_status()
+    def _on_load_error(self, error: BaseException) -> None:
+        """图片加载失败的回调"""
+        messagebox.showerror("错误", f"无法加载图片: {str(error)}")
 
-            return True
+    def _show_image(self, image: Image.Image, frame_count: int, image_data: Optional[bytes]) -> None:
+        """显示已经解码的图片，在主线程中调用。
 
-        except Exception as e:
-            messagebox.showerror("错误", f"无法加载图片: {str(e)}")
-            return False
+        Args:
+            :param image: 解码后的图片
+            :param frame_count: 动图的帧数，静态图片为0
+            :param image_data: 图片的二进制数据，动图的帧缓存从中解码各帧
 
-    def _load_gif_frames(self) -> None:
-        """加载GIF动画的所有帧"""
-        self.gif_frames = []
-        try:
-            frame_index = 0
-            while True:
-                self.original_image.seek(frame_index)
-                frame = self.original_image.copy()
-                self.gif_frames.append(frame)
-                frame_index += 1
-        except EOFError:
-            pass  # 已到达最后一帧
+        Returns:
+            :return 无返回值
+        """
+        # 停止当前的GIF动画
+        self._stop_animation()
+
+        self.original_image = image
+        self.scale_factor = 1.0
+        self.rotation = 0
+
+        self.canvas.delete("all")
+        self._gif_item = None
+        if frame_count and image_data is not None:
+            self.renderer.clear()
+            self._load_gif_frames(image_data, frame_count)
+        else:
+            self.gif_frame_count = 0
+            self.current_frame = 0
+            self.frame_cache.clear()
+            self.renderer.set_image(image)
+
+        self._update_display()
+        self._update_status()
+
+    def _load_gif_frames(self, image_data: bytes, frame_count: int) -> None:
+        """准备GIF动画的帧缓存，帧在播放时由后台按需解码"""
+        self.gif_frame_count = frame_count
+        self.frame_cache.load(image_data, self.gif_frame_count)
 
         self.current_frame = 0
         # 获取帧间隔时间
@@ -341,47 +406,47 @@ class ImageViewer:
             self.frame_duration = 100
 
     def _update_display(self) -> None:
-        """更新图片显示"""
+        """更新图片显示
+
+        静态图片交给分块渲染器；动图切换到对应视图的帧缓存，视图变化时缓存会被清空并重新填充。
+        """
         if not self.original_image:
             return
 
-        try:
-            # 获取当前要显示的图片
-            if self.gif_frames and len(self.gif_frames) > 0:
-                current_img = self.gif_frames[self.current_frame]
-            else:
-                current_img = self.original_image
-
-            # 应用旋转
-            if self.rotation != 0:
-                current_img = current_img.rotate(self.rotation, expand=True)
+        if not self.gif_frame_count:
+            self.display_image = None
+            self.renderer.set_view(self.scale_factor, self.rotation, interactive=True)
+            return
 
-            # 应用缩放
-            if self.scale_factor != 1.0:
-                new_width = int(current_img.width * self.scale_factor)
-                new_height = int(current_img.height * self.scale_factor)
-                if new_width > 0 and new_height > 0:
-                    current_img = current_img.resize(
-                        (new_width, new_height),
-                        Image.Resampling.LANCZOS
-                    )
+        self.frame_cache.set_view(self.scale_factor, self.rotation)
+        self._stop_animation()
+        self._show_gif_frame()
 
-            self.display_image = current_img
-            self.photo = ImageTk.PhotoImage(current_img)
+    def _show_gif_frame(self) -> None:
+        """显示当前帧；帧尚未缓存时等待_on_frame_ready"""
+        entry = self.frame_cache.get(self.current_frame)
+        if entry is None:
+            return
 
-            # 清除画布并显示图片
-            self.canvas.delete("all")
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+        photo, duration = entry
+        self.photo = photo
+        if self._gif_item is None:
+            self._gif_item = self.canvas.create_image(0, 0, anchor=tk.NW, image=photo)
+        else:
+            self.canvas.itemconfigure(self._gif_item, image=photo)
 
-            # 更新滚动区域
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        # 更新滚动区域
+        self.canvas.configure(scrollregion=(0, 0, photo.width(), photo.height()))
 
-            # 如果是GIF动画，继续播放下一帧
-            if self.gif_frames and len(self.gif_frames) > 1:
-                self._schedule_next_frame()
+        # 继续播放下一帧
+        self.frame_duration = duration
+        if self.gif_frame_count > 1:
+            self._schedule_next_frame()
 
-        except Exception as e:
-            messagebox.showerror("错误", f"无法更新显示: {str(e)}")
+    def _on_frame_ready(self, index: int) -> None:
+        """帧缓存填充了新帧的回调"""
+        if index == self.current_frame and self.animation_job is None:
+            self._show_gif_frame()
 
     def _schedule_next_frame(self) -> None:
         """安排播放下一帧GIF动画"""
@@ -394,10 +459,11 @@ class ImageViewer:
         )
 
     def _next_frame(self) -> None:
-        """播放GIF动画的下一帧"""
-        if self.gif_frames:
-            self.current_frame = (self.current_frame + 1) % len(self.gif_frames)
-            self._update_display()
+        """播放GIF动画的下一帧，只切换缓存中现成的PhotoImage"""
+        self.animation_job = None
+        if self.gif_frame_count:
+            self.current_frame = (self.current_frame + 1) % self.gif_frame_count
+            self._show_gif_frame()
 
     def _stop_animation(self) -> None:
         """停止GIF动画播放"""
@@ -481,8 +547,8 @@ class ImageViewer:
             if self.rotation != 0:
                 status_text += f" | 旋转: {self.rotation}°"
 
-            if self.gif_frames:
-                status_text += f" | GIF动画: {len(self.gif_frames)}帧"
+            if self.gif_frame_count:
+                status_text += f" | GIF动画: {self.gif_frame_count}帧"
 
             self.status_bar.config(text=status_text)
 
@@ -495,6 +561,11 @@ class ImageViewer:
     def close(self) -> None:
         """关闭窗口"""
         self._stop_animation()
+        self.decoder.cancel_group(self._load_group)
+        self.frame_cache.clear()
+        self.renderer.clear()
+        if self._owns_decoder:
+            self.decoder.shutdown()
         if self.is_root:
             self.window.quit()
         else:
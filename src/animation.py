@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/22
+# @File    : animation.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端聊天动图播放模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端聊天动图播放模块。
+
+本模块负责聊天气泡中GIF动图的播放。动图帧在后台线程中按需解码，
+每个动图只保留一个很小的预解码环形缓冲区，并按每帧自身的duration播放。
+所有可见动图共用一个Tk定时器驱动，不可见或已销毁的动图会自动暂停或移除。
+"""
+
+import time
+from collections import deque
+from io import BytesIO
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import structlog
+import tkinter as tk
+from PIL import Image, ImageTk
+
+import image_cache
+from image_decoder import ImageDecoder
+
+logger = structlog.get_logger()
+
+# 每个动图预解码的帧数
+DEFAULT_BUFFER_SIZE = 4
+# 帧间隔缺失或过小时使用的默认值（毫秒），与浏览器的处理方式一致
+DEFAULT_FRAME_DURATION = 100
+MIN_FRAME_DURATION = 20
+# 共享定时器的最小/最大唤醒间隔（毫秒）
+MIN_TICK_INTERVAL = 10
+IDLE_TICK_INTERVAL = 250
+# 缓冲区为空时重试的间隔（秒）
+BUFFER_RETRY_DELAY = 0.02
+
+
+def _frame_duration(image: Image.Image) -> int:
+    """获取当前帧的播放时长（毫秒）。"""
+    duration = image.info.get("duration") or DEFAULT_FRAME_DURATION
+    return DEFAULT_FRAME_DURATION if duration < MIN_FRAME_DURATION else int(duration)
+
+
+class GifAnimation:
+    """单个聊天气泡中的动图。
+
+    帧缓冲区只在Tk主线程中访问；后台解码任务每次只有一个在执行，
+    因此解码游标和源图片对象不会被并发访问。
+    """
+
+    def __init__(self, data: bytes, label: tk.Label,
+                 box: Tuple[int, int] = image_cache.THUMBNAIL_SIZE,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE) -> None:
+        """初始化动图。
+
+        Args:
+            :param data: 动图的二进制数据
+            :param label: 显示动图的标签控件
+            :param box: 帧缩略图的最大尺寸
+            :param buffer_size: 预解码环形缓冲区的大小
+
+        Returns:
+            :return 无返回值
+        """
+        self.data = data
+        self.label = label
+        self.box = box
+        self.buffer_size = buffer_size
+
+        self.next_due = 0.0
+        self.paused = True
+
+        self._buffer: Deque[Tuple[ImageTk.PhotoImage, int]] = deque()
+        self._source: Optional[Image.Image] = None
+        self._cursor = 0
+        self._loading = False
+        self._released = False
+
+    def is_alive(self) -> bool:
+        """动图对应的控件是否仍然存在。"""
+        if self._released:
+            return False
+        try:
+            return bool(self.label.winfo_exists())
+        except tk.TclError:
+            return False
+
+    def advance(self, now: float, decoder: ImageDecoder) -> None:
+        """切换到下一帧，并在需要时预解码后续帧。
+
+        Args:
+            :param now: 当前的单调时间（秒）
+            :param decoder: 后台解码服务
+
+        Returns:
+            :return 无返回值
+        """
+        if self._buffer:
+            photo, duration = self._buffer.popleft()
+            self.label.configure(image=photo)
+            self.label.image = photo  # 保持引用
+            self.next_due = now + duration / 1000
+        else:
+            # 解码跟不上时停留在当前帧，稍后重试
+            self.next_due = now + BUFFER_RETRY_DELAY
+        self._prefetch(decoder)
+
+    def release(self) -> None:
+        """释放动图占用的资源。
+
+        Returns:
+            :return 无返回值
+        """
+        self._released = True
+        self._buffer.clear()
+        if not self._loading:
+            self._close_source()
+
+    def _prefetch(self, decoder: ImageDecoder) -> None:
+        """在后台补满帧缓冲区。"""
+        missing = self.buffer_size - len(self._buffer)
+        if self._loading or missing <= 0:
+            return
+        self._loading = True
+        decoder.submit(self._decode_frames, missing, callback=self._on_frames,
+                       on_error=self._on_error, group=self)
+
+    def _decode_frames(self, count: int) -> List[Tuple[Image.Image, int]]:
+        """顺序解码接下来的count帧（在后台解码线程中执行）。"""
+        if self._source is None:
+            self._source = Image.open(BytesIO(self.data))
+        frames = []
+        for _ in range(count):
+            try:
+                self._source.seek(self._cursor)
+            except EOFError:
+                # 播放到末尾，从第一帧重新开始
+                self._cursor = 0
+                self._source.seek(0)
+            frame = self._source.convert("RGBA")
+            frame.thumbnail(self.box)
+            frames.append((frame, _frame_duration(self._source)))
+            self._cursor += 1
+        return frames
+
+    def _on_frames(self, frames: List[Tuple[Image.Image, int]]) -> None:
+        """把解码好的帧放入缓冲区（在主线程中执行）。"""
+        self._loading = False
+        if self._released:
+            self._close_source()
+            return
+        for frame, duration in frames:
+            self._buffer.append((ImageTk.PhotoImage(frame), duration))
+
+    def _on_error(self, error: BaseException) -> None:
+        """解码失败时停止播放。"""
+        self._loading = False
+        logger.warning(f"动图帧解码失败，停止播放: {error}")
+        self.release()
+
+    def _close_source(self) -> None:
+        """关闭源图片对象。"""
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+
+class AnimationEngine:
+    """聊天动图播放引擎。
+
+    所有动图共用一个after定时器，定时器只在最近一帧到期时唤醒。
+    """
+
+    def __init__(self, root: tk.Misc, decoder: ImageDecoder,
+                 is_visible: Optional[Callable[[tk.Widget], bool]] = None) -> None:
+        """初始化播放引擎。
+
+        Args:
+            :param root: 用于调度定时器的Tk控件
+            :param decoder: 后台解码服务
+            :param is_visible: 判断控件当前是否可见的函数，为None时只检查控件是否已映射
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = root
+        self.decoder = decoder
+        self.is_visible = is_visible if is_visible else lambda widget: bool(widget.winfo_ismapped())
+        self._groups: Dict[Hashable, List[GifAnimation]] = {}
+        self._timer_job: Optional[str] = None
+
+    def add(self, animation: GifAnimation, group: Optional[Hashable] = None) -> None:
+        """注册一个动图并开始播放。
+
+        Args:
+            :param animation: 动图对象
+            :param group: 动图所属的分组（通常为聊天ID）
+
+        Returns:
+            :return 无返回值
+        """
+        self._groups.setdefault(group, []).append(animation)
+        self._schedule(0)
+
+    def remove_group(self, group: Optional[Hashable]) -> None:
+        """移除一个分组中的全部动图（例如切换聊天时）。
+
+        Args:
+            :param group: 动图分组
+
+        Returns:
+            :return 无返回值
+        """
+        for animation in self._groups.pop(group, []):
+            self._release(animation)
+        if not self._groups:
+            self._cancel_timer()
+
+    def clear(self) -> None:
+        """移除全部动图并停止定时器。
+
+        Returns:
+            :return 无返回值
+        """
+        for group in list(self._groups):
+            self.remove_group(group)
+
+    def _tick(self) -> None:
+        """共享定时器回调：推进所有可见且到期的动图。"""
+        self._timer_job = None
+        now = time.monotonic()
+        next_wake: Optional[float] = None
+
+        for group, animations in list(self._groups.items()):
+            for animation in list(animations):
+                if not animation.is_alive():
+                    animations.remove(animation)
+                    self._release(animation)
+                    continue
+                try:
+                    visible = self.is_visible(animation.label)
+                except tk.TclError:
+                    visible = False
+                if not visible:
+                    animation.paused = True
+                    continue
+                if animation.paused:
+                    # 重新进入可见区域，从当前帧继续播放
+                    animation.paused = False
+                    animation.next_due = now
+                if now >= animation.next_due:
+                    animation.advance(now, self.decoder)
+                next_wake = animation.next_due if next_wake is None else min(next_wake, animation.next_due)
+            if not animations:
+                del self._groups[group]
+
+        if not self._groups:
+            return
+        if next_wake is None:
+            # 没有可见的动图，低频检查是否重新进入可见区域
+            self._schedule(IDLE_TICK_INTERVAL)
+        else:
+            delay = int((next_wake - time.monotonic()) * 1000)
+            self._schedule(min(max(delay, MIN_TICK_INTERVAL), IDLE_TICK_INTERVAL))
+
+    def _schedule(self, delay: int) -> None:
+        """安排下一次定时器唤醒，已有更早的唤醒时不做处理。"""
+        if self._timer_job is not None:
+            if delay > 0:
+                return
+            self._cancel_timer()
+        try:
+            self._timer_job = self.root.after(delay, self._tick)
+        except tk.TclError:
+            self._timer_job = None
+
+    def _cancel_timer(self) -> None:
+        """取消共享定时器。"""
+        if self._timer_job is not None:
+            try:
+                self.root.after_cancel(self._timer_job)
+            except tk.TclError:
+                pass
+            self._timer_job = None
+
+    def _release(self, animation: GifAnimation) -> None:
+        """释放动图并取消其未完成的解码任务。"""
+        self.decoder.cancel_group(animation)
+        animation.release()
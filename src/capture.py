@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/29
+# @File    : capture.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端数据包录制与回放模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端数据包录制与回放模块。
+
+ClientNetwork在启用录制时把收发的每一帧写入紧凑的二进制日志，
+ReplayServer把日志中收到的帧按原来的时间间隔（或加速）重新发给真实的客户端，
+无需在线服务器即可在真实的突发流量下测量process_message、update_contacts和界面渲染。
+
+日志格式：
+    文件头为MAGIC；
+    之后每条记录为13字节的记录头（方向1字节、相对录制开始的秒数8字节双精度、数据长度4字节，均为大端）
+    加上不含长度前缀的JSON数据。
+
+用法：
+    WRITEPAPERS_CAPTURE=data/session.wpcap python client.py     # 录制
+    python capture.py dump data/session.wpcap                   # 查看
+    python capture.py replay data/session.wpcap --speed 10      # 以10倍速回放给连接上来的客户端
+"""
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+MAGIC = b"WPCAP\x01"
+# 方向、时间戳、数据长度
+RECORD_HEADER = struct.Struct(">BdI")
+INBOUND = 0  # 服务器发给客户端
+OUTBOUND = 1  # 客户端发给服务器
+DIRECTION_NAMES = {INBOUND: "收", OUTBOUND: "发"}
+# 启用录制的环境变量，值为日志文件路径
+CAPTURE_ENV = "WRITEPAPERS_CAPTURE"
+# 每写入这么多条记录刷新一次文件，客户端异常退出时最多丢失这些记录
+FLUSH_EVERY = 64
+
+
+class Record(NamedTuple):
+    """一条录制的数据帧。"""
+    direction: int  # INBOUND或OUTBOUND
+    timestamp: float  # 相对录制开始的秒数
+    body: bytes  # 不含长度前缀的JSON数据
+
+
+def capture_path_from_env() -> Optional[str]:
+    """从环境变量读取录制文件路径。
+
+    Returns:
+        :return 录制文件路径，未启用时为None
+    """
+    return os.environ.get(CAPTURE_ENV) or None
+
+
+class CaptureWriter:
+    """数据帧录制类，可以从接收线程和写线程同时调用。"""
+
+    def __init__(self, path: str) -> None:
+        """创建录制文件并写入文件头。
+
+        Args:
+            :param path: 录制文件路径，已存在时覆盖
+
+        Returns:
+            :return 无返回值
+        """
+        self.path = path
+        self.count = 0
+        self._file: Optional[BinaryIO] = open(path, "wb")
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        logger.info(f"正在录制数据包到{path}")
+
+    def record(self, direction: int, body: bytes) -> None:
+        """写入一帧。
+
+        Args:
+            :param direction: INBOUND或OUTBOUND
+            :param body: 不含长度前缀的JSON数据
+
+        Returns:
+            :return 无返回值
+        """
+        timestamp = time.monotonic() - self._start
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD_HEADER.pack(direction, timestamp, len(body)))
+            self._file.write(body)
+            self.count += 1
+            if self.count % FLUSH_EVERY == 0:
+                self._file.flush()
+
+    def close(self) -> None:
+        """关闭录制文件，重复调用无影响。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        logger.info(f"录制结束，共{self.count}帧，已保存到{self.path}")
+
+
+def read_capture(path: str) -> Iterator[Record]:
+    """依次读取录制文件中的记录。
+
+    Args:
+        :param path: 录制文件路径
+
+    Returns:
+        :return 记录迭代器，文件末尾不完整的记录（录制中途退出）会被忽略
+
+    Raises:
+        :raise ValueError: 不是录制文件时抛出
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}不是数据包录制文件")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            direction, timestamp, length = RECORD_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length:
+                return
+            yield Record(direction, timestamp, body)
+
+
+class ReplayServer:
+    """录制回放服务器类。
+
+    每个连接上来的客户端都会收到录制文件中全部的INBOUND帧，帧间隔按speed缩放；
+    客户端发来的数据只读取并计数，不作应答。
+    """
+
+    def __init__(self, path: str, host: str = "127.0.0.1", port: int = 3624, speed: float = 1.0) -> None:
+        """初始化回放服务器，录制内容一次性读入内存。
+
+        Args:
+            :param path: 录制文件路径
+            :param host: 监听地址
+            :param port: 监听端口
+            :param speed: 回放速度倍数，0表示不等待、尽快发送
+
+        Returns:
+            :return 无返回值
+        """
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.records = [record for record in read_capture(path) if record.direction == INBOUND]
+        self._sock: Optional[socket.socket] = None
+
+    def serve_forever(self) -> None:
+        """监听端口，为每个连接启动一个回放线程。
+
+        Returns:
+            :return 无返回值
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen()
+        logger.info(f"回放服务器已在{self.host}:{self.port}监听，共{len(self.records)}帧，速度{self.speed}x")
+        while True:
+            try:
+                conn, address = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._replay, args=(conn, address), daemon=True).start()
+
+    def close(self) -> None:
+        """停止监听。
+
+        Returns:
+            :return 无返回值
+        """
+        if self._sock is not None:
+            self._sock.close()
+
+    def _replay(self, conn: socket.socket, address) -> None:
+        """向一个客户端回放全部帧。"""
+        logger.info(f"客户端{address}已连接，开始回放")
+        received = [0]
+        threading.Thread(target=self._drain, args=(conn, received), daemon=True).start()
+
+        sent_bytes = 0
+        start = time.monotonic()
+        first = self.records[0].timestamp if self.records else 0.0
+        try:
+            for record in self.records:
+                if self.speed > 0:
+                    delay = start + (record.timestamp - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                conn.sendall(len(record.body).to_bytes(4, byteorder="big") + record.body)
+                sent_bytes += len(record.body) + 4
+        except OSError as e:
+            logger.warning(f"客户端{address}断开: {e}")
+            return
+        elapsed = time.monotonic() - start
+        rate = len(self.records) / elapsed if elapsed > 0 else float("inf")
+        logger.info(f"向{address}回放完成：{len(self.records)}帧，{sent_bytes / 1024:.1f} KiB，"
+                    f"用时{elapsed:.2f}秒（{rate:.0f}帧/秒），期间收到客户端{received[0]}帧")
+
+    @staticmethod
+    def _drain(conn: socket.socket, received: list) -> None:
+        """读取并丢弃客户端发来的数据帧，避免客户端的发送缓冲区被填满。"""
+        try:
+            while True:
+                length_bytes = conn.recv(4, socket.MSG_WAITALL)
+                if len(length_bytes) < 4:
+                    return
+                length = int.from_bytes(length_bytes, byteorder="big")
+                if len(conn.recv(length, socket.MSG_WAITALL)) < length:
+                    return
+                received[0] += 1
+        except OSError:
+            return
+
+
+def dump(path: str, limit: int = 200) -> None:
+    """打印录制文件的概要。
+
+    Args:
+        :param path: 录制文件路径
+        :param limit: 最多显示的数据长度（字符）
+
+    Returns:
+        :return 无返回值
+    """
+    for record in read_capture(path):
+        text = record.body.decode("utf-8", "replace")
+        if len(text) > limit:
+            text = text[:limit] + f"...（共{len(record.body)}字节）"
+        print(f"{record.timestamp:10.3f} {DIRECTION_NAMES.get(record.direction, '?')} {text}")
+
+
+def main(argv: Optional[list] = None) -> None:
+    """命令行入口。"""
+    parser = argparse.ArgumentParser(description="WritePapers数据包录制查看与回放")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump_parser = commands.add_parser("dump", help="打印录制文件内容")
+    dump_parser.add_argument("path")
+    replay_parser = commands.add_parser("replay", help="把录制文件回放给连接上来的客户端")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=3624)
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0表示尽快发送")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        dump(args.path)
+        return
+    server = ReplayServer(args.path, args.host, args.port, args.speed)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/2
+# @File    : chat_message.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端聊天消息模型模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端聊天消息模型模块。
+
+聊天消息在客户端内部统一用Message表示，字段顺序与chat_history表的列顺序相同，
+只在边界处转换一次：
+    数据库：row_factory把查询结果直接构造成Message，不再经过普通元组；
+    网络：from_payload（实时消息）和from_offline（离线消息列表）在处理器入口转换，
+          图片的base64在这里解码，之后各处拿到的图片内容都是bytes；
+    发送：outgoing构造本地发出的消息。
+界面直接显示Message，时间文本和联系人列表中的摘要在需要时才格式化。
+"""
+
+import base64
+import sqlite3
+import time
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+# 联系人列表中文本摘要的最大长度
+PREVIEW_LENGTH = 50
+
+
+class Message(NamedTuple):
+    """一条聊天消息，与chat_history表的一行对应。"""
+    id: Optional[int]  # chat_history中的index，尚未写入数据库时为None
+    from_user: int
+    to_user: int
+    type: str  # "text"或"image"
+    content: Union[str, bytes]  # 文本或图片数据
+    send_time: float  # 发送时间戳
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any], to_user: Union[str, int]) -> "Message":
+        """从服务器推送的new_message载荷构造消息。
+
+        Args:
+            :param payload: 消息载荷，包含from_user、send_time、message_type、message_content
+            :param to_user: 接收者（当前用户）ID
+
+        Returns:
+            :return 消息
+        """
+        message_type = payload["message_type"]
+        return cls(None, int(payload["from_user"]), int(to_user), message_type,
+                   decode_content(message_type, payload["message_content"]), payload["send_time"])
+
+    @classmethod
+    def from_offline(cls, item: Sequence[Any]) -> "Message":
+        """从离线消息列表中的一项构造消息。
+
+        Args:
+            :param item: [content, from_user, to_user, timestamp, message_type]
+
+        Returns:
+            :return 消息
+        """
+        content, from_user, to_user, timestamp, message_type = item
+        return cls(None, int(from_user), int(to_user), message_type, decode_content(message_type, content), timestamp)
+
+    @classmethod
+    def outgoing(cls, from_user: Union[str, int], to_user: Union[str, int], message_type: str,
+                 content: Union[str, bytes]) -> "Message":
+        """构造一条当前用户发出的消息，发送时间为现在。
+
+        Args:
+            :param from_user: 当前用户ID
+            :param to_user: 接收者ID
+            :param message_type: 消息类型
+            :param content: 文本或图片数据
+
+        Returns:
+            :return 消息
+        """
+        return cls(None, int(from_user), int(to_user), message_type, content, time.time())
+
+    def row(self) -> Tuple[Any, ...]:
+        """插入chat_history的值（from_user, to_user, type, content, send_time）。"""
+        return self[1:]
+
+    def time_label(self, fmt: str = "%H:%M") -> str:
+        """格式化的发送时间，时间戳无效时返回"--:--"。"""
+        try:
+            if isinstance(self.send_time, (int, float)) and self.send_time > 0:
+                return time.strftime(fmt, time.localtime(self.send_time))
+        except (ValueError, OSError, OverflowError):
+            pass
+        return "--:--"
+
+    def preview(self) -> str:
+        """联系人列表中显示的消息摘要。"""
+        if self.type == "text":
+            text = str(self.content)
+            return text[:PREVIEW_LENGTH] + "..." if len(text) > PREVIEW_LENGTH else text
+        if self.type == "image":
+            return "[图片]"
+        return "[未知消息类型]"
+
+
+def decode_content(message_type: str, content: Union[str, bytes]) -> Union[str, bytes]:
+    """把网络上传输的消息内容转换为内部表示，图片从base64解码为bytes。
+
+    Args:
+        :param message_type: 消息类型
+        :param content: 网络上的消息内容
+
+    Returns:
+        :return 文本或图片数据
+    """
+    if message_type == "image" and isinstance(content, str):
+        return base64.b64decode(content)
+    return content
+
+
+_new_tuple = tuple.__new__
+
+
+def row_factory(_: sqlite3.Cursor, row: Tuple[Any, ...]) -> Message:
+    """sqlite3的row_factory，把chat_history的一行直接构造为Message。
+
+    查询的列与Message的字段一一对应，直接构造元组，省去Message._make的长度检查。
+    """
+    return _new_tuple(Message, row)
@@ -11,9 +11,14 @@
 本模块包含客户端的核心功能，包括用户登录、消息处理、联系人管理等。
 """
 
+import startup
+
+if startup.report_enabled():
+    # 必须在导入其他模块之前安装，才能统计到全部导入耗时
+    startup.install_import_timer()
+
 import _tkinter
 import base64
-import datetime
 import os
 import socket
 import sys
@@ -21,17 +26,30 @@ import threading
 import time
 import tkinter as tk
 import tkinter.filedialog
+from concurrent.futures import Future
 from tkinter import messagebox
-from typing import Any, Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
+import contact_manager
 import database
+import keepalive
+import log_setup
+import metrics
 import networking
 import paperlib as lib
+import persister
+import profiling
 import structlog
+import tracing
+import ui_watchdog
+from chat_message import Message
 from login_ui import LoginUI
-from reg_ui import RegisterUI
-from settings_ui import SettingsDialog
-from ui import GUI
+
+if TYPE_CHECKING:
+    # 主界面、注册界面和设置界面在首次使用时才导入（reg_ui和ui会间接导入PIL），
+    # 保证登录窗口尽快显示
+    from reg_ui import RegisterUI
+    from ui import GUI
 
 
 class Client:
@@ -40,7 +58,7 @@ class Client:
     负责管理客户端的所有功能，包括网络连接、用户界面、数据库操作等。
     """
     
-    def __init__(self) -> None:
+    def __init__(self, headless: bool = False, database_file: Optional[str] = None) -> None:
         """初始化WritePapers客户端。
         
         初始化客户端的所有核心组件，包括：
@@ -50,6 +68,10 @@ class Client:
         - 数据库连接
         - 服务器配置信息
 
+        Args:
+            headless (bool): 是否以无界面模式运行（由run_headless启动，不创建任何Tk窗口）
+            database_file (Optional[str]): 数据库文件路径，为None时使用配置文件中的设置
+
         Returns:
             :return None
             
@@ -61,21 +83,38 @@ class Client:
         self.username: Optional[str] = None  # 用户名
         self.password: Optional[str] = None  # 用户密码
         self.msg_uid: Optional[Union[str, int]] = None  # 消息系统中的用户ID
+        self.config_uid: Optional[Union[str, int]] = None  # 登录前（配置文件中）的用户ID，登录后uid改为msg_uid
         self.logged_in: bool = False  # 用户登录状态标志
+        self.login_done = threading.Event()  # 收到登录结果（成功或失败）时置位
         
         # ==================== 用户界面相关属性 ====================
         self.login_ui_class: Optional[LoginUI] = None  # 登录界面类实例
         self.login_root: Optional[tk.Tk] = None  # 登录窗口根对象
         self.register_root: Optional[tk.Tk] = None  # 注册窗口根对象
-        self.register_class: Optional[RegisterUI] = None  # 注册界面类实例
+        self.register_class: Optional["RegisterUI"] = None  # 注册界面类实例
         self.root: Optional[tk.Tk] = None  # 主窗口根对象
-        self.gui: Optional[GUI] = None  # 主界面类实例
+        self.gui: Optional["GUI"] = None  # 主界面类实例，无界面模式下为headless.RecordingUI
+        self.headless: bool = headless  # 无界面模式标志
         
         # ==================== 核心功能组件 ====================
         self.logger = structlog.get_logger()  # 结构化日志记录器
         self.net = networking.ClientNetwork()  # 网络通信模块
         self.net.is_debug = lambda: self.is_debug()  # 设置网络模块的调试模式检查函数
+        self._register_handlers()  # 登记客户端负责的消息处理器
         self.db = database.Database()  # 数据库操作模块
+        self.contacts = contact_manager.ContactManager()  # 内存中的联系人索引，登录后从数据库加载
+        self.contacts.subscribe(self._on_contacts_changed)
+        # 等待主线程应用的联系人变化：需要整体重新加载，或者只需要移动的联系人
+        self._contacts_lock = threading.Lock()
+        self._contacts_reload_pending: bool = False
+        self._moved_contacts: Dict[int, contact_manager.Contact] = {}
+        self._contacts_refresh_pending: bool = False  # 是否已经安排了联系人列表刷新
+        self.database_file: Optional[str] = database_file  # 数据库文件路径，None表示读取配置文件
+        self.startup_graph: Optional[startup.StartupGraph] = None  # 并发启动步骤依赖图
+        self._settings_pending: bool = False  # 是否正在等待好友口令以打开设置
+        self.profiler: Optional[profiling.ProfilingController] = None  # 性能剖析控制器，主界面创建后可用
+        self.watchdog: Optional[ui_watchdog.TkWatchdog] = None  # 界面卡顿看门狗，主界面创建后启动
+        self.metrics_reporter = metrics.Reporter(metrics.registry)  # 定时把运行指标写入日志
         
         # ==================== 服务器配置初始化 ====================
         # 从配置文件读取服务器连接信息
@@ -107,88 +146,71 @@ class Client:
             bool: 如果启用调试模式返回True，否则返回False
             
         Note:
-            调试模式配置存储在XML配置文件的debug/enabled节点中
+            调试模式配置存储在XML配置文件的debug/enabled节点中，读取时直接命中内存缓存
+        """
+        # 配置存储只在文件变化时重新解析，逐包调用时几乎没有开销
+        return lib.get_config().get_bool("debug/enabled")
+
+    def _show_message(self, kind: str, title: str, message: str) -> None:
+        """向用户显示提示框，无界面模式下只写入日志。
+
+        Args:
+            kind (str): 提示类型（"info"、"warning"或"error"）
+            title (str): 标题
+            message (str): 提示内容
+
+        Returns:
+            :return None
         """
-        debug_enabled = lib.read_xml("debug/enabled")
-        # 检查配置值是否为真值字符串
-        return debug_enabled in ("true", "True")
+        if self.headless:
+            log = {"info": self.logger.info, "warning": self.logger.warning}.get(kind, self.logger.error)
+            log(f"{title}: {message}")
+            return
+        getattr(messagebox, f"show{kind}")(title, message)
 
-    def _handle_chat_message(self, from_user: Union[str, int], send_time: float, 
-                           message_type: str, message_content: Union[str, bytes], 
-                           need_update_contact: bool = True) -> None:
+    def _handle_chat_message(self, message: Message) -> None:
         """处理接收到的聊天消息。
         
         该方法负责处理从服务器接收到的聊天消息，包括：
-        1. 将消息保存到本地数据库
+        1. 将消息保存到本地数据库，并更新联系人索引中的最后一条消息
         2. 如果当前聊天窗口对应发送者，则实时显示消息
         3. 记录消息到日志系统
-        4. 更新联系人列表（可选）
+        联系人列表由联系人索引的观察者负责刷新。
+        登录后主界面创建前收到的消息只保存不显示，打开聊天时从数据库加载。
         
         Args:
-            from_user (Union[str, int]): 消息发送者的用户ID
-            send_time (float): 消息发送的时间戳（Unix时间戳）
-            message_type (str): 消息类型，支持"text"（文本）和"image"（图片）
-            message_content (Union[str, bytes]): 消息内容，文本消息为字符串，图片消息为字节数据
-            need_update_contact (bool, optional): 是否需要更新联系人列表，默认为True
+            message (Message): 收到的聊天消息，图片内容已经解码为bytes
             
         Returns:
             :return None
             
         Note:
-            - 图片消息内容为base64编码的字节数据
             - 消息会自动保存到本地SQLite数据库中
         """
-        # 步骤1: 保存消息到本地数据库
-        self.db.save_chat_message(from_user, self.uid, message_content, send_time, message_type)
+        # 步骤1: 保存消息到本地数据库（开启延迟写入后只追加到日志，由后台线程批量提交）
+        # 登录后数据库可能仍在后台准备，先等待延迟写入就绪
+        if self.startup_graph is not None:
+            self.startup_graph.result("write_behind")
+        self.db.save_chat_message(message)
+        self.contacts.record_message(message.from_user, message)
+        trace = tracing.current()
+        tracing.stamp(trace, "db_commit")
         
         # 步骤2: 如果当前聊天窗口对应消息发送者，则实时显示消息
-        if self.gui.current_chat and self.gui.current_chat['id'] == int(from_user):
-            # 获取发送者显示名称
-            sender_name = self.db.get_mem_by_uid(from_user)
-            formatted_time = time.strftime("%H:%M", time.localtime(send_time))
-            
-            if message_type == "text":
-                # 处理文本消息
-                message_data = {
-                    "content": message_content, 
-                    "time": formatted_time,
-                    "status": "received", 
-                    "sender": sender_name, 
-                    "type": message_type
-                }
-                self.gui.display_message(message_data)
-            elif message_type == "image":
-                # 处理图片消息（需要解码base64数据）
-                message_data = {
-                    "content": base64.b64decode(message_content), 
-                    "time": formatted_time,
-                    "status": "received", 
-                    "sender": sender_name, 
-                    "type": message_type
-                }
-                self.gui.display_message(message_data)
-        # 步骤3: 记录消息到日志系统
-        sender_name = self.db.get_mem_by_uid(from_user)
-        formatted_datetime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(send_time))
-        
-        if message_type == "text":
-            # 记录文本消息到日志
-            self.logger.info(f"{formatted_datetime} {sender_name}: {message_content}")
-        elif message_type == "image":
-            # 记录图片消息到日志
-            self.logger.info(f"{formatted_datetime} {sender_name}: [图片]")
-        
-        # 步骤4: 根据需要更新联系人列表
-        if need_update_contact:
-            self.update_contacts()
+        if self.gui is not None and self.gui.current_chat and self.gui.current_chat['id'] == message.from_user:
+            self.gui.display_message(message, False)
+            tracing.stamp(trace, "render")
+        # 步骤3: 记录消息到日志系统（昵称查询和内容截断只在日志真正输出时进行）
+        if message.type in ("text", "image"):
+            self.logger.info("收到聊天消息", send_time=message.send_time,
+                             sender=log_setup.lazy(self.contacts.display_name, message.from_user),
+                             content=log_setup.lazy(message.preview))
 
     def process_message(self, net_module: networking.ClientNetwork) -> None:
-        """处理网络模块中的各种消息队列。
+        """执行网络模块中等待处理的消息。
         
-        该方法负责处理网络模块中的三种消息队列：
-        1. 离线消息队列 - 处理用户离线期间收到的消息
-        2. 实时消息队列 - 处理实时接收的聊天消息
-        3. 返回值队列 - 处理服务器的各种响应结果
+        聊天消息、离线消息和服务器的各种响应结果在接收线程中只做分发，
+        登记为延迟处理器的部分在这里按到达顺序执行。
         
         Args:
             net_module (networking.ClientNetwork): 网络通信模块实例
@@ -199,53 +221,47 @@ class Client:
         Note:
             该方法通常在独立线程中循环调用，用于实时处理各种网络消息
         """
+        net_module.handlers.run_deferred()
+
+    def _register_handlers(self) -> None:
+        """在网络模块的处理器注册表中登记客户端负责的消息类型。
+
+        这些处理器都会访问数据库或界面，因此登记为延迟处理器，在消息处理线程中执行。
+
+        Returns:
+            :return None
+        """
+        registry = self.net.handlers
+        registry.register("new_message", self._handle_new_message, deferred=True)
+        registry.register("offline_messages", self._handle_offline_messages, deferred=True)
+
+        result_handlers = {
+            "send_message_result": self._handle_send_message_result,
+            "register_result": self._handle_register_result,
+            "login_result": self._handle_login_result,
+            "add_friend_result": self._handle_add_friend_result,
+        }
+        for message_type, handler in result_handlers.items():
+            registry.register(message_type, lambda msg, h=handler: h(msg.get('payload', {})), deferred=True)
+
+    def _handle_new_message(self, msg: Dict[str, Any]) -> None:
+        """处理实时聊天消息。"""
+        self._handle_chat_message(Message.from_payload(msg['payload'], self.uid))
 
-        # ==================== 处理离线消息队列 ====================
-        while not net_module.offline_message_queue.empty():
-            offline_msg = net_module.offline_message_queue.get_nowait()
+    def _handle_offline_messages(self, msg: Dict[str, Any]) -> None:
+        """处理离线消息列表。"""
+        offline_messages = msg.get("payload", [])
+        for offline_msg in offline_messages:
             # 离线消息格式: [content, from_user, to_user, timestamp, message_type]
-            content, from_user, to_user, timestamp, msg_type = offline_msg
-            
-            if msg_type == "text":
-                # 处理离线文本消息
-                self.db.save_chat_message(from_user, to_user, content, timestamp)
-                sender_name = self.db.get_mem_by_uid(from_user)
-                formatted_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
-                self.logger.debug(f"离线消息：{formatted_time} {sender_name}: {content}")
-                
-            elif msg_type == "image":
-                # 处理离线图片消息（需要解码base64数据）
-                image_data = base64.b64decode(content)
-                self.db.save_chat_message(from_user, to_user, image_data, timestamp, "image")
-                sender_name = self.db.get_mem_by_uid(from_user)
-                formatted_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
-                self.logger.debug(f"离线消息：{formatted_time} {sender_name}: [图片]")
-            
-            # 更新联系人列表（需要检查GUI是否已初始化）
-            if self.gui and self.gui.scrollable_frame is not None:
-                self.update_contacts()
-            else:
-                # GUI未完全初始化，延迟更新联系人列表
-                if self.gui and self.gui.root:
-                    self.gui.root.after(1, lambda: self.update_contacts())
-                    self.logger.debug("GUI未完全初始化，延迟更新联系人列表")
-
-        # ==================== 处理实时消息队列 ====================
-        while not net_module.message_queue.empty():
-            real_time_msg = net_module.message_queue.get_nowait()
-            # 提取消息载荷数据
-            payload = real_time_msg['payload']
-            self._handle_chat_message(
-                payload['from_user'], 
-                payload['send_time'], 
-                payload['message_type'], 
-                payload['message_content']
-            )
-            
-        # ==================== 处理服务器返回值队列 ====================
-        while not net_module.return_queue.empty():
-            return_msg = net_module.return_queue.get_nowait()
-            self._handle_server_response(return_msg)
+            message = Message.from_offline(offline_msg)
+            self.db.save_chat_message(message)
+            self.contacts.record_message(message.from_user, message)
+            self.logger.debug("离线消息", send_time=message.send_time,
+                              sender=log_setup.lazy(self.contacts.display_name, message.from_user),
+                              content=log_setup.lazy(message.preview), per_message=True)
+
+        # 联系人列表由联系人索引的观察者合并刷新，整批离线消息只刷新一次
+        tracing.stamp(tracing.current(), "db_commit")
 
     def validate_login(self, login_username: str, login_password: str) -> bool:
         """验证用户登录信息并处理记住密码功能。
@@ -265,19 +281,23 @@ class Client:
         Note:
             实际的登录验证结果会通过process_message方法中的login_result处理
         """
+        # 连接在后台建立，用户输入期间通常已经完成
+        if not self.net.wait_connected():
+            messagebox.showerror("连接失败", f"无法连接到服务器 {self.net.server_host}:{self.net.server_port}")
+            return False
+
         # 发送登录请求到服务器
         self.login(login_username, login_password)
         
         # 处理"记住密码"功能
         if self.login_ui_class and self.login_ui_class.remember_var.get():
-            stored_username = lib.read_xml("account/username")
-            stored_password = lib.read_xml("account/password")
-            
-            # 如果当前输入的用户名密码与存储的不同，则更新配置文件
-            if stored_username != login_username or stored_password != login_password:
-                lib.write_xml("account/username", login_username)
-                lib.write_xml("account/password", login_password)
-                lib.write_xml("account/uid", str(self.uid) if self.uid is not None else "")
+            # 如果当前输入的用户名密码与存储的不同，则在一次事务中更新配置文件
+            with lib.get_config().edit() as config:
+                if config.get("account/username") != login_username or config.get("account/password") != login_password:
+                    config.set("account/username", login_username)
+                    config.set("account/password", login_password)
+                    config.set("account/uid", str(self.uid) if self.uid is not None else "")
+            if config.changes:
                 self.logger.debug(
                     f"更新保存的登录信息 - 用户名:{login_username}, 密码:{'*' * len(login_password)}, UID:{self.uid}")
         
@@ -291,7 +311,7 @@ class Client:
         
         Args:
             contact (Dict[str, Any]): 当前选中的联系人信息字典，包含id、name等字段
-            display_message (callable): 用于显示消息的回调函数，接收消息字典作为参数
+            display_message (callable): 用于显示消息的回调函数，接收消息和是否为自己发送的消息两个参数
             
         Returns:
             :return None
@@ -315,82 +335,19 @@ class Client:
             # 正常情况：查看与其他联系人的聊天记录
             messages = self.db.get_chat_history(contact_id)
 
-        # 遍历消息历史记录并显示
-        for msg in messages:
-            # 消息格式: (id, from_user, to_user, message_type, content, timestamp)
-            msg_id, from_user, to_user, msg_type, content, timestamp = msg
-            
-            # 调试日志：根据消息长度决定是否完整显示
-            if len(str(msg)) < 250:
-                self.logger.debug(f"加载历史消息: {msg}")
-            else:
-                self.logger.debug(f"加载历史消息 (内容过长，仅显示长度): {len(str(msg))} 字符")
-            
-            # 格式化消息时间
-            formatted_time = time.strftime("%H:%M", time.localtime(timestamp))
-            
-            # 根据发送者和接收者确定消息显示方式
-            if int(from_user) == int(self.uid):
-                # 当前用户发送的消息
-                message_data = {
-                    "content": content, 
-                    "time": formatted_time, 
-                    "status": "sent",
-                    "sender": "我", 
-                    "type": msg_type
-                }
-                display_message(message_data)
-                
-            elif int(to_user) == int(self.uid):
-                # 当前用户接收的消息
-                sender_name = self.db.get_mem_by_uid(from_user)
-                message_data = {
-                    "content": content, 
-                    "time": formatted_time, 
-                    "status": "received",
-                    "sender": sender_name, 
-                    "type": msg_type
-                }
-                display_message(message_data)
-                
-            else:
-                # 异常情况：消息不属于当前用户
-                self.logger.error(f"发现异常消息记录，消息ID: {msg_id}")
-                message_data = {
-                    "content": content, 
-                    "time": formatted_time, 
-                    "status": "sent",
-                    "type": msg_type
-                }
-                display_message(message_data)
-
-    def _handle_server_response(self, return_msg: Dict[str, Any]) -> None:
-        """处理服务器返回的响应消息。
-        
-        根据不同的响应类型，执行相应的处理逻辑，包括消息发送结果、
-        用户注册结果、登录结果、添加好友结果等。
-        
-        Args:
-            return_msg (Dict[str, Any]): 服务器返回的响应消息字典
-            
-        Returns:
-            :return None
-        """
-        response_type = return_msg.get('type')
-        payload = return_msg.get('payload', {})
-        
-        match response_type:
-            case 'send_message_result':
-                self._handle_send_message_result(payload)
-            case 'register_result':
-                self._handle_register_result(payload)
-            case 'login_result':
-                self._handle_login_result(payload)
-            case 'add_friend_result':
-                self._handle_add_friend_result(payload)
-            case _:
-                self.logger.warning(f"未知的服务器响应类型: {response_type}")
-    
+        # 遍历消息历史记录并显示，查询结果已经由row_factory构造为Message
+        uid = int(self.uid)
+        for message in messages:
+            # 调试日志：消息内容（可能是图片数据）只在真正输出时才截断并格式化
+            self.logger.debug("加载历史消息", message=log_setup.lazy(log_setup.truncate, message), per_message=True)
+
+            sent = message.from_user == uid
+            if not sent and message.to_user != uid:
+                # 异常情况：消息不属于当前用户，按发送的消息显示
+                self.logger.error(f"发现异常消息记录，消息ID: {message.id}")
+                sent = True
+            display_message(message, sent)
+
     def _handle_send_message_result(self, payload: Dict[str, Any]) -> None:
         """处理消息发送结果。"""
         if payload.get('success'):
@@ -403,22 +360,23 @@ class Client:
         if payload.get('success'):
             self.logger.info("用户注册成功")
             # 保存注册成功的用户信息到配置文件
-            lib.write_xml("account/username", payload['username'])
-            lib.write_xml("account/password", payload['password'])
-            lib.write_xml("account/uid", payload['uid'])
+            with lib.get_config().edit() as config:
+                config.set("account/username", payload['username'])
+                config.set("account/password", payload['password'])
+                config.set("account/uid", payload['uid'])
             self.logger.debug(
                 f"保存用户信息到配置文件 - 用户名:{payload['username']}, 密码:{payload['password']}, UID:{payload['uid']}")
             
             # 显示注册成功提示
-            messagebox.showinfo("注册成功",
-                                f"恭喜您，注册成功！\n您的用户ID是: {payload['uid']}\n请重新启动应用程序进行登录！")
+            self._show_message("info", "注册成功",
+                               f"恭喜您，注册成功！\n您的用户ID是: {payload['uid']}\n请重新启动应用程序进行登录！")
             
             # 延迟关闭注册窗口
             if self.register_class and self.register_class.root:
                 self.register_class.root.after(3000, self.register_class.root.destroy)
         else:
             self.logger.error("用户注册失败")
-            messagebox.showerror("注册失败", "注册失败，请检查用户名是否已被使用")
+            self._show_message("error", "注册失败", "注册失败，请检查用户名是否已被使用")
     
     def _handle_login_result(self, payload: Dict[str, Any]) -> None:
         """处理用户登录结果。"""
@@ -426,8 +384,14 @@ class Client:
             self.logger.info("用户登录成功")
             # 保存登录成功后的用户信息
             self.msg_uid = payload['uid']
+            # 登录后立即到达的推送和离线消息在主界面创建前处理，需要已经知道当前用户ID
+            self.config_uid, self.uid = self.uid, self.msg_uid
             self.net.token = payload['token']
             self.logged_in = True
+            self.login_done.set()
+            # 登录成功后立即拉取离线消息，与主界面的创建同时进行
+            if self.startup_graph is not None:
+                self.startup_graph.complete("login", self.msg_uid)
             
             # 通知登录界面登录成功，准备关闭登录窗口
             if self.login_ui_class and self.login_ui_class.root:
@@ -436,40 +400,39 @@ class Client:
         else:
             self.logger.error("用户登录失败")
             self.logged_in = False
-            tk.messagebox.showerror("登录失败", "用户名或密码错误，请重试")
+            self.login_done.set()
+            self._show_message("error", "登录失败", "用户名或密码错误，请重试")
     
     def _handle_add_friend_result(self, payload: Dict[str, Any]) -> None:
         """处理添加好友结果。"""
         if payload.get('success'):
             self.logger.info("添加好友成功")
-            # 将新好友信息保存到本地数据库
-            self.db.save_contact(
-                payload['friend_uid'], 
-                payload['friend_username'],
-                payload['friend_name'], 
-                ""  # 备注信息暂时为空
-            )
-            messagebox.showinfo("添加好友成功", f"成功添加好友: {payload['friend_name']}")
-            # 更新联系人列表显示
-            if self.gui and self.gui.root:
-                self.gui.root.after(0, lambda: self.update_contacts())
+            # 将新好友信息保存到本地数据库和联系人索引（备注信息暂时为空）
+            self.save_contact(payload['friend_uid'], payload['friend_username'], payload['friend_name'], "")
+            self._show_message("info", "添加好友成功", f"成功添加好友: {payload['friend_name']}")
         else:
             self.logger.error("添加好友失败")
-            messagebox.showerror("添加好友失败", "添加好友失败，请检查好友ID或验证口令")
+            self._show_message("error", "添加好友失败", "添加好友失败，请检查好友ID或验证口令")
 
     def welcome_back(self) -> None:
-        """处理欢迎回来消息。
+        """等待服务器的欢迎回来消息，收到后在主线程中显示提示。
 
         Returns:
             :return None
         """
-        while self.net.welcome_back_queue.empty():
-            pass
-        welcome_back_msg = self.net.welcome_back_queue.get_nowait()
-        if self.gui:
-            self.gui.show_toast(welcome_back_msg['payload']['message'], position="top-right", toast_type="success")
+        def on_welcome_back(future: Future) -> None:
+            """在接收线程中调用，把提示交回主线程显示。"""
+            if future.exception() is not None:
+                self.logger.debug(f"未收到欢迎回来消息: {future.exception()}")
+                return
+            message = future.result()['payload']['message']
+            if self.gui and self.gui.root:
+                self.gui.root.after(0, lambda: self.gui.show_toast(message, position="top-right",
+                                                                   toast_type="success"))
 
-    def send_message(self, gui_class: GUI, contact: Dict[str, Any]) -> None:
+        self.net.wait_for("welcome_back").add_done_callback(on_welcome_back)
+
+    def send_message(self, gui_class: "GUI", contact: Dict[str, Any]) -> None:
         """发送文本消息。
         
         Args:
@@ -483,23 +446,45 @@ class Client:
         if not content:
             return
 
-        current_time = datetime.datetime.now().strftime("%H:%M")
-
-        message = {"content": content, "time": current_time, "status": "sent", "sender": "我", 'type': "text"}
-
-        # 添加到消息记录
-        self.net.send_packet("send_message", {"to_user": str(contact["id"]), "message": content, "type": "text"})
-        self.db.save_chat_message(self.uid, contact["id"], content, time.time())
+        # 发送并添加到消息记录
+        message = Message.outgoing(self.uid, contact["id"], "text", content)
+        self._send_text_message(message)
 
         # 显示消息
-        gui_class.display_message(message)
+        gui_class.display_message(message, True)
 
         # 清空输入框
         gui_class.text_input.delete("1.0", tk.END)
 
-        self.update_contacts()
+    def send_text(self, contact_id: Union[str, int], content: str) -> bool:
+        """发送文本消息并保存到本地数据库，不涉及界面。
 
-    def send_picture(self, gui_class: GUI, contact: Dict[str, Any]) -> None:
+        Args:
+            contact_id (Union[str, int]): 接收者的用户ID
+            content (str): 消息内容
+
+        Returns:
+            bool: 成功放入发送队列返回True
+        """
+        return self._send_text_message(Message.outgoing(self.uid, contact_id, "text", content))
+
+    def _send_text_message(self, message: Message) -> bool:
+        """把文本消息放入发送队列并保存到本地数据库。
+
+        Args:
+            message (Message): 当前用户发出的文本消息
+
+        Returns:
+            bool: 成功放入发送队列返回True
+        """
+        sent = self.net.send_packet("send_message",
+                                    {"to_user": str(message.to_user), "message": message.content, "type": "text"},
+                                    trace=tracing.begin("send:send_message"))
+        self.db.save_chat_message(message)
+        self.contacts.record_message(message.to_user, message)
+        return sent
+
+    def send_picture(self, gui_class: "GUI", contact: Dict[str, Any]) -> None:
         """发送图片消息。
         
         Args:
@@ -509,7 +494,6 @@ class Client:
         Returns:
             :return None
         """
-        current_time = datetime.datetime.now().strftime("%H:%M")
         image_path = tkinter.filedialog.askopenfilename(filetypes=[("PNG Files", "*.png"), ("GIF Files", "*.gif")])
         if image_path:
             if os.path.getsize(image_path) > 1024 * 1024 * 2:
@@ -521,7 +505,7 @@ class Client:
             if not image_data:
                 tk.messagebox.showerror("错误", "请选择带有内容的图片")
                 return
-            message = {"content": image_data, "time": current_time, "status": "sent", "sender": "我", 'type': "image"}
+            message = Message.outgoing(self.uid, contact["id"], "image", image_data)
 
             def _send_picture():
                 # 添加到消息记录
@@ -532,19 +516,18 @@ class Client:
                                                           "utf-8")})  # Base64编码图片数据
                 self.logger.debug("图片数据发送完成")
                 self.gui.show_toast("图片发送成功")
-                self.db.save_chat_message(self.uid, contact["id"], image_data, time.time(), "image")
+                self.db.save_chat_message(message)
+                self.contacts.record_message(message.to_user, message)
 
                 # 显示消息
-                gui_class.display_message(message)
-
-                self.update_contacts()
+                gui_class.display_message(message, True)
 
             threading.Thread(target=_send_picture).start()
 
     def process_message_thread(self) -> None:
         """消息处理线程主循环。
         
-        持续监听网络模块的各种消息队列，当有消息时调用process_message方法处理。
+        等待网络模块的消息到达通知，被唤醒后调用process_message方法处理各个消息队列。
         该方法运行在独立的后台线程中，确保消息处理不会阻塞主界面。
 
         Returns:
@@ -554,12 +537,9 @@ class Client:
             该方法会无限循环运行，直到程序退出
         """
         while True:
-            if (not self.net.message_queue.empty() or 
-                not self.net.return_queue.empty() or 
-                not self.net.offline_message_queue.empty()):
-                self.process_message(self.net)
-            else:
-                time.sleep(0.01)
+            self.net.handlers.wait()
+            profiling.checkpoint()
+            self.process_message(self.net)
 
     def login(self, login_username: str, login_password: str) -> None:
         """向服务器发送用户登录请求。
@@ -585,132 +565,69 @@ class Client:
         self.password = login_password
 
     def update_contacts(self) -> None:
-        """更新联系人列表。
+        """重新加载整个联系人列表。
         
-        从数据库获取联系人信息和最后一条消息，格式化后更新到GUI界面。
+        从联系人索引取得按最后活动时间排列的联系人，更新到GUI界面，不查询数据库。
 
         Returns:
             :return None
         """
-        contacts = []
-        contact_list = self.db.get_contact_list()
-        
-        for contact in contact_list:
-            contact_info = self._build_contact_info(contact)
-            if contact_info:
-                contacts.append(contact_info)
-        
-        # 更新GUI中的联系人列表
-        self.gui.contacts = contacts
+        self.gui.contacts = self.contacts.views()
         self.gui.load_contacts()
-    
-    def _build_contact_info(self, contact: tuple) -> Optional[Dict[str, Any]]:
-        """构建单个联系人的信息字典。
-        
+
+    def _on_contacts_changed(self, event: str, contact: Optional[contact_manager.Contact]) -> None:
+        """联系人索引的观察者：记录变化并安排主线程更新联系人列表。
+
+        可能在消息处理线程中被调用，更新通过root.after交给主线程；
+        更新执行前的多次变化合并处理。新消息（MOVED）只移动对应的联系人，其他变化重新加载整个列表。
+        主界面创建前不需要更新。
+
         Args:
-            contact (tuple): 联系人数据元组，格式为(nickname, uid, username, ...)
-            
-        Returns:
-            Optional[Dict[str, Any]]: 格式化的联系人信息字典，如果无法构建则返回None
+            event (str): 变化事件
+            contact (Optional[contact_manager.Contact]): 变化的联系人，重新加载时为None
         """
-        try:
-            # 安全地解包联系人数据
-            if len(contact) < 3:
-                self.logger.warning(f"联系人数据格式不完整: {contact}")
-                return None
-                
-            nickname, contact_id, username = contact[0], contact[1], contact[2]
-            
-            # 验证联系人ID的有效性
-            if not contact_id or not str(contact_id).isdigit():
-                self.logger.warning(f"无效的联系人ID: {contact_id}")
-                return None
-            
-            # 获取与该联系人的最后一条消息
-            last_message = self.db.get_last_chat_message(self.uid, contact_id)
-            if not last_message:
-                self.logger.debug(f"联系人 {contact_id} 没有聊天记录")
-                return None
-                
-            self.logger.debug(f"更新联系人信息: {contact}, 最后消息: {last_message}")
-            
-            # 确定显示名称
-            display_name = self._get_contact_display_name(nickname, username)
-            
-            # 格式化最后一条消息
-            last_msg_text, formatted_time = self._format_last_message(last_message)
-            
-            return {
-                "name": display_name,
-                "id": contact_id,
-                "avatar": "👨",
-                "last_msg": last_msg_text,
-                "time": formatted_time
-            }
-            
-        except Exception as e:
-            self.logger.error(f"构建联系人信息时发生错误: {e}, 联系人数据: {contact}")
-            return None
+        if self.gui is None or getattr(self.gui, "root", None) is None:
+            return
+        with self._contacts_lock:
+            if event == contact_manager.MOVED:
+                self._moved_contacts[contact.id] = contact
+            else:
+                self._contacts_reload_pending = True
+            if self._contacts_refresh_pending:
+                return
+            self._contacts_refresh_pending = True
+        self.gui.root.after(0, self._apply_contact_changes)
+
+    def _apply_contact_changes(self) -> None:
+        """在主线程中应用积累的联系人变化。
+
+        GUI按每个联系人的activity把它放到对应位置，各联系人的移动顺序不影响最终的顺序。
 
-    @staticmethod
-    def _get_contact_display_name(nickname: str, username: str) -> str:
-        """获取联系人的显示名称。
-        
-        Args:
-            nickname (str): 联系人昵称
-            username (str): 联系人用户名
-            
         Returns:
-            str: 用于显示的联系人名称
+            :return None
         """
-        if nickname:
-            return nickname
-        elif username:
-            return username
-        else:
-            return "未知用户"
-    
-    def _format_last_message(self, last_message: tuple) -> tuple[str, str]:
-        """格式化最后一条消息的显示内容和时间。
-        
+        with self._contacts_lock:
+            reload, moved = self._contacts_reload_pending, self._moved_contacts
+            self._contacts_reload_pending, self._moved_contacts = False, {}
+            self._contacts_refresh_pending = False
+        if reload:
+            self.update_contacts()
+            return
+        for contact in moved.values():
+            self.gui.move_contact(contact.view())
+
+    def save_contact(self, uid: Union[str, int], username: str, name: str, mem: str = "") -> None:
+        """保存联系人到数据库并加入联系人索引。
+
         Args:
-            last_message (tuple): 最后一条消息的数据元组
-            
-        Returns:
-            tuple[str, str]: (消息显示文本, 格式化时间)
+            uid (Union[str, int]): 联系人ID
+            username (str): 用户名
+            name (str): 昵称
+            mem (str): 备注
         """
-        try:
-            # 验证消息数据的完整性
-            if len(last_message) < 6:
-                self.logger.warning(f"消息数据格式不完整: {last_message}")
-                return "[数据错误]", "--:--"
-            
-            msg_type, content, timestamp = last_message[3], last_message[4], last_message[5]
-            
-            # 安全地格式化时间戳
-            try:
-                if isinstance(timestamp, (int, float)) and timestamp > 0:
-                    formatted_time = time.strftime("%H:%M", time.localtime(timestamp))
-                else:
-                    formatted_time = "--:--"
-            except (ValueError, OSError) as e:
-                self.logger.warning(f"时间戳格式化失败: {timestamp}, 错误: {e}")
-                formatted_time = "--:--"
-            
-            # 根据消息类型返回相应的显示文本
-            if msg_type == "text":
-                # 限制文本消息的显示长度
-                display_content = str(content)[:50] + "..." if len(str(content)) > 50 else str(content)
-                return display_content, formatted_time
-            elif msg_type == "image":
-                return "[图片]", formatted_time
-            else:
-                return "[未知消息类型]", formatted_time
-                
-        except Exception as e:
-            self.logger.error(f"格式化消息时发生错误: {e}, 消息数据: {last_message}")
-            return "[格式化错误]", "--:--"
-    
+        self.db.save_contact(uid, username, name, mem)
+        self.contacts.add_contact(contact_manager.Contact(int(uid), username, name, mem))
+
     def _load_user_config(self) -> None:
         """从配置文件加载用户信息。
         
@@ -751,12 +668,12 @@ class Client:
         """
         try:
             # 启动网络数据接收线程
-            self.receive_thread = threading.Thread(target=self.net.receive_packet, daemon=True)
+            self.receive_thread = threading.Thread(target=self.net.receive_packet, name="receive", daemon=True)
             self.receive_thread.start()
             self.logger.debug("网络接收线程已启动")
             
             # 启动消息处理线程
-            self.message_thread = threading.Thread(target=self.process_message_thread, daemon=True)
+            self.message_thread = threading.Thread(target=self.process_message_thread, name="messages", daemon=True)
             self.message_thread.start()
             self.logger.debug("消息处理线程已启动")
             
@@ -789,10 +706,22 @@ class Client:
         # 保存引用并启动界面
         self.login_root = login_window
         self.login_ui_class = login_interface
-        
+
+        login_window.after_idle(self._on_login_visible)
         login_window.mainloop()
         return self.logged_in
     
+    def _on_login_visible(self) -> None:
+        """登录窗口完成首次绘制后记录启动耗时。"""
+        visible_ms = startup.mark(startup.TARGET_PHASE)
+        if visible_ms > startup.TARGET_MS:
+            self.logger.warning(f"登录窗口显示耗时{visible_ms:.1f}ms，超过目标{startup.TARGET_MS:.0f}ms")
+        else:
+            self.logger.debug(f"登录窗口显示耗时{visible_ms:.1f}ms")
+        if startup.report_enabled():
+            startup.uninstall_import_timer()
+            print(startup.format_report(), file=sys.stderr)
+
     def _initialize_main_interface(self) -> None:
         """初始化主界面和相关组件。
         
@@ -803,13 +732,13 @@ class Client:
             Exception: 如果初始化过程中发生关键错误
         """
         try:
-            # 连接数据库
-            database_file = lib.read_xml("database/file", "data/") or "data/client.sqlite"
-            self.logger.info(f"正在连接数据库: {database_file}")
-            
-            self.db.connect(database_file)
-            self.db.create_tables_if_not_exists()
+            # 数据库连接、建表和补写未保存的消息在登录期间已经于后台开始，这里只等待其完成
+            if self.startup_graph is None:
+                self._start_startup_graph()
+            self.startup_graph.result("write_behind")
             self.logger.debug("数据库连接和表创建完成")
+            # 联系人是按登录前配置文件中的UID预取的
+            prefetch_uid = self.config_uid
             
             # 检查数据库UID一致性
             self.check_database_uid()
@@ -819,40 +748,80 @@ class Client:
                 self.db.insert_metadata("uid", str(self.uid) if self.uid else "")
                 self.logger.debug("用户元数据初始化完成")
             
-            # 构建联系人列表并创建主界面
-            contacts = self._build_initial_contacts_list()
+            # 使用预取的联系人列表；登录后UID发生变化时重新构建
+            if str(prefetch_uid) == str(self.uid):
+                contacts = self.startup_graph.result("contacts")
+            else:
+                self.logger.debug("登录UID与配置文件不一致，重新构建联系人列表")
+                contacts = self._build_initial_contacts_list(self.uid)
+            startup.mark("数据准备完成")
             self._create_main_gui(contacts)
             
         except Exception as e:
             self.logger.error(f"初始化主界面时发生错误: {e}")
-            tk.messagebox.showerror("初始化错误", f"程序初始化失败: {str(e)}")
+            self._show_message("error", "初始化错误", f"程序初始化失败: {str(e)}")
             raise
     
-    def _build_initial_contacts_list(self) -> List[Dict[str, Any]]:
-        """构建初始的联系人列表。
+    def _start_startup_graph(self) -> None:
+        """启动并发的启动步骤依赖图。
+
+        步骤之间的依赖关系：
+            db_connect -> migrations -> write_behind -> contacts
+            login + write_behind -> offline_messages
+        其中login是外部里程碑，在收到登录成功结果时标记完成。
+        数据库准备和联系人预取与登录请求的往返同时进行。
+
+        Returns:
+            :return None
+        """
+        database_file = self.database_file or lib.read_xml("database/file", "data/") or "data/client.sqlite"
+        prefetch_uid = self.uid
+
+        def connect_database() -> None:
+            self.logger.info(f"正在连接数据库: {database_file}")
+            self.db.connect(database_file)
+            if self.db.conn is None:
+                raise RuntimeError(f"无法连接数据库: {database_file}")
+
+        def start_write_behind() -> None:
+            # 先补写上次异常退出时留在日志中的消息，再改为延迟写入
+            write_behind = persister.WriteBehindPersister(self.db, database_file + persister.JOURNAL_SUFFIX)
+            try:
+                write_behind.start()
+            except (OSError, RuntimeError) as e:
+                self.logger.error(f"无法启用消息延迟写入，改为逐条写入: {e}")
+                return
+            self.db.write_behind = write_behind
+
+        graph = startup.StartupGraph()
+        graph.add("db_connect", connect_database)
+        graph.add("migrations", self.db.create_tables_if_not_exists, deps=("db_connect",))
+        graph.add("write_behind", start_write_behind, deps=("migrations",))
+        graph.add("contacts", lambda: self._build_initial_contacts_list(prefetch_uid), deps=("write_behind",))
+        graph.add("login")
+        graph.add("offline_messages", lambda: self.net.send_packet("get_offline_messages", {"request_id": "1"}),
+                  deps=("login", "write_behind"))
+        self.startup_graph = graph
+
+    def _build_initial_contacts_list(self, uid: Optional[Union[str, int]]) -> List[Dict[str, Any]]:
+        """从数据库加载联系人索引，并构建初始的联系人列表。
         
-        从数据库中获取所有联系人信息，并构建用于界面显示的联系人列表。
+        联系人表和每个联系人的最后一条消息各用一次查询读取，之后联系人索引在内存中维护。
+
+        Args:
+            uid (Optional[Union[str, int]]): 当前用户ID
         
         Returns:
             List[Dict[str, Any]]: 格式化的联系人列表
         """
-        contacts = []
         try:
-            contact_list = self.db.get_contact_list()
-            self.logger.debug(f"从数据库获取到 {len(contact_list)} 个联系人")
-            
-            for contact in contact_list:
-                contact_info = self._build_contact_info(contact)
-                if contact_info:
-                    contacts.append(contact_info)
-                    
-            self.logger.info(f"成功构建 {len(contacts)} 个有效联系人")
-            
+            self.contacts.load(self.db.get_contact_list() or [], self.db.get_contact_summaries(uid))
+            self.logger.info(f"成功加载 {len(self.contacts)} 个联系人")
         except Exception as e:
             self.logger.error(f"构建联系人列表时发生错误: {e}")
             # 返回空列表，让程序继续运行
-            
-        return contacts
+            return []
+        return self.contacts.views()
     
     def _create_main_gui(self, contact_list: List[Dict[str, Any]]) -> None:
         """创建主界面GUI。
@@ -860,6 +829,12 @@ class Client:
         Args:
             contact_list (List[Dict[str, Any]]): 联系人列表
         """
+        if self.headless:
+            self._create_headless_gui(contact_list)
+            return
+
+        from ui import GUI
+
         main_window = tk.Tk()
         main_interface = GUI(
             main_window,
@@ -871,14 +846,13 @@ class Client:
             contact_list
         )
         main_interface.set_add_friend_handler(self.handle_add_friend)
+        main_interface.set_debug_panel_handler(self.open_debug_panel)
+        main_interface.set_profile_handler(self.toggle_profiling)
         
         # 保存引用
         self.root = main_window
         self.gui = main_interface
         
-        # 获取离线消息
-        self.net.send_packet("get_offline_messages", {"request_id": "1"})
-        
         # 创建并设置用户名显示标签
         username_label = tk.Label(
             main_interface.user_frame, 
@@ -894,10 +868,71 @@ class Client:
         main_interface.setup_bindings()
         main_interface.load_contacts()
         
+        # 看门狗记录主界面的每一次卡顿及其阻塞位置
+        self.watchdog = ui_watchdog.TkWatchdog(main_window)
+        self.watchdog.start()
+
+        # 配置文件中开启了剖析时从主界面出现开始剖析
+        self.profiler = profiling.ProfilingController(main_window)
+        profile_mode = lib.get_config().get("debug/profile", "off") or "off"
+        if profile_mode != "off":
+            try:
+                self.profiler.start(profile_mode)
+            except ValueError as e:
+                self.logger.warning(f"配置文件中的剖析方式无效: {e}")
+
+        # 关闭主窗口时与Ctrl+C一样走exit_program，写完延迟写入的消息、剖析结果和最后的指标
+        main_window.protocol("WM_DELETE_WINDOW", self.exit_program)
+
         # 延迟显示欢迎消息并启动主循环
+        main_window.after_idle(self._on_main_visible)
+        main_window.after_idle(self._refresh_connection_status)
         main_window.after(100, self.welcome_back)
         main_window.mainloop()
 
+    def _create_headless_gui(self, contact_list: List[Dict[str, Any]]) -> None:
+        """无界面模式下以RecordingUI代替主界面。
+
+        Args:
+            contact_list (List[Dict[str, Any]]): 联系人列表
+        """
+        import headless
+
+        if self.gui is None:
+            self.gui = headless.RecordingUI()
+        self.gui.contacts = contact_list
+        self.gui.load_contacts()
+        self._on_main_visible()
+        self.welcome_back()
+
+    def _refresh_connection_status(self) -> None:
+        """每秒刷新一次主界面中的连接状态（往返时延和抖动）。
+
+        Returns:
+            :return None
+        """
+        if not self.gui or not self.root:
+            return
+        status = self.net.keepalive.status()
+        if not status.alive:
+            self.gui.set_connection_status("连接已断开", 'danger')
+        elif status.rtt is None:
+            self.gui.set_connection_status("已连接", 'success')
+        else:
+            # 时延偏高或空闲过久时用警告色提示
+            level = 'warning' if status.rtt > 0.3 or status.idle > keepalive.PROBE_INTERVAL else 'success'
+            self.gui.set_connection_status(f"{status.rtt * 1000:.0f}ms\n±{status.jitter * 1000:.0f}ms", level)
+        try:
+            self.root.after(1000, self._refresh_connection_status)
+        except tk.TclError:
+            pass
+
+    def _on_main_visible(self) -> None:
+        """主界面完成首次绘制后输出各启动步骤的耗时。"""
+        startup.mark("主界面可见")
+        if self.startup_graph is not None:
+            self.logger.debug(self.startup_graph.format_timings())
+
     def register_user_handler(self) -> None:
         """处理用户注册请求。
 
@@ -934,6 +969,8 @@ class Client:
         self.logger.debug("开始注册")
         self.login_ui_class.root.after(0, lambda: self.login_ui_class.root.destroy())
         self.register_root = tk.Tk()
+        from reg_ui import RegisterUI
+
         self.register_class = RegisterUI(self.register_root)
         self.register_class.register_user_handler = lambda: self.register_user_handler()
         self.register_class.create_action_buttons(self.register_class.scrollable_frame)
@@ -953,14 +990,14 @@ class Client:
         """
         try:
             friend_uid = int(friend_id)
-            if self.db.check_is_friend(friend_uid):
+            if self.contacts.is_friend(friend_uid):
                 tk.messagebox.showwarning("提示", f"{friend_id} 已经是你的好友了")
                 return False
             self.net.send_packet("add_friend",
                                  {"friend_id_type": "uid", "friend_id": friend_uid, "verify_token": verify_token})
         except ValueError:
             friend_username = friend_id
-            if self.db.check_is_friend():
+            if self.contacts.is_friend(username=friend_username):
                 tk.messagebox.showwarning("提示", f"{friend_id} 已经是你的好友了")
                 return False
             self.net.send_packet("add_friend",
@@ -973,58 +1010,159 @@ class Client:
         Returns:
             :return None
         """
-        if self.uid != self.msg_uid:
+        if self.config_uid != self.msg_uid:
             self.uid = self.msg_uid
-            if lib.read_xml("account/username") == self.username and lib.read_xml("account/password") == self.password:
-                lib.write_xml("account/uid", self.uid)
+            with lib.get_config().edit() as config:
+                if config.get("account/username") == self.username and config.get("account/password") == self.password:
+                    config.set("account/uid", self.uid)
             stored_uid = self.db.get_metadata("uid")
             if stored_uid is None:
                 self.db.insert_metadata("uid", str(self.uid) if self.uid is not None else "")
             elif stored_uid and self.msg_uid and int(stored_uid) != int(self.msg_uid):
-                tk.messagebox.showwarning("警告",
-                                          f"数据库中保存的uid与当前登录的uid不一致，这可能不是你的数据库！\n数据库中的uid为{self.db.get_metadata('uid')}\n您登录的uid为{self.msg_uid}\n为保证数据库安全，即将退出程序！")
+                self._show_message("warning", "警告",
+                                   f"数据库中保存的uid与当前登录的uid不一致，这可能不是你的数据库！\n数据库中的uid为{self.db.get_metadata('uid')}\n您登录的uid为{self.msg_uid}\n为保证数据库安全，即将退出程序！")
                 self.exit_program()
                 return
 
+    def open_debug_panel(self) -> None:
+        """打开调试面板，显示各消息类型的处理次数和耗时。
+
+        Returns:
+            :return None
+        """
+        import debug_ui
+
+        debug_ui.HandlerStatsWindow(self.root, self.net.handlers)
+
+    def toggle_profiling(self) -> None:
+        """开始或停止性能剖析（主界面中按Ctrl+Shift+P）。
+
+        剖析方式取配置文件中的debug/profile，未开启时使用采样剖析。
+
+        Returns:
+            :return None
+        """
+        if self.profiler is None:
+            return
+        mode = lib.get_config().get("debug/profile", "off") or "off"
+        paths = self.profiler.toggle("sampling" if mode == "off" else mode)
+        if self.profiler.running:
+            self.gui.show_toast(f"开始性能剖析（{self.profiler.mode}），再次按Ctrl+Shift+P停止")
+        else:
+            self.gui.show_toast(f"剖析结果已保存到{os.path.dirname(paths[0])}" if paths else "性能剖析已停止")
+
     def open_settings(self) -> None:
         """打开设置对话框。
 
+        先向服务器请求好友口令，收到响应（或超时）后再在主线程中显示对话框，
+        等待期间界面保持响应。
+
+        Returns:
+            :return None
+        """
+        if self._settings_pending:
+            return
+        self._settings_pending = True
+        future = self.net.request("get_friend_token", {}, expect="friend_token_result")
+        future.add_done_callback(lambda f: self.root.after(0, lambda: self._on_friend_token(f)))
+
+    def _on_friend_token(self, future: Future) -> None:
+        """收到好友口令后显示设置对话框（在主线程中执行）。
+
+        Args:
+            :param future: 好友口令请求的Future
+
+        Returns:
+            :return None
+        """
+        self._settings_pending = False
+        try:
+            friend_token = future.result()["payload"]["friend_token"]
+        except Exception as e:
+            # 获取失败时仍然打开设置，好友口令显示上一次的值
+            self.logger.warning(f"获取好友口令失败: {e}")
+        else:
+            for config in self.settings_config:
+                if config["name"] == "friend_token":
+                    config['default'] = friend_token
+        self._show_settings_dialog()
+
+    def _show_settings_dialog(self) -> None:
+        """显示设置对话框并保存修改。
+
         Returns:
             :return None
         """
-        for config in self.settings_config:
-            if config["name"] == "friend_token":
-                # 获取好友口令
-                self.net.send_packet("get_friend_token", {})
-                while self.net.friend_token_queue.empty():
-                    time.sleep(0.01)
-                friend_token_msg = self.net.friend_token_queue.get_nowait()
-                friend_token = friend_token_msg["payload"]["friend_token"]
-                # 获取到好友口令之后
-                self.settings_config[self.settings_config.index(config)]['default'] = friend_token
         cancel_flag: bool = False
+        from settings_ui import SettingsDialog
+
         dialog = SettingsDialog(self.root, self.settings_config, cancel_flag)
         self.root.wait_window(dialog)  # 等待对话框关闭
         self.logger.debug("最终设置:" + str(dialog.get_settings()))
         if dialog.cancel_flag:
             self.logger.debug("取消设置")
             return
-        for key, value in dialog.get_settings().items():
-            self.logger.debug(f"{key}: {value}")
-            match key:
-                case "server":
-                    lib.write_xml("server/ip", value)
-                case "port":
-                    lib.write_xml("server/port", value)
-                case "friend_token":
-                    self.net.send_packet("change_friend_token", {"new_friend_token": value})
+        # 服务器地址和端口在一次事务中写入，订阅者（网络模块）在写入完成后收到通知
+        new_friend_token: Optional[str] = None
+        with lib.get_config().edit() as config:
+            for key, value in dialog.get_settings().items():
+                self.logger.debug(f"{key}: {value}")
+                match key:
+                    case "server":
+                        config.set("server/ip", value)
+                    case "port":
+                        config.set("server/port", value)
+                    case "friend_token":
+                        new_friend_token = value
+        # 发送可能需要等待连接建立，放在配置事务之外
+        if new_friend_token is not None:
+            self.net.send_packet("change_friend_token", {"new_friend_token": new_friend_token})
+
+    def run_headless(self, username: str, password: str, gui: Optional[Any] = None,
+                     timeout: Optional[float] = networking.REQUEST_TIMEOUT) -> bool:
+        """以无界面模式启动客户端：连接、登录并初始化数据，不创建任何Tk窗口。
+
+        与main的流程相同，只是用户信息由参数给出，界面由gui（默认为headless.RecordingUI）代替。
+        返回后客户端在后台线程中继续收发消息。
+
+        Args:
+            username (str): 用户名
+            password (str): 密码
+            gui (Optional[Any]): 代替主界面的适配器，为None时使用headless.RecordingUI
+            timeout (Optional[float]): 等待登录结果的最长时间（秒）
+
+        Returns:
+            bool: 登录并初始化成功返回True
+        """
+        import headless
+
+        self.headless = True
+        # 登录前就设置好界面适配器，登录后立即到达的消息也能正常处理
+        self.gui = gui if gui is not None else headless.RecordingUI()
+        self.username = username
+        self.password = password
+
+        self.net.connect_async()
+        self._start_network_threads()
+        self._start_startup_graph()
+
+        if not self.net.wait_connected():
+            self.logger.error(f"无法连接到服务器 {self.net.server_host}:{self.net.server_port}")
+            return False
+        self.login(username, password)
+        if not self.login_done.wait(timeout) or not self.logged_in:
+            self.logger.error(f"用户{username}登录失败")
+            return False
+
+        self._initialize_main_interface()
+        return True
 
     def main(self) -> None:
         """客户端主程序入口。
         
         执行客户端的完整启动流程，包括：
         1. 加载用户配置信息
-        2. 启动网络通信线程
+        2. 启动网络通信线程，并在后台连接数据库、预取联系人
         3. 显示登录界面
         4. 登录成功后初始化主界面
         5. 加载联系人和聊天记录
@@ -1069,14 +1207,21 @@ class Client:
                     """
         # ==================== 第一步：加载用户配置信息 ====================
         self._load_user_config()
+        startup.mark("加载用户配置")
         
         # 调试模式下允许手动输入用户信息
         if self.is_debug():
             self._handle_debug_mode_input()
 
         # ==================== 第二步：启动网络通信线程 ====================
+        # 连接在后台建立，不阻塞登录界面的显示
         self.logger.info("正在启动WritePapers客户端...")
+        self.metrics_reporter.start()
+        self.net.connect_async()
         self._start_network_threads()
+        # 数据库准备和联系人预取与登录同时进行
+        self._start_startup_graph()
+        startup.mark("启动网络线程")
         
         # ==================== 第三步：显示登录界面 ====================
         if not self._show_login_interface():
@@ -1088,6 +1233,9 @@ class Client:
 
     def exit_program(self, status: int = 0) -> None:
         """退出程序并清理资源。
+
+        关闭主窗口、Ctrl+C和异常退出都经过这里：先在窗口销毁前停止剖析和看门狗并输出报告，
+        再写出最后的运行指标，最后关闭数据库（写完延迟写入的消息）和网络连接。
         
         Args:
             :param status: 退出状态码
@@ -1095,17 +1243,27 @@ class Client:
         Returns:
             :return None
         """
-        try:
-            if self.login_root is not None:
-                self.login_root.destroy()
-            if self.register_root is not None:
-                self.register_root.destroy()
-            if self.root is not None:
-                self.root.destroy()
-        except _tkinter.TclError:
-            pass
+        if self.profiler is not None and self.profiler.running:
+            self.profiler.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            if self.watchdog.stats():
+                self.logger.info("界面卡顿统计:\n" + self.watchdog.report())
+        for window in (self.login_root, self.register_root, self.root):
+            # 登录窗口等可能已经销毁，逐个忽略错误
+            try:
+                if window is not None:
+                    window.destroy()
+            except _tkinter.TclError:
+                pass
+        self.metrics_reporter.stop()
+        metrics.registry.emit()
+        if self.startup_graph is not None:
+            self.startup_graph.shutdown()
         if self.db.conn is not None:
             self.db.close()
+        if self.net is not None:
+            self.net.stop_capture()
         if self.net is not None and hasattr(self.net, 'sock') and self.net.sock:
             try:
                 self.net.sock.shutdown(socket.SHUT_RD)
@@ -1116,7 +1274,10 @@ class Client:
 
 
 if __name__ == "__main__":
+    log_setup.configure()
+    startup.mark("导入模块")
     client = Client()
+    startup.mark("创建客户端")
     # global root
     try:
         if client.is_debug():
@@ -1126,6 +1287,7 @@ if __name__ == "__main__":
             elif result == "reg":
                 client.logger.info("正在启动客户端(test reg ver)...")
                 client.db.connect("data/client.sqlite")
+                client.net.connect_async()
 
                 receive_thread = threading.Thread(target=client.net.receive_packet, daemon=True)
                 receive_thread.start()
@@ -1144,3 +1306,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         client.logger.info("正在退出...")
         client.exit_program()
+    else:
+        # 登录窗口被关闭等情况下main()直接返回，同样需要清理
+        client.exit_program()
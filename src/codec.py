@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/29
+# @File    : codec.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端JSON编解码模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端JSON编解码模块。
+
+本模块为网络数据包提供可替换的JSON编解码器：安装了orjson时使用orjson，否则使用标准库json。
+编解码器直接输出和解析bytes，省去str与bytes之间的转换。
+只有orjson路径比旧实现快；标准库json的编解码方式与旧实现相同，只是保持接口一致的退路，
+加上外层拼接后与旧实现持平或略慢（见benchmarks/bench_codec.py）。
+
+EnvelopeEncoder把数据包外层中不变的部分（type和token）预先编码并缓存，
+每次发送只需要编码payload再拼接。
+"""
+
+import json
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson是可选依赖
+    orjson = None
+
+# 缓存的数据包前缀数量上限（type和token的组合）
+PREFIX_CACHE_SIZE = 256
+
+
+class JsonCodec:
+    """标准库json编解码器，与旧实现相同的json.dumps/json.loads调用，没有性能提升。"""
+
+    name = "json"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        """把对象编码为UTF-8的JSON字节串。
+
+        Args:
+            :param obj: 要编码的对象
+
+        Returns:
+            :return JSON字节串
+
+        Raises:
+            :raise TypeError: 对象不能序列化时抛出
+        """
+        return json.dumps(obj).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        """先按UTF-8解码为str，再用标准库json解析。
+
+        Args:
+            :param data: JSON字节串
+
+        Returns:
+            :return 解析结果
+
+        Raises:
+            :raise ValueError: 数据不是合法的UTF-8 JSON时抛出
+        """
+        return json.loads(data.decode("utf-8"))
+
+
+class OrjsonCodec:
+    """orjson编解码器，遇到orjson不支持的对象（如超过64位的整数）时退回标准库编码。"""
+
+    name = "orjson"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        """把对象编码为UTF-8的JSON字节串。
+
+        Args:
+            :param obj: 要编码的对象
+
+        Returns:
+            :return JSON字节串
+
+        Raises:
+            :raise TypeError: 对象不能序列化时抛出
+        """
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            return JsonCodec.dumps(obj)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        """直接从字节串解析JSON。
+
+        Args:
+            :param data: JSON字节串
+
+        Returns:
+            :return 解析结果
+
+        Raises:
+            :raise ValueError: 数据不是合法的UTF-8 JSON时抛出（orjson.JSONDecodeError是ValueError的子类）
+        """
+        return orjson.loads(data)
+
+
+CODECS = {JsonCodec.name: JsonCodec}
+if orjson is not None:
+    CODECS[OrjsonCodec.name] = OrjsonCodec
+
+
+def get_codec(name: Optional[str] = None):
+    """获取编解码器。
+
+    Args:
+        :param name: 编解码器名称（"orjson"或"json"），None表示使用已安装的最快实现
+
+    Returns:
+        :return 编解码器
+
+    Raises:
+        :raise ValueError: 指定的编解码器不可用时抛出
+    """
+    if name is None:
+        return OrjsonCodec if orjson is not None else JsonCodec
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"JSON编解码器{name}不可用，可用的编解码器: {', '.join(CODECS)}") from None
+
+
+class EnvelopeEncoder:
+    """数据包外层编码类。
+
+    输出与{"type": ..., "token": ..., "payload": ..., "request_id": ...}相同的JSON，
+    其中'{"type":...,"token":...,"payload":'这一段按(type, token)缓存。
+    """
+
+    def __init__(self, codec=None) -> None:
+        """初始化编码器。
+
+        Args:
+            :param codec: 编解码器，None表示使用get_codec()的结果
+
+        Returns:
+            :return 无返回值
+        """
+        self.codec = codec or get_codec()
+        self._prefixes: Dict[Tuple[str, Optional[str]], bytes] = {}
+
+    def prefix(self, message_type: str, token: Optional[str]) -> bytes:
+        """获取数据包前缀，首次使用时编码并缓存。
+
+        Args:
+            :param message_type: 消息类型
+            :param token: 认证令牌
+
+        Returns:
+            :return 前缀字节串
+        """
+        key = (message_type, token)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            dumps = self.codec.dumps
+            prefix = b'{"type":' + dumps(message_type) + b',"token":' + dumps(token) + b',"payload":'
+            if len(self._prefixes) >= PREFIX_CACHE_SIZE:
+                # token变化后旧前缀不会再用到，直接清空
+                self._prefixes.clear()
+            self._prefixes[key] = prefix
+        return prefix
+
+    def encode(self, message_type: str, token: Optional[str], payload: Any,
+               request_id: Optional[int] = None) -> bytes:
+        """编码一个完整的数据包（不含长度前缀）。
+
+        Args:
+            :param message_type: 消息类型
+            :param token: 认证令牌
+            :param payload: 消息载荷数据
+            :param request_id: 请求ID
+
+        Returns:
+            :return JSON字节串
+        """
+        body = self.prefix(message_type, token) + self.codec.dumps(payload)
+        if request_id is not None:
+            return body + b',"request_id":' + self.codec.dumps(request_id) + b"}"
+        return body + b"}"
+
+    def frame(self, message_type: str, token: Optional[str], payload: Any,
+              request_id: Optional[int] = None) -> bytes:
+        """编码一个带4字节大端长度前缀的完整帧。
+
+        Args:
+            :param message_type: 消息类型
+            :param token: 认证令牌
+            :param payload: 消息载荷数据
+            :param request_id: 请求ID
+
+        Returns:
+            :return 帧字节串
+        """
+        body = self.encode(message_type, token, payload, request_id)
+        return len(body).to_bytes(4, byteorder="big") + body
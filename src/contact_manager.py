@@ -7,75 +7,358 @@
 
 """WritePapers客户端联系人管理模块。
 
-本模块包含联系人管理的相关功能，包括联系人列表管理、好友添加删除等。
+ContactManager是联系人在内存中的权威索引：登录后从数据库加载一次（联系人表和每个联系人的最后一条消息），
+之后添加好友、收发消息都直接更新索引，刷新联系人列表和判断是否为好友不再查询SQLite。
+
+    按ID和用户名的字典索引，查找、添加、删除都是O(1)；
+    有聊天记录的联系人另外放在按recency_key排序的有序表中（最后一条消息的时间从新到旧），
+    新消息只把该联系人从有序表中取出再按新的时间插入，是O(log n)操作，不需要重新排序全部联系人；
+    subscribe()登记的观察者在联系人变化后被调用（在引起变化的线程中，不持有锁），
+    新消息触发MOVED事件，界面只需要移动这一个联系人。
+
+安装了sortedcontainers时有序表使用SortedKeyList，否则使用基于bisect的简单实现。
 """
 
-import tkinter as tk
-from tkinter import ttk
-from typing import Dict, List, Optional, Any
+import bisect
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+import structlog
 
-class ContactManager:
-    """联系人管理器类。
-    
-    负责管理客户端的联系人相关操作。
+from chat_message import Message
+
+try:
+    from sortedcontainers import SortedKeyList
+except ImportError:  # sortedcontainers是可选依赖
+    SortedKeyList = None
+
+logger = structlog.get_logger()
+
+# 变化事件
+ADDED = "added"
+MOVED = "moved"  # 收发了新消息，联系人在列表中的位置和最后一条消息变化
+REMOVED = "removed"
+RELOADED = "reloaded"
+
+DEFAULT_AVATAR = "👨"
+
+Observer = Callable[[str, Optional["Contact"]], None]
+
+
+class Contact:
+    """联系人类。"""
+
+    __slots__ = ("id", "username", "name", "mem", "last_message", "_view")
+
+    def __init__(self, contact_id: int, username: str = "", name: str = "", mem: str = "",
+                 last_message: Optional[Message] = None) -> None:
+        self.id = contact_id
+        self.username = username or ""
+        self.name = name or ""
+        self.mem = mem or ""
+        self.last_message = last_message
+        self._view: Optional[Dict[str, Any]] = None
+
+    @property
+    def display_name(self) -> str:
+        """显示名称：备注优先，其次昵称、用户名。"""
+        return self.mem or self.name or self.username or "未知用户"
+
+    @property
+    def last_activity(self) -> float:
+        """最后一条消息的时间，没有消息时为0。"""
+        return self.last_message.send_time if self.last_message is not None else 0.0
+
+    def view(self) -> Dict[str, Any]:
+        """联系人列表中显示用的字典，内容变化前重复调用返回同一个对象。"""
+        view = self._view
+        if view is None:
+            message = self.last_message
+            last_msg, time_text, activity = ("", "", 0.0) if message is None else \
+                (message.preview(), message.time_label(), message.send_time)
+            view = {"name": self.display_name, "id": self.id, "avatar": DEFAULT_AVATAR,
+                    "last_msg": last_msg, "time": time_text, "activity": activity}
+            self._view = view
+        return view
+
+    def __repr__(self) -> str:
+        return f"Contact(id={self.id}, name={self.display_name!r})"
+
+
+def recency_key(activity: float, contact_id: int) -> Tuple[float, int]:
+    """联系人列表的排序键：最后活动时间从新到旧，时间相同时按ID排列。
+
+    Args:
+        :param activity: 最后一条消息的时间
+        :param contact_id: 联系人ID
+
+    Returns:
+        :return 排序键
     """
-    
+    return -activity, contact_id
+
+
+def _contact_key(contact: Contact) -> Tuple[float, int]:
+    return recency_key(contact.last_activity, contact.id)
+
+
+class _BisectKeyList:
+    """没有安装sortedcontainers时使用的有序表，接口是SortedKeyList的子集。
+
+    查找位置是O(log n)，插入和删除需要移动列表元素，但只是一次内存移动。
+    """
+
+    def __init__(self, iterable: Iterable[Contact] = (), key: Callable[[Contact], Any] = _contact_key) -> None:
+        self._key = key
+        self._items = sorted(iterable, key=key)
+        self._keys = [key(item) for item in self._items]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Contact]:
+        return iter(self._items)
+
+    def __getitem__(self, index: int) -> Contact:
+        return self._items[index]
+
+    def add(self, item: Contact) -> None:
+        key = self._key(item)
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._items.insert(index, item)
+
+    def remove(self, item: Contact) -> None:
+        index = self.index(item)
+        del self._keys[index]
+        del self._items[index]
+
+    def index(self, item: Contact) -> int:
+        key = self._key(item)
+        index = bisect.bisect_left(self._keys, key)
+        while index < len(self._items) and self._keys[index] == key:
+            if self._items[index] is item:
+                return index
+            index += 1
+        raise ValueError(f"{item!r}不在有序表中")
+
+
+def _recency_list(contacts: Iterable[Contact] = ()) -> Union["SortedKeyList", _BisectKeyList]:
+    """创建按recency_key排序的联系人有序表。"""
+    if SortedKeyList is not None:
+        return SortedKeyList(contacts, key=_contact_key)
+    return _BisectKeyList(contacts, key=_contact_key)
+
+
+def _contact_id(value: Union[str, int]) -> Optional[int]:
+    """把联系人ID转换为整数，无效时返回None。"""
+    try:
+        contact_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return contact_id if contact_id > 0 else None
+
+
+class ContactManager:
+    """联系人管理器类，可以从任意线程使用。"""
+
     def __init__(self) -> None:
-        """初始化联系人管理器。
+        """初始化空的联系人索引。
+
+        Returns:
+            :return 无返回值
+        """
+        self._by_id: Dict[int, Contact] = {}
+        self._by_username: Dict[str, Contact] = {}
+        # 有聊天记录的联系人，按recency_key排序；其中联系人的last_message只能在取出后修改
+        self._recent = _recency_list()
+        self._observers: List[Observer] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, contact_id: Union[str, int]) -> bool:
+        return _contact_id(contact_id) in self._by_id
+
+    def __iter__(self) -> Iterator[Contact]:
+        with self._lock:
+            return iter(list(self._by_id.values()))
+
+    def subscribe(self, observer: Observer) -> None:
+        """登记观察者，联系人变化后以(事件, 联系人)调用，重新加载时联系人为None。
+
+        Args:
+            :param observer: 观察者
 
         Returns:
             :return 无返回值
         """
-        self.contacts: List[Dict[str, Any]] = []
-    
-    def add_contact(self, contact: Dict[str, Any]) -> bool:
+        with self._lock:
+            self._observers.append(observer)
+
+    def unsubscribe(self, observer: Observer) -> None:
+        """取消登记观察者。"""
+        with self._lock:
+            if observer in self._observers:
+                self._observers.remove(observer)
+
+    def _notify(self, event: str, contact: Optional[Contact]) -> None:
+        """通知观察者，单个观察者出错不影响其他观察者。"""
+        with self._lock:
+            observers = list(self._observers)
+        for observer in observers:
+            try:
+                observer(event, contact)
+            except Exception as e:
+                logger.error(f"联系人观察者处理{event}事件失败: {e}")
+
+    def load(self, rows: Iterable[Sequence[Any]],
+             summaries: Iterable[Tuple[Sequence[Any], Message]] = ()) -> None:
+        """用数据库中的数据替换整个索引。
+
+        Args:
+            :param rows: Database.get_contact_list的结果，每行为(mem, id, name, username)
+            :param summaries: Database.get_contact_summaries的结果，提供每个联系人的最后一条消息
+
+        Returns:
+            :return 无返回值
+        """
+        last_messages = {_contact_id(contact[1]): message for contact, message in summaries}
+        by_id: Dict[int, Contact] = {}
+        for row in rows:
+            contact_id = _contact_id(row[1])
+            if contact_id is None:
+                logger.warning(f"无效的联系人ID: {row[1]}")
+                continue
+            username = row[3] if len(row) > 3 else ""
+            by_id[contact_id] = Contact(contact_id, username, row[2], row[0], last_messages.get(contact_id))
+        with self._lock:
+            self._by_id = by_id
+            self._by_username = {contact.username: contact for contact in by_id.values() if contact.username}
+            self._recent = _recency_list(contact for contact in by_id.values() if contact.last_message is not None)
+        self._notify(RELOADED, None)
+
+    def add_contact(self, contact: Contact) -> bool:
         """添加联系人。
-        
+
         Args:
-            :param contact: 联系人信息字典
-            
+            :param contact: 联系人
+
         Returns:
-            :return 是否添加成功
+            :return 是否添加成功，ID已存在时返回False
         """
-        if contact not in self.contacts:
-            self.contacts.append(contact)
-            return True
-        return False
-    
-    def remove_contact(self, contact_id: str) -> bool:
+        with self._lock:
+            if contact.id in self._by_id:
+                return False
+            self._by_id[contact.id] = contact
+            if contact.username:
+                self._by_username[contact.username] = contact
+            if contact.last_message is not None:
+                self._recent.add(contact)
+        self._notify(ADDED, contact)
+        return True
+
+    def remove_contact(self, contact_id: Union[str, int]) -> bool:
         """删除联系人。
-        
+
         Args:
             :param contact_id: 联系人ID
-            
+
         Returns:
             :return 是否删除成功
         """
-        for contact in self.contacts:
-            if contact.get('id') == contact_id:
-                self.contacts.remove(contact)
-                return True
-        return False
-    
-    def get_contact_list(self) -> List[Dict[str, Any]]:
-        """获取联系人列表。
+        with self._lock:
+            contact = self._by_id.pop(_contact_id(contact_id), None)
+            if contact is None:
+                return False
+            if self._by_username.get(contact.username) is contact:
+                del self._by_username[contact.username]
+            if contact.last_message is not None:
+                self._recent.remove(contact)
+        self._notify(REMOVED, contact)
+        return True
+
+    def find_contact(self, contact_id: Union[str, int]) -> Optional[Contact]:
+        """按ID查找联系人。
+
+        Args:
+            :param contact_id: 联系人ID
 
         Returns:
-            :return 联系人列表
+            :return 联系人，未找到时返回None
         """
-        return self.contacts.copy()
-    
-    def find_contact(self, contact_id: str) -> Optional[Dict[str, Any]]:
-        """查找联系人。
-        
+        return self._by_id.get(_contact_id(contact_id))
+
+    def find_by_username(self, username: str) -> Optional[Contact]:
+        """按用户名查找联系人。
+
         Args:
-            :param contact_id: 联系人ID
-            
+            :param username: 用户名
+
+        Returns:
+            :return 联系人，未找到时返回None
+        """
+        return self._by_username.get(username)
+
+    def is_friend(self, uid: Optional[Union[str, int]] = None, username: Optional[str] = None) -> Optional[bool]:
+        """检查是否为好友，与Database.check_is_friend的参数和返回值相同。
+
+        Args:
+            :param uid: 用户ID
+            :param username: 用户名
+
         Returns:
-            :return 联系人信息，未找到时返回None
+            :return 是否为好友，参数无效时返回None
         """
-        for contact in self.contacts:
-            if contact.get('id') == contact_id:
-                return contact
+        if uid:
+            return self.find_contact(uid) is not None
+        if username:
+            return username in self._by_username
         return None
+
+    def display_name(self, contact_id: Union[str, int]) -> str:
+        """联系人的显示名称，不是联系人时返回ID本身。"""
+        contact = self.find_contact(contact_id)
+        return contact.display_name if contact is not None else str(contact_id)
+
+    def record_message(self, contact_id: Union[str, int], message: Message) -> Optional[Contact]:
+        """记录与联系人之间的一条新消息，把联系人移动到有序表中新的位置，比现有的最后一条消息旧时忽略。
+
+        Args:
+            :param contact_id: 对方的用户ID
+            :param message: 聊天消息
+
+        Returns:
+            :return 被更新的联系人，不是联系人或消息较旧时返回None
+        """
+        with self._lock:
+            contact = self._by_id.get(_contact_id(contact_id))
+            if contact is None:
+                return None
+            if contact.last_message is not None:
+                if message.send_time < contact.last_message.send_time:
+                    return None
+                self._recent.remove(contact)
+            contact.last_message = message
+            contact._view = None
+            self._recent.add(contact)
+        self._notify(MOVED, contact)
+        return contact
+
+    def ordered(self) -> List[Contact]:
+        """有聊天记录的联系人，按最后一条消息的时间从新到旧排列。
+
+        Returns:
+            :return 联系人列表
+        """
+        with self._lock:
+            return list(self._recent)
+
+    def views(self) -> List[Dict[str, Any]]:
+        """ordered()中各联系人的显示字典。
+
+        Returns:
+            :return 联系人列表中显示用的字典列表
+        """
+        return [contact.view() for contact in self.ordered()]
@@ -11,16 +11,31 @@
 """
 
 import sqlite3
-from typing import Any, Dict, List, Optional, Tuple, Union
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import structlog
 
+import metrics
+from chat_message import Message, row_factory
+
+if TYPE_CHECKING:
+    from persister import WriteBehindPersister
+
 logger = structlog.get_logger()
 
+# 运行指标：语句执行耗时（持有锁之后开始计时，不含等待锁的时间）
+_query_time = metrics.registry.histogram("db.query")
+_insert_time = metrics.registry.histogram("db.insert")
+_update_time = metrics.registry.histogram("db.update")
+_errors = metrics.registry.counter("db.errors")
+
 class Database:
     """WritePapers客户端数据库操作类。
     
     负责管理客户端的所有数据库操作，包括连接管理、数据增删改查等。
+    启动时数据库会在后台线程中连接和查询，所有语句都通过同一把锁串行执行。
+    设置write_behind后聊天消息改为延迟写入，读取聊天记录前会先写入所有待写消息。
     """
     
     def __init__(self) -> None:
@@ -36,6 +51,10 @@ class Database:
         self.cursor: Optional[sqlite3.Cursor] = None
         # 全局缓存字典
         self.uid_cache: Dict[str, Any] = {}
+        # 共享游标不是线程安全的，执行语句和读取结果时必须持有此锁
+        self.lock = threading.RLock()
+        # 聊天消息延迟写入器，为None时逐条同步写入
+        self.write_behind: Optional["WriteBehindPersister"] = None
 
     def connect(self, file: str) -> None:
         """建立数据库连接。
@@ -47,8 +66,9 @@ class Database:
             :return 无返回值
         """
         try:
-            self.conn = sqlite3.connect(file , check_same_thread=False)
-            self.cursor = self.conn.cursor()
+            with self.lock:
+                self.conn = sqlite3.connect(file , check_same_thread=False)
+                self.cursor = self.conn.cursor()
         except sqlite3.Error as e:
             logger.error(f"Error connecting to database: {e}")
 
@@ -67,16 +87,18 @@ class Database:
                 logger.error("数据库连接未建立")
                 return []
             
-            if params:
-                self.cursor.execute(command, params)  # 参数化查询
-            else:
-                self.cursor.execute(command)
-            
-            if self.conn:
-                self.conn.commit()  # 提交事务
-            
-            return self.cursor.fetchall()
+            with self.lock, _query_time.time():
+                if params:
+                    self.cursor.execute(command, params)  # 参数化查询
+                else:
+                    self.cursor.execute(command)
+
+                if self.conn:
+                    self.conn.commit()  # 提交事务
+
+                return self.cursor.fetchall()
         except sqlite3.Error as e:
+            _errors.inc()
             logger.error(f"执行 SQL 失败: {e} 欲执行的SQL语句：{command}")
             return []
 
@@ -99,11 +121,14 @@ class Database:
             # 使用 ? 占位符代替直接拼接的 values
             placeholders = ",".join(["?"] * len(values))
             sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-            self.cursor.execute(sql, tuple(values))
-            self.conn.commit()
+            with self.lock, _insert_time.time():
+                self.cursor.execute(sql, tuple(values))
+                self.conn.commit()
         except sqlite3.OperationalError as e:
+            _errors.inc()
             logger.error(f"插入数据失败: {e}")
         except sqlite3.Error as e:
+            _errors.inc()
             logger.error(f"插入数据失败: {e}")
 
     def _select_sql(self, table: str, columns: str, condition: Optional[str] = None) -> Optional[List[Tuple]]:
@@ -144,11 +169,13 @@ class Database:
                 return
             
             set_clause = f"{columns} = ?"
-            self.cursor.execute(f"UPDATE {table} SET {set_clause} WHERE {condition}", (values,))
-            
-            if self.conn:
-                self.conn.commit()
+            with self.lock, _update_time.time():
+                self.cursor.execute(f"UPDATE {table} SET {set_clause} WHERE {condition}", (values,))
+
+                if self.conn:
+                    self.conn.commit()
         except sqlite3.Error as e:
+            _errors.inc()
             logger.error(f"更新数据失败: {e}")
 
     def close(self) -> None:
@@ -160,10 +187,14 @@ class Database:
         Returns:
             :return 无返回值
         """
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
+        if self.write_behind is not None:
+            write_behind, self.write_behind = self.write_behind, None
+            write_behind.close()
+        with self.lock:
+            if self.cursor:
+                self.cursor.close()
+            if self.conn:
+                self.conn.close()
 
     def commit(self) -> None:
         """提交事务。
@@ -174,8 +205,9 @@ class Database:
         Returns:
             :return 无返回值
         """
-        if self.conn:
-            self.conn.commit()
+        with self.lock:
+            if self.conn:
+                self.conn.commit()
     # ------------------------------------------------------------------------------------------------------------------
 
     def get_mem_by_uid(self, uid: Union[str, int]) -> Optional[str]:
@@ -189,7 +221,7 @@ class Database:
         """
         try:
             result = self._select_sql("contact", "mem", f"id='{uid}'")
-            logger.debug(f"昵称查询第一次结果：{result}")
+            logger.debug("昵称查询", uid=uid, result=result, per_message=True)
             if not result:
                 if self._select_sql("contact", "name", f"id='{uid}'"):
                     return self._select_sql("contact", "name", f"id='{uid}'")[0][0]
@@ -214,22 +246,96 @@ class Database:
         """
         self._insert_sql("contact", "id, username, name, mem", [uid, username, name, mem])
         
-    def save_chat_message(self, from_user: Union[str, int], to_user: Union[str, int], 
-                         content: Union[str, bytes], send_time: float, message_type: str = "text") -> None:
+    def save_chat_message(self, message: Message) -> None:
         """保存聊天消息。
         
         Args:
-            :param from_user: 发送者ID
-            :param to_user: 接收者ID
-            :param content: 消息内容
-            :param send_time: 发送时间戳
-            :param message_type: 消息类型
+            :param message: 聊天消息，id被忽略
             
         Returns:
             :return 无返回值
         """
-        self._insert_sql("chat_history", "from_user, to_user, type, content, send_time", [from_user, to_user, message_type, content, send_time])
-    def get_last_chat_message(self, user_id: Union[str, int], contact_id: Union[str, int]) -> Optional[Tuple]:
+        if self.write_behind is not None:
+            self.write_behind.append(message)
+            return
+        self._insert_sql("chat_history", "from_user, to_user, type, content, send_time", list(message.row()))
+
+    def save_chat_messages(self, messages: Sequence[Message], journal_seq: Optional[int] = None) -> bool:
+        """在一个事务中保存多条聊天消息，同时记录延迟写入日志中已写入的序号。
+
+        Args:
+            :param messages: 聊天消息序列，id被忽略
+            :param journal_seq: 这批消息中最大的日志序号，None时不更新
+
+        Returns:
+            :return 成功返回True，失败时回滚并返回False
+        """
+        if self.cursor is None or self.conn is None:
+            logger.error("数据库连接未建立")
+            return False
+        try:
+            with self.lock, _insert_time.time():
+                try:
+                    self.cursor.executemany(
+                        "INSERT INTO chat_history (from_user, to_user, type, content, send_time) VALUES (?,?,?,?,?)",
+                        [message.row() for message in messages])
+                    if journal_seq is not None:
+                        self.cursor.execute("INSERT OR REPLACE INTO journal_state (id, applied_seq) VALUES (0, ?)",
+                                            (journal_seq,))
+                    self.conn.commit()
+                except sqlite3.Error:
+                    self.conn.rollback()
+                    raise
+            return True
+        except sqlite3.Error as e:
+            _errors.inc()
+            logger.error(f"批量保存聊天消息失败: {e}")
+            return False
+
+    def get_journal_seq(self) -> int:
+        """获取延迟写入日志中已写入数据库的最大序号。
+
+        Returns:
+            :return 序号，从未写入时为0
+        """
+        result = self._select_sql("journal_state", "applied_seq", "id=0")
+        return result[0][0] if result else 0
+
+    def _sync_write_behind(self) -> None:
+        """读取聊天记录前写入所有待写消息。"""
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def _select_messages(self, condition: str, params: Tuple[Any, ...]) -> List[Message]:
+        """查询聊天记录，结果由row_factory直接构造为Message。
+
+        使用单独的游标，不影响共享游标上其他查询返回的普通元组。
+
+        Args:
+            :param condition: WHERE子句（可以包含ORDER BY和LIMIT），使用?占位符
+            :param params: 占位符参数
+
+        Returns:
+            :return 聊天消息列表，失败时返回空列表
+        """
+        if self.conn is None:
+            logger.error("数据库连接未建立")
+            return []
+        sql = f'SELECT "index", from_user, to_user, type, content, send_time FROM chat_history WHERE {condition}'
+        try:
+            with self.lock, _query_time.time():
+                cursor = self.conn.cursor()
+                cursor.row_factory = row_factory
+                try:
+                    return cursor.execute(sql, params).fetchall()
+                finally:
+                    cursor.close()
+        except sqlite3.Error as e:
+            _errors.inc()
+            logger.error(f"查询聊天记录失败: {e}")
+            return []
+
+    def get_last_chat_message(self, user_id: Union[str, int], contact_id: Union[str, int]) -> Optional[Message]:
         """获取最近一条聊天消息。
         
         Args:
@@ -237,10 +343,12 @@ class Database:
             :param contact_id: 联系人ID
             
         Returns:
-            :return 最近一条聊天消息元组，未找到时返回None
+            :return 最近一条聊天消息，未找到时返回None
         """
-        condition = f"(from_user={user_id} AND to_user={contact_id}) OR (from_user={contact_id} AND to_user={user_id})"
-        result = self._select_sql("chat_history", "*", f"{condition} ORDER BY send_time DESC LIMIT 1")
+        self._sync_write_behind()
+        result = self._select_messages(
+            "(from_user=? AND to_user=?) OR (from_user=? AND to_user=?) ORDER BY send_time DESC LIMIT 1",
+            (user_id, contact_id, contact_id, user_id))
         return result[0] if result else None
     def get_metadata(self, column: str) -> Optional[Any]:
         """获取元数据。
@@ -311,11 +419,21 @@ class Database:
     uid integer
 )
     strict;
+        """
+        sql_item5 = """
+        create table if not exists journal_state
+(
+    id          integer
+        constraint journal_state_pk
+            primary key,
+    applied_seq integer
+);
         """
         self.run_sql(sql_item1)
         self.run_sql(sql_item2)
         self.run_sql(sql_item3)
         self.run_sql(sql_item4)
+        self.run_sql(sql_item5)
     def get_contact_list(self) -> Optional[List[Tuple]]:
         """获取联系人列表。
         
@@ -323,23 +441,49 @@ class Database:
             无参数
             
         Returns:
-            :return 联系人列表，未找到时返回None
+            :return 联系人列表，每行为(mem, id, name, username)，未找到时返回None
         """
-        contact_list = self._select_sql("contact", "mem, id, name")
+        contact_list = self._select_sql("contact", "mem, id, name, username")
         if contact_list:
             return contact_list
         else:
             return None
-    def get_chat_history(self, uid: Union[str, int]) -> Optional[List[Tuple]]:
+    def get_contact_summaries(self, user_id: Union[str, int]) -> List[Tuple[Tuple, Message]]:
+        """用一次查询获取所有联系人及其与当前用户的最后一条消息。
+
+        替代逐个联系人调用get_last_chat_message，启动时在后台线程中预取联系人列表。
+        没有聊天记录的联系人不会出现在结果中。
+
+        Args:
+            :param user_id: 当前用户ID
+
+        Returns:
+            :return [(联系人元组(mem, id, name), 最后一条消息), ...]
+        """
+        sql = """
+        SELECT c.mem, c.id, c.name, h."index", h.from_user, h.to_user, h.type, h.content, h.send_time
+        FROM contact AS c
+        JOIN chat_history AS h ON h."index" = (
+            SELECT "index" FROM chat_history
+            WHERE (from_user = ? AND to_user = c.id) OR (from_user = c.id AND to_user = ?)
+            ORDER BY send_time DESC LIMIT 1
+        )
+        """
+        self._sync_write_behind()
+        rows = self.run_sql(sql, (user_id, user_id))
+        return [(row[:3], Message._make(row[3:])) for row in rows]
+
+    def get_chat_history(self, uid: Union[str, int]) -> List[Message]:
         """获取聊天记录。
         
         Args:
             :param uid: 用户ID
             
         Returns:
-            :return 聊天记录列表，未找到时返回None
+            :return 聊天消息列表，按写入顺序排列
         """
-        return self._select_sql("chat_history", "*", f"to_user={uid} or from_user={uid}")
+        self._sync_write_behind()
+        return self._select_messages("to_user=? OR from_user=?", (uid, uid))
     def check_is_friend(self, uid: Optional[Union[str, int]] = None, 
                        username: Optional[str] = None) -> Optional[bool]:
         """检查是否为好友。
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/27
+# @File    : debug_ui.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端调试面板模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端调试面板模块。
+
+本模块提供调试模式下的统计窗口，定时刷新各消息类型的处理次数和耗时，
+用于找出占用CPU最多的消息类型；消息延迟追踪窗口，按阶段显示耗时分布；
+以及运行指标窗口，显示metrics注册表中的计数器、瞬时值和耗时分布。
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+import metrics
+import tracing
+from handlers import HandlerRegistry
+
+# 统计窗口的刷新间隔（毫秒）
+REFRESH_INTERVAL = 1000
+
+
+class HandlerStatsWindow(tk.Toplevel):
+    """消息处理器统计窗口类。"""
+
+    COLUMNS = (
+        ("count", "次数", 70),
+        ("total", "总耗时(ms)", 100),
+        ("mean", "平均(ms)", 90),
+        ("max", "最大(ms)", 90),
+        ("errors", "错误", 60),
+    )
+
+    def __init__(self, master: tk.Misc, registry: HandlerRegistry) -> None:
+        """初始化统计窗口。
+
+        Args:
+            :param master: 父窗口
+            :param registry: 要展示的处理器注册表
+
+        Returns:
+            :return 无返回值
+        """
+        super().__init__(master)
+        self.registry = registry
+        self.title("消息处理统计")
+        self.geometry("560x320")
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in self.COLUMNS])
+        self.tree.heading("#0", text="消息类型")
+        self.tree.column("#0", width=150)
+        for name, label, width in self.COLUMNS:
+            self.tree.heading(name, text=label)
+            self.tree.column(name, width=width, anchor="e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+        bottom = tk.Frame(self)
+        bottom.pack(fill="x", padx=10, pady=10)
+        self.unknown_label = tk.Label(bottom, text="")
+        self.unknown_label.pack(side="left")
+        tk.Button(bottom, text="清零", command=self.registry.reset_stats).pack(side="right")
+        tk.Button(bottom, text="延迟追踪", command=lambda: TraceStatsWindow(self)).pack(side="right", padx=(0, 5))
+        tk.Button(bottom, text="运行指标", command=lambda: MetricsWindow(self)).pack(side="right", padx=(0, 5))
+
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """按总耗时从高到低刷新表格。"""
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for message_type, stats in self.registry.top(limit=100):
+            self.tree.insert("", "end", text=message_type, values=(
+                stats.count,
+                f"{stats.total * 1000:.2f}",
+                f"{stats.mean * 1000:.3f}",
+                f"{stats.max * 1000:.3f}",
+                stats.errors,
+            ))
+        self.unknown_label.config(text=f"未知消息类型: {self.registry.unknown_count}")
+        self.after(REFRESH_INTERVAL, self._refresh)
+
+
+class TraceStatsWindow(tk.Toplevel):
+    """消息延迟追踪窗口类，按"类型:阶段"显示耗时分布。"""
+
+    COLUMNS = (
+        ("count", "次数", 70),
+        ("p50", "p50(ms)", 80),
+        ("p90", "p90(ms)", 80),
+        ("p99", "p99(ms)", 80),
+        ("max", "最大(ms)", 80),
+    )
+
+    def __init__(self, master: tk.Misc) -> None:
+        """初始化追踪窗口。
+
+        Args:
+            :param master: 父窗口
+
+        Returns:
+            :return 无返回值
+        """
+        super().__init__(master)
+        self.title("消息延迟追踪")
+        self.geometry("640x400")
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in self.COLUMNS])
+        self.tree.heading("#0", text="类型:阶段")
+        self.tree.column("#0", width=240)
+        for name, label, width in self.COLUMNS:
+            self.tree.heading(name, text=label)
+            self.tree.column(name, width=width, anchor="e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+        bottom = tk.Frame(self)
+        bottom.pack(fill="x", padx=10, pady=10)
+        self.toggle_button = tk.Button(bottom, command=self._toggle)
+        self.toggle_button.pack(side="left")
+        tk.Button(bottom, text="清零", command=tracing.registry.reset).pack(side="right")
+
+        self._refresh()
+
+    def _toggle(self) -> None:
+        """开启或关闭追踪。"""
+        tracing.set_enabled(not tracing.enabled())
+        self._refresh_button()
+
+    def _refresh_button(self) -> None:
+        """按追踪状态更新按钮文字。"""
+        self.toggle_button.config(text="停止追踪" if tracing.enabled() else "开始追踪")
+
+    def _refresh(self) -> None:
+        """刷新表格。"""
+        if not self.winfo_exists():
+            return
+        self._refresh_button()
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in tracing.registry.snapshot().items():
+            self.tree.insert("", "end", text=name, values=(
+                stats.count,
+                f"{stats.p50 * 1000:.3f}",
+                f"{stats.p90 * 1000:.3f}",
+                f"{stats.p99 * 1000:.3f}",
+                f"{stats.max * 1000:.3f}",
+            ))
+        self.after(REFRESH_INTERVAL, self._refresh)
+
+
+class MetricsWindow(tk.Toplevel):
+    """运行指标窗口类，计数器和瞬时值只显示数值，耗时分布显示次数和分位数。"""
+
+    COLUMNS = (
+        ("value", "数值/次数", 90),
+        ("p50", "p50(ms)", 80),
+        ("p99", "p99(ms)", 80),
+        ("max", "最大(ms)", 80),
+    )
+
+    def __init__(self, master: tk.Misc, registry: metrics.MetricsRegistry = metrics.registry) -> None:
+        """初始化指标窗口。
+
+        Args:
+            :param master: 父窗口
+            :param registry: 要展示的指标注册表
+
+        Returns:
+            :return 无返回值
+        """
+        super().__init__(master)
+        self.registry = registry
+        self.title("运行指标")
+        self.geometry("580x400")
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in self.COLUMNS])
+        self.tree.heading("#0", text="指标")
+        self.tree.column("#0", width=220)
+        for name, label, width in self.COLUMNS:
+            self.tree.heading(name, text=label)
+            self.tree.column(name, width=width, anchor="e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+        bottom = tk.Frame(self)
+        bottom.pack(fill="x", padx=10, pady=10)
+        tk.Button(bottom, text="写入日志", command=self.registry.emit).pack(side="left")
+        tk.Button(bottom, text="清零", command=self.registry.reset).pack(side="right")
+
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """刷新表格。"""
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for name, value in self.registry.snapshot().items():
+            if isinstance(value, tracing.HistogramSnapshot):
+                values = (value.count, f"{value.p50 * 1000:.3f}", f"{value.p99 * 1000:.3f}",
+                          f"{value.max * 1000:.3f}")
+            else:
+                values = (value, "", "", "")
+            self.tree.insert("", "end", text=name, values=values)
+        self.after(REFRESH_INTERVAL, self._refresh)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/24
+# @File    : frame_cache.py
+# @Software: PyCharm
+# @Desc    : WritePapers图片查看器动图帧缓存模块
+# @Author  : Kevin Chang
+
+"""WritePapers图片查看器动图帧缓存模块。
+
+本模块为图片查看器缓存已经旋转、缩放好的动图帧。缓存按(缩放比例, 旋转角度)区分，
+由后台线程按播放顺序填充，并受字节预算限制；超出预算时淘汰距离下一次播放最远的帧。
+播放时只需要切换缓存中现成的PhotoImage。
+"""
+
+import threading
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+import structlog
+from PIL import Image, ImageTk
+
+from image_decoder import ImageDecoder
+
+logger = structlog.get_logger()
+
+# 默认字节预算：96MB
+DEFAULT_BYTE_BUDGET = 96 * 1024 * 1024
+# 每个后台任务解码的帧数
+BATCH_SIZE = 4
+# 帧间隔缺失时使用的默认值（毫秒）
+DEFAULT_FRAME_DURATION = 100
+
+
+def transform_frame(image: Image.Image, rotation: int, scale_factor: float) -> Image.Image:
+    """对一帧图片应用旋转和缩放。
+
+    Args:
+        :param image: 原始帧
+        :param rotation: 旋转角度
+        :param scale_factor: 缩放比例
+
+    Returns:
+        :return 变换后的帧
+    """
+    # 应用旋转
+    if rotation != 0:
+        image = image.rotate(rotation, expand=True)
+
+    # 应用缩放
+    if scale_factor != 1.0:
+        new_width = int(image.width * scale_factor)
+        new_height = int(image.height * scale_factor)
+        if new_width > 0 and new_height > 0:
+            image = image.resize(
+                (new_width, new_height),
+                Image.Resampling.LANCZOS
+            )
+    return image
+
+
+class GifFrameCache:
+    """动图变换帧缓存类。
+
+    缓存中的帧只在Tk主线程中访问；后台任务通过锁串行访问同一个源图片对象，
+    以便按顺序解码帧而不必每次从头开始。
+    """
+
+    def __init__(self, decoder: ImageDecoder, byte_budget: int = DEFAULT_BYTE_BUDGET,
+                 on_frame_ready: Optional[Callable[[int], None]] = None) -> None:
+        """初始化帧缓存。
+
+        Args:
+            :param decoder: 后台解码服务
+            :param byte_budget: 缓存的字节预算
+            :param on_frame_ready: 某一帧进入缓存后在主线程中调用的回调，参数为帧序号
+
+        Returns:
+            :return 无返回值
+        """
+        self.decoder = decoder
+        self.byte_budget = byte_budget
+        self.on_frame_ready = on_frame_ready
+
+        self.frame_count = 0
+        self.view: Optional[Tuple[float, int]] = None  # (缩放比例, 旋转角度)
+
+        self._data: Optional[bytes] = None
+        # 帧序号 -> (PhotoImage, 帧间隔, 字节数)
+        self._frames: Dict[int, Tuple[ImageTk.PhotoImage, int, int]] = {}
+        self._used_bytes = 0
+        self._playhead = 0
+        self._loading = False
+        self._generation = 0
+
+        # 后台解码使用的源图片，只在持有锁时访问
+        self._source_lock = threading.Lock()
+        self._source: Optional[Image.Image] = None
+        self._source_generation = -1
+
+    @property
+    def used_bytes(self) -> int:
+        """当前缓存占用的字节数。"""
+        return self._used_bytes
+
+    def load(self, data: bytes, frame_count: int) -> None:
+        """加载新的动图，清空之前的缓存。
+
+        Args:
+            :param data: 动图的二进制数据
+            :param frame_count: 动图的帧数
+
+        Returns:
+            :return 无返回值
+        """
+        self.clear()
+        self._data = data
+        self.frame_count = frame_count
+
+    def set_view(self, scale_factor: float, rotation: int) -> None:
+        """设置当前视图；视图变化时丢弃全部缓存帧并重新填充。
+
+        Args:
+            :param scale_factor: 缩放比例
+            :param rotation: 旋转角度
+
+        Returns:
+            :return 无返回值
+        """
+        view = (scale_factor, rotation)
+        if view == self.view:
+            return
+        self._drop_frames()
+        self.view = view
+        self._fill()
+
+    def get(self, index: int) -> Optional[Tuple[ImageTk.PhotoImage, int]]:
+        """获取缓存中的一帧，并把播放位置移动到该帧。
+
+        Args:
+            :param index: 帧序号
+
+        Returns:
+            :return (PhotoImage, 帧间隔毫秒)，尚未缓存时返回None
+        """
+        self._playhead = index
+        entry = self._frames.get(index)
+        self._fill()
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def clear(self) -> None:
+        """清空缓存并放弃源图片。
+
+        Returns:
+            :return 无返回值
+        """
+        self._drop_frames()
+        self.view = None
+        self._data = None
+        self.frame_count = 0
+        self._playhead = 0
+
+    def _drop_frames(self) -> None:
+        """丢弃全部缓存帧并取消未完成的任务。"""
+        self.decoder.cancel_group(self)
+        self._generation += 1
+        self._loading = False
+        self._frames.clear()
+        self._used_bytes = 0
+
+    def _distance(self, index: int) -> int:
+        """从当前播放位置向前播放到index需要经过的帧数。"""
+        return (index - self._playhead) % self.frame_count
+
+    def _next_missing(self) -> Optional[int]:
+        """从播放位置开始查找第一帧未缓存的帧。"""
+        for offset in range(self.frame_count):
+            index = (self._playhead + offset) % self.frame_count
+            if index not in self._frames:
+                return index
+        return None
+
+    def _fill(self) -> None:
+        """在预算允许时提交下一批解码任务。"""
+        if self._loading or self._data is None or self.view is None or not self.frame_count:
+            return
+        start = self._next_missing()
+        if start is None:
+            return
+        if self._used_bytes >= self.byte_budget:
+            # 缓存已满时，只有缺失的帧比已缓存的某一帧更早播放才值得替换
+            farthest = max(self._distance(index) for index in self._frames)
+            if self._distance(start) >= farthest:
+                return
+
+        indices = [(start + offset) % self.frame_count for offset in range(min(BATCH_SIZE, self.frame_count))]
+        indices = [index for index in indices if index not in self._frames]
+        scale_factor, rotation = self.view
+        generation = self._generation
+        self._loading = True
+        self.decoder.submit(
+            self._decode_frames, self._data, generation, indices, scale_factor, rotation,
+            callback=lambda frames: self._on_frames(frames, generation),
+            on_error=self._on_error,
+            group=self
+        )
+
+    def _decode_frames(self, data: bytes, generation: int, indices: List[int],
+                       scale_factor: float, rotation: int) -> List[Tuple[int, Image.Image, int]]:
+        """解码并变换指定的帧（在后台解码线程中执行）。"""
+        frames = []
+        with self._source_lock:
+            if self._source is None or self._source_generation != generation:
+                self._source = Image.open(BytesIO(data))
+                self._source_generation = generation
+            for index in indices:
+                self._source.seek(index)
+                duration = self._source.info.get("duration") or DEFAULT_FRAME_DURATION
+                frame = transform_frame(self._source.convert("RGBA"), rotation, scale_factor)
+                frames.append((index, frame, int(duration)))
+        return frames
+
+    def _on_frames(self, frames: List[Tuple[int, Image.Image, int]], generation: int) -> None:
+        """把解码好的帧放入缓存（在主线程中执行）。"""
+        if generation != self._generation:
+            return
+        self._loading = False
+
+        evicted_new = False
+        for index, frame, duration in frames:
+            size = frame.width * frame.height * 4
+            self._frames[index] = (ImageTk.PhotoImage(frame), duration, size)
+            self._used_bytes += size
+            # 超出预算时淘汰距离下一次播放最远的帧
+            while self._used_bytes > self.byte_budget and len(self._frames) > 1:
+                farthest = max(self._frames, key=self._distance)
+                self._used_bytes -= self._frames.pop(farthest)[2]
+                if farthest == index:
+                    evicted_new = True
+            if index in self._frames and self.on_frame_ready:
+                self.on_frame_ready(index)
+
+        if not evicted_new:
+            self._fill()
+
+    def _on_error(self, error: BaseException) -> None:
+        """解码失败时停止填充。"""
+        self._loading = False
+        logger.warning(f"动图帧解码失败: {error}")
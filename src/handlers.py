@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/27
+# @File    : handlers.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端消息处理器注册表模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端消息处理器注册表模块。
+
+本模块按消息类型登记处理函数，并统计每种消息的处理次数、总耗时、最大耗时和出错次数。
+处理器分两种：
+    即时处理器在接收线程中直接调用，适合心跳等必须立即响应的轻量消息；
+    延迟处理器放入队列，由消息处理线程调用run_deferred执行，适合写数据库、更新界面等较重的工作。
+
+用法：
+    registry = HandlerRegistry()
+
+    @registry.on("heartbeat")
+    def handle_heartbeat(msg):
+        ...
+
+    registry.register("login_result", client.handle_login_result, deferred=True)
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import structlog
+
+import tracing
+
+logger = structlog.get_logger()
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+class HandlerStats(NamedTuple):
+    """某一消息类型的处理统计。"""
+    count: int  # 处理次数
+    total: float  # 总耗时（秒）
+    max: float  # 单次最大耗时（秒）
+    errors: int  # 处理器抛出异常的次数
+
+    @property
+    def mean(self) -> float:
+        """平均耗时（秒）。"""
+        return self.total / self.count if self.count else 0.0
+
+
+class _Entry:
+    """登记的处理器及其统计数据。"""
+
+    __slots__ = ("handler", "deferred", "count", "total", "max", "errors")
+
+    def __init__(self, handler: Handler, deferred: bool) -> None:
+        self.handler = handler
+        self.deferred = deferred
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+
+class HandlerRegistry:
+    """消息类型处理器注册表类。
+
+    注册表只构建一次，收到消息时按类型查表分发；统计数据在锁保护下更新，可以从任意线程读取。
+    """
+
+    def __init__(self) -> None:
+        """初始化注册表。
+
+        Returns:
+            :return 无返回值
+        """
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._deferred: queue.Queue = queue.Queue()
+        self.unknown_count = 0
+        # 有延迟处理的消息入队时置位，消息处理线程等待它
+        self.ready = threading.Event()
+
+    def register(self, message_type: str, handler: Handler, deferred: bool = False) -> None:
+        """登记一个消息类型的处理器，已有的处理器会被替换，统计数据清零。
+
+        Args:
+            :param message_type: 消息类型
+            :param handler: 处理函数，参数为完整的消息字典
+            :param deferred: 是否在消息处理线程中延迟执行
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self._entries[message_type] = _Entry(handler, deferred)
+
+    def on(self, message_type: str, deferred: bool = False) -> Callable[[Handler], Handler]:
+        """以装饰器的形式登记处理器。
+
+        Args:
+            :param message_type: 消息类型
+            :param deferred: 是否在消息处理线程中延迟执行
+
+        Returns:
+            :return 装饰器，原样返回被装饰的函数
+        """
+        def decorator(handler: Handler) -> Handler:
+            self.register(message_type, handler, deferred)
+            return handler
+        return decorator
+
+    def unregister(self, message_type: str) -> None:
+        """移除一个消息类型的处理器。
+
+        Args:
+            :param message_type: 消息类型
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self._entries.pop(message_type, None)
+
+    def handles(self, message_type: str) -> bool:
+        """是否登记了该消息类型的处理器。
+
+        Args:
+            :param message_type: 消息类型
+
+        Returns:
+            :return 已登记返回True
+        """
+        return message_type in self._entries
+
+    def dispatch(self, msg: Dict[str, Any], trace: Optional[tracing.Trace] = None) -> bool:
+        """分发一条消息：即时处理器立即执行，延迟处理器放入队列。
+
+        Args:
+            :param msg: 消息字典
+            :param trace: 该消息的追踪，处理器执行完毕后结束；未知类型时由调用方处理
+
+        Returns:
+            :return 找到处理器返回True，未知类型返回False
+        """
+        message_type = msg.get("type", "")
+        entry = self._entries.get(message_type)
+        if entry is None:
+            with self._lock:
+                self.unknown_count += 1
+            return False
+        if entry.deferred:
+            self._deferred.put((message_type, entry, msg, trace))
+            self.ready.set()
+        else:
+            self._call(message_type, entry, msg, trace)
+        return True
+
+    def run_deferred(self) -> int:
+        """执行队列中所有延迟处理的消息（在消息处理线程中调用）。
+
+        Returns:
+            :return 本次处理的消息数
+        """
+        handled = 0
+        while True:
+            try:
+                message_type, entry, msg, trace = self._deferred.get_nowait()
+            except queue.Empty:
+                return handled
+            self._call(message_type, entry, msg, trace)
+            handled += 1
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待有延迟处理的消息到达，返回后标志已清除。
+
+        Args:
+            :param timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            :return 有消息到达返回True，超时返回False
+        """
+        ready = self.ready.wait(timeout)
+        # 先清除标志再处理，处理期间到达的消息会重新置位，不会丢失唤醒
+        self.ready.clear()
+        return ready
+
+    def stats(self) -> Dict[str, HandlerStats]:
+        """各消息类型的处理统计快照。
+
+        Returns:
+            :return 消息类型到统计数据的字典
+        """
+        with self._lock:
+            return {message_type: HandlerStats(entry.count, entry.total, entry.max, entry.errors)
+                    for message_type, entry in self._entries.items()}
+
+    def top(self, limit: int = 10) -> List[Tuple[str, HandlerStats]]:
+        """按总耗时排序的消息类型，用于找出占用CPU最多的消息。
+
+        Args:
+            :param limit: 返回的条目数
+
+        Returns:
+            :return [(消息类型, 统计数据), ...]
+        """
+        ranked = sorted(self.stats().items(), key=lambda item: item[1].total, reverse=True)
+        return ranked[:limit]
+
+    def reset_stats(self) -> None:
+        """清空所有统计数据。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.count = entry.errors = 0
+                entry.total = entry.max = 0.0
+            self.unknown_count = 0
+
+    def format_stats(self) -> str:
+        """生成统计数据的文本表格。
+
+        Returns:
+            :return 报告文本
+        """
+        lines = [f"{'消息类型':<24}{'次数':>8}{'总耗时ms':>12}{'平均ms':>10}{'最大ms':>10}{'错误':>6}"]
+        for message_type, stats in self.top(len(self._entries)):
+            lines.append(f"{message_type:<24}{stats.count:>8}{stats.total * 1000:>12.2f}"
+                         f"{stats.mean * 1000:>10.3f}{stats.max * 1000:>10.3f}{stats.errors:>6}")
+        lines.append(f"未知消息类型: {self.unknown_count}")
+        return "\n".join(lines)
+
+    def _call(self, message_type: str, entry: _Entry, msg: Dict[str, Any],
+              trace: Optional[tracing.Trace] = None) -> None:
+        """调用处理器并记录耗时，有追踪时在处理期间设为当前追踪。"""
+        failed = False
+        if trace is not None:
+            trace.stamp("dispatch")
+            previous = tracing.activate(trace)
+        start = time.perf_counter()
+        try:
+            entry.handler(msg)
+        except Exception as e:
+            failed = True
+            logger.error(f"处理{message_type}消息时发生错误: {e}", exc_info=True)
+        elapsed = time.perf_counter() - start
+        if trace is not None:
+            tracing.activate(previous)
+            trace.stamp("done")
+            tracing.finish(trace)
+        with self._lock:
+            entry.count += 1
+            entry.total += elapsed
+            if elapsed > entry.max:
+                entry.max = elapsed
+            if failed:
+                entry.errors += 1
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/30
+# @File    : headless.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端无界面适配模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端无界面适配模块。
+
+Client以无界面模式运行时用RecordingUI代替GUI：实现Client会调用到的那部分GUI接口，
+不创建任何Tk控件，只记录显示过的消息、提示和联系人列表刷新次数，
+用于压力测试和自动化测试中同时运行大量客户端。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from chat_message import Message
+
+
+class Rendered(NamedTuple):
+    """一条被"显示"的消息。"""
+    at: float  # 显示时刻（time.time()，便于与其他进程的时间戳比较）
+    message: Message  # 传给display_message的消息
+    sent: bool  # 是否为当前用户发送的消息
+
+
+class ImmediateScheduler:
+    """代替Tk根窗口的after调度：没有事件循环，回调在调用线程中立即执行。"""
+
+    def __init__(self) -> None:
+        self._ids = 0
+
+    def after(self, ms: int, func: Optional[Callable] = None, *args: Any) -> str:
+        """立即执行回调，忽略延迟。
+
+        Args:
+            :param ms: 延迟（毫秒），被忽略
+            :param func: 回调函数
+            :param args: 回调参数
+
+        Returns:
+            :return 与Tk相同格式的回调标识
+        """
+        self._ids += 1
+        if func is not None:
+            func(*args)
+        return f"after#{self._ids}"
+
+    def after_idle(self, func: Callable, *args: Any) -> str:
+        """立即执行回调。"""
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id: str) -> None:
+        """回调已经执行过，无需取消。"""
+
+
+class RecordingUI:
+    """记录型无界面适配类，可以作为Client.gui使用。
+
+    record为False时只计数不保存内容，适合长时间的压力测试。
+    """
+
+    def __init__(self, on_render: Optional[Callable[[Rendered], None]] = None, record: bool = True) -> None:
+        """初始化适配器。
+
+        Args:
+            :param on_render: 每显示一条消息时调用的函数，在调用display_message的线程中执行
+            :param record: 是否保存显示过的消息和提示
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = ImmediateScheduler()
+        # 没有真实控件，非None表示界面已经就绪
+        self.scrollable_frame = object()
+        self.current_chat: Optional[Dict[str, Any]] = None
+        self.contacts: List[Dict[str, Any]] = []
+        self.on_render = on_render
+        self.record = record
+
+        self._lock = threading.Lock()
+        self.rendered: List[Rendered] = []
+        self.toasts: List[str] = []
+        self.render_count = 0
+        self.contact_loads = 0
+        self.contact_moves = 0
+        self.connection_status: Optional[str] = None
+
+    def display_message(self, message: Message, sent: bool) -> None:
+        """记录一条显示的消息。
+
+        Args:
+            :param message: 聊天消息
+            :param sent: 是否为当前用户发送的消息
+
+        Returns:
+            :return 无返回值
+        """
+        rendered = Rendered(time.time(), message, sent)
+        with self._lock:
+            self.render_count += 1
+            if self.record:
+                self.rendered.append(rendered)
+        if self.on_render is not None:
+            self.on_render(rendered)
+
+    def load_contacts(self) -> None:
+        """记录一次联系人列表刷新。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self.contact_loads += 1
+
+    def move_contact(self, contact: Dict[str, Any]) -> None:
+        """记录一次联系人移动。
+
+        Args:
+            :param contact: 联系人信息字典
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self.contact_moves += 1
+
+    def show_toast(self, message: str, **kwargs: Any) -> None:
+        """记录一条提示。
+
+        Args:
+            :param message: 提示内容
+            :param kwargs: 与GUI.show_toast相同的显示参数，被忽略
+
+        Returns:
+            :return 无返回值
+        """
+        if self.record:
+            with self._lock:
+                self.toasts.append(message)
+
+    def set_connection_status(self, text: str, status: str = 'success') -> None:
+        """记录连接状态。"""
+        self.connection_status = text
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/20
+# @File    : image_cache.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端图片缩略图缓存模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端图片缩略图缓存模块。
+
+本模块按图片内容哈希缓存聊天气泡使用的缩略图：内存中使用带容量预算的LRU淘汰，
+同时把缩略图持久化到磁盘，重新打开聊天时无需再次解码原图。
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import NamedTuple, Optional, Tuple
+
+import structlog
+from PIL import Image
+
+logger = structlog.get_logger()
+
+# 默认缩略图尺寸（与聊天气泡中的显示尺寸一致）
+THUMBNAIL_SIZE: Tuple[int, int] = (300, 300)
+# 默认内存预算：64MB
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+# 默认磁盘缓存目录
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "thumbnails")
+
+# 可以直接保存为PNG的图片模式
+_PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+
+
+class Thumbnail(NamedTuple):
+    """缓存中的缩略图条目。"""
+    image: Image.Image  # 缩略图（动图为第一帧）
+    is_animated: bool  # 原图是否为动图
+
+
+def content_key(data: bytes) -> str:
+    """计算图片内容的缓存键。
+
+    Args:
+        :param data: 图片的二进制数据
+
+    Returns:
+        :return 内容哈希字符串
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def image_nbytes(image: Image.Image) -> int:
+    """估算图片解码后占用的内存字节数。
+
+    Args:
+        :param image: PIL图片对象
+
+    Returns:
+        :return 估算的字节数
+    """
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageCache:
+    """图片缩略图缓存类。
+
+    以内容哈希为键缓存已缩放好的缩略图，内存部分按LRU淘汰，磁盘部分长期保存。
+    所有方法都是线程安全的，可以在后台解码线程中调用。
+    """
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 thumbnail_size: Tuple[int, int] = THUMBNAIL_SIZE) -> None:
+        """初始化缩略图缓存。
+
+        Args:
+            :param cache_dir: 磁盘缓存目录，为None时不做持久化
+            :param memory_budget: 内存缓存的字节预算
+            :param thumbnail_size: 缩略图的最大尺寸
+
+        Returns:
+            :return 无返回值
+        """
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.thumbnail_size = thumbnail_size
+
+        self._entries: "OrderedDict[str, Thumbnail]" = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"无法创建缩略图缓存目录，已禁用磁盘缓存: {e}")
+                self.cache_dir = None
+
+    @property
+    def used_bytes(self) -> int:
+        """当前内存缓存占用的字节数。"""
+        return self._used_bytes
+
+    def get_thumbnail(self, data: bytes) -> Thumbnail:
+        """获取图片的缩略图，依次查找内存缓存、磁盘缓存，最后才解码原图。
+
+        Args:
+            :param data: 图片的二进制数据
+
+        Returns:
+            :return 缩略图条目
+
+        Raises:
+            :raise PIL.UnidentifiedImageError: 图片数据无法识别时抛出
+        """
+        key = content_key(data)
+
+        # 第一级：内存缓存
+        cached = self.peek(key)
+        if cached is not None:
+            return cached
+
+        # 第二级：磁盘缓存
+        thumbnail = self._load_from_disk(key)
+        if thumbnail is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            # 未命中：解码原图并生成缩略图
+            thumbnail = self._create_thumbnail(data)
+            with self._lock:
+                self.misses += 1
+            self._save_to_disk(key, thumbnail)
+
+        self._put(key, thumbnail)
+        return thumbnail
+
+    def peek(self, key: str) -> Optional[Thumbnail]:
+        """只在内存缓存中查找缩略图，不会触发任何解码。
+
+        Args:
+            :param key: 内容哈希
+
+        Returns:
+            :return 缩略图条目，未命中时返回None
+        """
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return cached
+
+    def clear(self) -> None:
+        """清空内存缓存（磁盘缓存保留）。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+    def _create_thumbnail(self, data: bytes) -> Thumbnail:
+        """解码原图并生成缩略图。"""
+        image = Image.open(BytesIO(data))
+        is_animated = bool(getattr(image, "is_animated", False))
+        image.seek(0)
+        frame = image.copy()
+        if frame.mode not in _PNG_MODES:
+            frame = frame.convert("RGBA")
+        frame.thumbnail(self.thumbnail_size)
+        return Thumbnail(frame, is_animated)
+
+    def _put(self, key: str, thumbnail: Thumbnail) -> None:
+        """把缩略图放入内存缓存，并按LRU淘汰超出预算的条目。"""
+        size = image_nbytes(thumbnail.image)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= image_nbytes(previous.image)
+            self._entries[key] = thumbnail
+            self._used_bytes += size
+            # 淘汰最久未使用的条目，至少保留刚放入的一条
+            while self._used_bytes > self.memory_budget and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= image_nbytes(evicted.image)
+
+    def _disk_path(self, key: str, is_animated: bool) -> str:
+        """获取缩略图在磁盘上的路径。"""
+        suffix = ".anim.png" if is_animated else ".png"
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _load_from_disk(self, key: str) -> Optional[Thumbnail]:
+        """从磁盘缓存读取缩略图。"""
+        if not self.cache_dir:
+            return None
+        for is_animated in (False, True):
+            path = self._disk_path(key, is_animated)
+            if not os.path.exists(path):
+                continue
+            try:
+                with Image.open(path) as cached:
+                    cached.load()
+                    return Thumbnail(cached.copy(), is_animated)
+            except (OSError, SyntaxError) as e:
+                logger.warning(f"缩略图缓存文件损坏，将重新生成: {path}, 错误: {e}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return None
+
+    def _save_to_disk(self, key: str, thumbnail: Thumbnail) -> None:
+        """把缩略图写入磁盘缓存（先写临时文件再重命名，避免留下半个文件）。"""
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key, thumbnail.is_animated)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            thumbnail.image.save(temp_path, format="PNG")
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"写入缩略图缓存失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/21
+# @File    : image_decoder.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端后台图片解码模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端后台图片解码模块。
+
+本模块提供基于线程池的图片解码服务。解码和缩放在后台线程中完成，
+结果通过Tk的after轮询交回主线程，避免大图解码卡住界面。
+"""
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+import structlog
+import tkinter as tk
+from PIL import Image
+
+import image_cache
+
+logger = structlog.get_logger()
+
+# 默认后台解码线程数
+DEFAULT_WORKERS = 2
+# 主线程轮询解码结果的间隔（毫秒）
+POLL_INTERVAL = 15
+
+
+def probe_thumbnail_size(data: bytes, box: Tuple[int, int] = image_cache.THUMBNAIL_SIZE) -> Tuple[int, int]:
+    """只读取图片头部信息，计算缩略图的显示尺寸，用于绘制占位图。
+
+    Args:
+        :param data: 图片的二进制数据
+        :param box: 缩略图的最大尺寸
+
+    Returns:
+        :return 缩略图的(宽, 高)
+    """
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+    # 与Image.thumbnail保持一致：等比缩小，不放大
+    ratio = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def load_bubble_image(cache: image_cache.ImageCache, data: bytes) -> image_cache.Thumbnail:
+    """在后台线程中解码聊天气泡图片。
+
+    动图只解码第一帧，后续帧由animation模块在播放时按需解码。
+
+    Args:
+        :param cache: 缩略图缓存
+        :param data: 图片的二进制数据
+
+    Returns:
+        :return 缩略图条目
+    """
+    return cache.get_thumbnail(data)
+
+
+class ImageDecoder:
+    """后台图片解码服务类。
+
+    任务在线程池中执行，完成后的回调统一在Tk主线程中调用。
+    任务可以按分组提交，切换聊天时整组取消。
+    """
+
+    def __init__(self, root: tk.Misc, max_workers: int = DEFAULT_WORKERS) -> None:
+        """初始化解码服务。
+
+        Args:
+            :param root: 用于在主线程中调度回调的Tk控件
+            :param max_workers: 后台解码线程数
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-decoder")
+        self._results: queue.Queue = queue.Queue()
+        self._live: Set[Future] = set()
+        self._groups: Dict[Hashable, Set[Future]] = {}
+        self._lock = threading.Lock()
+        self._polling = False
+
+    def submit(self, func: Callable[..., Any], *args: Any, callback: Callable[[Any], None],
+               on_error: Optional[Callable[[BaseException], None]] = None,
+               group: Optional[Hashable] = None) -> Future:
+        """提交一个后台解码任务。
+
+        Args:
+            :param func: 在后台线程中执行的函数
+            :param args: 传给func的参数
+            :param callback: 任务成功后在主线程中调用的回调，参数为func的返回值
+            :param on_error: 任务失败后在主线程中调用的回调，参数为异常对象
+            :param group: 任务分组，用于cancel_group整组取消
+
+        Returns:
+            :return 任务对应的Future对象
+        """
+        future = self._executor.submit(func, *args)
+        with self._lock:
+            self._live.add(future)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(future)
+        future.add_done_callback(lambda f: self._results.put((f, callback, on_error, group)))
+        self._ensure_polling()
+        return future
+
+    def cancel_group(self, group: Hashable) -> None:
+        """取消一个分组中所有尚未交付的任务。
+
+        尚未开始的任务直接取消；正在执行的任务结果会被丢弃，不再调用回调。
+
+        Args:
+            :param group: 任务分组
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            futures = self._groups.pop(group, set())
+            self._live.difference_update(futures)
+        for future in futures:
+            future.cancel()
+        if futures:
+            logger.debug(f"已取消 {len(futures)} 个图片解码任务")
+
+    def shutdown(self) -> None:
+        """关闭解码服务，丢弃所有未完成的任务。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            futures = list(self._live)
+            self._live.clear()
+            self._groups.clear()
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _ensure_polling(self) -> None:
+        """确保主线程正在轮询解码结果。"""
+        with self._lock:
+            if self._polling:
+                return
+            self._polling = True
+        try:
+            self.root.after(POLL_INTERVAL, self._poll)
+        except (RuntimeError, tk.TclError):
+            # 窗口已经销毁
+            with self._lock:
+                self._polling = False
+
+    def _poll(self) -> None:
+        """在主线程中交付已完成任务的结果。"""
+        while True:
+            try:
+                future, callback, on_error, group = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._lock:
+                delivered = future in self._live
+                self._live.discard(future)
+                if group is not None and group in self._groups:
+                    self._groups[group].discard(future)
+                    if not self._groups[group]:
+                        del self._groups[group]
+            if not delivered or future.cancelled():
+                continue
+
+            error = future.exception()
+            try:
+                if error is None:
+                    callback(future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    logger.warning(f"后台图片解码失败: {error}")
+            except tk.TclError:
+                # 目标控件已经销毁，忽略
+                pass
+            except Exception as e:
+                logger.error(f"处理图片解码结果时发生错误: {e}")
+
+        with self._lock:
+            if not self._live and self._results.empty():
+                self._polling = False
+                return
+        try:
+            self.root.after(POLL_INTERVAL, self._poll)
+        except tk.TclError:
+            with self._lock:
+                self._polling = False
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/23
+# @File    : image_tiles.py
+# @Software: PyCharm
+# @Desc    : WritePapers图片查看器分块渲染模块
+# @Author  : Kevin Chang
+
+"""WritePapers图片查看器分块渲染模块。
+
+本模块为大图提供分块、多分辨率的渲染方式：图片先生成一组逐级减半的金字塔，
+渲染时只为画布可视区域内的图块选取最合适的层级进行缩放和转换。
+交互缩放过程中使用快速滤镜，停止操作后再用高质量滤镜重绘可视图块。
+"""
+
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import structlog
+import tkinter as tk
+from PIL import Image, ImageTk
+
+from image_decoder import ImageDecoder
+
+logger = structlog.get_logger()
+
+# 图块边长（像素）
+TILE_SIZE = 256
+# 停止交互后多久进行高质量重绘（毫秒）
+SETTLE_DELAY = 200
+# 画布上图块的标签
+TILE_TAG = "tile"
+
+# 渲染质量：交互时使用快速滤镜，停止后使用高质量滤镜
+QUALITY_FAST = 0
+QUALITY_HIGH = 1
+_FILTERS = {
+    QUALITY_FAST: Image.Resampling.NEAREST,
+    QUALITY_HIGH: Image.Resampling.LANCZOS,
+}
+
+# 旋转角度对应的无损转置操作（与Image.rotate一样为逆时针方向）
+_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+
+def build_pyramid(image: Image.Image, tile_size: int = TILE_SIZE) -> List[Image.Image]:
+    """生成图片金字塔（在后台解码线程中执行）。
+
+    第0层为原图，之后每层宽高减半，直到最长边不超过一个图块。
+
+    Args:
+        :param image: 原图
+        :param tile_size: 图块边长
+
+    Returns:
+        :return 由大到小排列的各层图片
+    """
+    if image.mode not in ("RGB", "RGBA", "L"):
+        has_alpha = image.mode in ("LA", "PA", "RGBa") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    levels = [image]
+    while max(levels[-1].size) > tile_size and min(levels[-1].size) >= 2:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def rotate_pyramid(levels: List[Image.Image], rotation: int) -> List[Image.Image]:
+    """把金字塔各层旋转到指定角度（在后台解码线程中执行）。
+
+    Args:
+        :param levels: 未旋转的金字塔
+        :param rotation: 旋转角度，必须是90的倍数
+
+    Returns:
+        :return 旋转后的金字塔
+    """
+    operation = _TRANSPOSE.get(rotation % 360)
+    if operation is None:
+        return levels
+    return [level.transpose(operation) for level in levels]
+
+
+def render_tile(level: Image.Image, box: Tuple[float, float, float, float],
+                size: Tuple[int, int], quality: int) -> Image.Image:
+    """把层级图片中的一块区域缩放为图块（在后台解码线程中执行）。
+
+    Args:
+        :param level: 金字塔中的某一层
+        :param box: 该层中的源区域(左, 上, 右, 下)
+        :param size: 图块的目标尺寸
+        :param quality: 渲染质量
+
+    Returns:
+        :return 图块图片
+    """
+    return level.resize(size, _FILTERS[quality], box=box)
+
+
+class TiledRenderer:
+    """画布分块渲染器。
+
+    只渲染可视区域内的图块，图块的缩放在后台线程中完成。
+    视图（缩放比例或旋转角度）变化时，旧视图尚未完成的任务会被整组取消。
+    """
+
+    def __init__(self, canvas: tk.Canvas, decoder: ImageDecoder,
+                 tile_size: int = TILE_SIZE, settle_delay: int = SETTLE_DELAY) -> None:
+        """初始化渲染器。
+
+        Args:
+            :param canvas: 显示图片的画布
+            :param decoder: 后台解码服务
+            :param tile_size: 图块边长
+            :param settle_delay: 停止交互后进行高质量重绘的延迟（毫秒）
+
+        Returns:
+            :return 无返回值
+        """
+        self.canvas = canvas
+        self.decoder = decoder
+        self.tile_size = tile_size
+        self.settle_delay = settle_delay
+
+        self.scale = 1.0
+        self.rotation = 0
+
+        self._source_size: Optional[Tuple[int, int]] = None
+        self._base_levels: Optional[List[Image.Image]] = None
+        self._levels: Optional[List[Image.Image]] = None
+        # 图块坐标 -> (渲染质量, PhotoImage, 画布对象ID)
+        self._tiles: Dict[Tuple[int, int], Tuple[int, ImageTk.PhotoImage, int]] = {}
+        # 正在渲染的(图块坐标, 渲染质量)
+        self._pending: Set[Tuple[Tuple[int, int], int]] = set()
+        self._generation = 0
+        self._settle_job: Optional[str] = None
+
+    @property
+    def display_size(self) -> Tuple[int, int]:
+        """当前视图下整张图片的显示尺寸。"""
+        if self._source_size is None:
+            return 0, 0
+        width, height = self._source_size
+        if self.rotation % 180 != 0:
+            width, height = height, width
+        return max(1, int(width * self.scale)), max(1, int(height * self.scale))
+
+    def set_image(self, image: Image.Image) -> None:
+        """设置要渲染的图片，金字塔在后台生成后开始渲染。
+
+        Args:
+            :param image: 要渲染的图片
+
+        Returns:
+            :return 无返回值
+        """
+        self.clear()
+        self._source_size = image.size
+        self._update_scrollregion()
+        self.decoder.submit(build_pyramid, image, self.tile_size,
+                            callback=self._on_pyramid, group=(self, "pyramid"))
+
+    def clear(self) -> None:
+        """清除图片和画布上的全部图块。
+
+        Returns:
+            :return 无返回值
+        """
+        self._invalidate()
+        self.decoder.cancel_group((self, "pyramid"))
+        self._source_size = None
+        self._base_levels = None
+        self._levels = None
+
+    def set_view(self, scale: float, rotation: int, interactive: bool = True) -> None:
+        """设置缩放比例和旋转角度。
+
+        交互操作时先用快速滤镜渲染，停止操作后自动进行高质量重绘。
+
+        Args:
+            :param scale: 缩放比例
+            :param rotation: 旋转角度
+            :param interactive: 是否处于交互操作中
+
+        Returns:
+            :return 无返回值
+        """
+        if scale == self.scale and rotation == self.rotation:
+            self.render(QUALITY_FAST if interactive else QUALITY_HIGH)
+            return
+
+        rotation_changed = rotation != self.rotation
+        self._invalidate()
+        self.scale = scale
+        self.rotation = rotation
+        self._update_scrollregion()
+
+        if rotation_changed:
+            self._levels = None
+        if self._levels is None:
+            # 旋转后的金字塔同样在后台生成；原始金字塔尚未生成时由_on_pyramid继续处理
+            self._submit_rotation()
+            return
+
+        if interactive:
+            self.render(QUALITY_FAST)
+            self._schedule_settle()
+        else:
+            self.render(QUALITY_HIGH)
+
+    def render(self, quality: int = QUALITY_HIGH) -> None:
+        """渲染当前可视区域内缺少的图块，并移除远离可视区域的图块。
+
+        Args:
+            :param quality: 渲染质量
+
+        Returns:
+            :return 无返回值
+        """
+        if not self._levels:
+            return
+
+        visible = self._visible_tiles()
+        self._prune(visible)
+
+        level, factor_x, factor_y = self._pick_level()
+        display_width, display_height = self.display_size
+        for tile in visible:
+            current = self._tiles.get(tile)
+            if current is not None and current[0] >= quality:
+                continue
+            if (tile, quality) in self._pending:
+                continue
+
+            x0 = tile[0] * self.tile_size
+            y0 = tile[1] * self.tile_size
+            x1 = min(x0 + self.tile_size, display_width)
+            y1 = min(y0 + self.tile_size, display_height)
+            box = (x0 * factor_x, y0 * factor_y, x1 * factor_x, y1 * factor_y)
+
+            self._pending.add((tile, quality))
+            generation = self._generation
+            self.decoder.submit(
+                render_tile, level, box, (x1 - x0, y1 - y0), quality,
+                callback=lambda image, t=tile, q=quality, g=generation: self._on_tile(t, q, g, image),
+                group=self._group()
+            )
+
+    def _pick_level(self) -> Tuple[Image.Image, float, float]:
+        """选取分辨率不低于显示需求的最小层级。
+
+        Returns:
+            :return (层级图片, 横向换算系数, 纵向换算系数)，系数用于把显示坐标换算为该层坐标
+        """
+        display_width, display_height = self.display_size
+        chosen = self._levels[0]
+        for level in self._levels:
+            if level.width >= display_width and level.height >= display_height:
+                chosen = level
+            else:
+                break
+        return chosen, chosen.width / display_width, chosen.height / display_height
+
+    def _visible_tiles(self) -> List[Tuple[int, int]]:
+        """计算与画布可视区域相交的图块坐标。"""
+        display_width, display_height = self.display_size
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        right = min(display_width, left + max(1, self.canvas.winfo_width()))
+        bottom = min(display_height, top + max(1, self.canvas.winfo_height()))
+        if right <= left or bottom <= top:
+            return []
+        return [
+            (tx, ty)
+            for ty in range(top // self.tile_size, (bottom - 1) // self.tile_size + 1)
+            for tx in range(left // self.tile_size, (right - 1) // self.tile_size + 1)
+        ]
+
+    def _prune(self, visible: List[Tuple[int, int]]) -> None:
+        """移除距离可视区域超过一个图块的图块，释放PhotoImage占用的内存。"""
+        if not visible:
+            return
+        min_x = min(tile[0] for tile in visible) - 1
+        max_x = max(tile[0] for tile in visible) + 1
+        min_y = min(tile[1] for tile in visible) - 1
+        max_y = max(tile[1] for tile in visible) + 1
+        for tile in list(self._tiles):
+            if not (min_x <= tile[0] <= max_x and min_y <= tile[1] <= max_y):
+                _, _, item = self._tiles.pop(tile)
+                self.canvas.delete(item)
+
+    def _on_pyramid(self, levels: List[Image.Image]) -> None:
+        """金字塔生成完成的回调。"""
+        self._base_levels = levels
+        logger.debug(f"图片金字塔生成完成，共 {len(levels)} 层")
+        if self.rotation % 360:
+            self._submit_rotation()
+        else:
+            self._levels = levels
+            self.render(QUALITY_HIGH)
+
+    def _submit_rotation(self) -> None:
+        """在后台生成当前旋转角度的金字塔。"""
+        if self._base_levels is None:
+            return
+        rotation = self.rotation
+        self.decoder.submit(rotate_pyramid, self._base_levels, rotation,
+                            callback=lambda levels: self._on_rotated(levels, rotation),
+                            group=self._group())
+
+    def _on_rotated(self, levels: List[Image.Image], rotation: int) -> None:
+        """旋转后的金字塔生成完成的回调。"""
+        if rotation != self.rotation:
+            return
+        self._levels = levels
+        self.render(QUALITY_FAST)
+        self._schedule_settle()
+
+    def _on_tile(self, tile: Tuple[int, int], quality: int, generation: int, image: Image.Image) -> None:
+        """图块渲染完成的回调。"""
+        self._pending.discard((tile, quality))
+        if generation != self._generation:
+            return
+        current = self._tiles.get(tile)
+        if current is not None and current[0] > quality:
+            return
+
+        photo = ImageTk.PhotoImage(image)
+        if current is not None:
+            item = current[2]
+            self.canvas.itemconfigure(item, image=photo)
+        else:
+            item = self.canvas.create_image(tile[0] * self.tile_size, tile[1] * self.tile_size,
+                                            anchor=tk.NW, image=photo, tags=TILE_TAG)
+        self._tiles[tile] = (quality, photo, item)
+
+    def _schedule_settle(self) -> None:
+        """安排停止交互后的高质量重绘。"""
+        if self._settle_job is not None:
+            self.canvas.after_cancel(self._settle_job)
+        self._settle_job = self.canvas.after(self.settle_delay, self._settle)
+
+    def _settle(self) -> None:
+        """高质量重绘可视区域。"""
+        self._settle_job = None
+        self.render(QUALITY_HIGH)
+
+    def _invalidate(self) -> None:
+        """作废当前视图的全部图块和未完成的任务。"""
+        self.decoder.cancel_group(self._group())
+        self._generation += 1
+        self._pending.clear()
+        self._tiles.clear()
+        self.canvas.delete(TILE_TAG)
+        if self._settle_job is not None:
+            self.canvas.after_cancel(self._settle_job)
+            self._settle_job = None
+
+    def _group(self) -> Hashable:
+        """当前视图的任务分组。"""
+        return self, self._generation
+
+    def _update_scrollregion(self) -> None:
+        """按当前视图的显示尺寸更新画布滚动区域。"""
+        width, height = self.display_size
+        self.canvas.configure(scrollregion=(0, 0, width, height))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/28
+# @File    : keepalive.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端连接保活与往返时延测量模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端连接保活与往返时延测量模块。
+
+本模块在独立线程中监视连接：记录最后一次收到数据的时间，连接空闲时发送探测请求。
+现有服务器不一定回复探测请求，空闲本身不能说明连接已断开，因此只在服务器回复过探测请求之后才主动判定：
+    某次探测请求超时，或者（配置了dead_timeout时）空闲超过dead_timeout，判定连接已断开；
+在此之前只有recv出错才会断开连接。
+
+往返时延(RTT)来自每一对请求和响应：发送时记录时间，响应到达时计算差值，
+按RFC 6298的方式维护平滑RTT和RTT偏差（即抖动）。
+"""
+
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# 检查连接状态的间隔（秒）
+CHECK_INTERVAL = 1.0
+# 连接空闲超过该时间后发送探测请求（秒）
+PROBE_INTERVAL = 15.0
+# 探测请求的超时时间（秒）
+PROBE_TIMEOUT = 10.0
+# 服务器回复过探测请求后，超过该时间没有收到任何数据时判定连接已断开（秒），None表示只按探测超时判定
+DEAD_TIMEOUT: Optional[float] = None
+# 平滑RTT和RTT偏差的权重（RFC 6298）
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+
+
+class ConnectionStatus(NamedTuple):
+    """连接状态快照。"""
+    alive: bool  # 连接是否存活
+    rtt: Optional[float]  # 平滑往返时延（秒），尚无样本时为None
+    jitter: Optional[float]  # 往返时延偏差（秒）
+    idle: float  # 距最后一次收到数据的时间（秒）
+    samples: int  # RTT样本数
+
+
+class RttEstimator:
+    """往返时延估计类，按RFC 6298维护平滑RTT和RTT偏差。"""
+
+    def __init__(self, alpha: float = RTT_ALPHA, beta: float = RTT_BETA) -> None:
+        """初始化估计器。
+
+        Args:
+            :param alpha: 平滑RTT的权重
+            :param beta: RTT偏差的权重
+
+        Returns:
+            :return 无返回值
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.samples = 0
+
+    def sample(self, rtt: float) -> None:
+        """加入一个RTT样本。
+
+        Args:
+            :param rtt: 往返时延（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            # 先用旧的平滑RTT更新偏差，再更新平滑RTT
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.samples += 1
+
+
+class Keepalive:
+    """连接保活类。
+
+    由ClientNetwork创建：每收到一个数据包调用on_received，每完成一对请求和响应调用record_rtt。
+    """
+
+    def __init__(self, send_probe: Callable[[], None], on_dead: Callable[[str], None],
+                 probe_interval: float = PROBE_INTERVAL, dead_timeout: Optional[float] = DEAD_TIMEOUT) -> None:
+        """初始化保活监视器。
+
+        Args:
+            :param send_probe: 发送探测请求的函数
+            :param on_dead: 判定连接断开时调用的函数，参数为原因
+            :param probe_interval: 空闲多久后发送探测请求（秒）
+            :param dead_timeout: 服务器回复过探测请求后，空闲多久判定连接断开（秒），None表示不按空闲时间判定
+
+        Returns:
+            :return 无返回值
+        """
+        self.send_probe = send_probe
+        self.on_dead = on_dead
+        self.probe_interval = probe_interval
+        self.dead_timeout = dead_timeout
+
+        self.estimator = RttEstimator()
+        self.alive = False
+        # 服务器是否回复过探测请求，回复过之后探测超时才说明连接已断开
+        self.answers_probes = False
+        self._lock = threading.Lock()
+        self._last_received = time.monotonic()
+        self._last_probe = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """连接建立后开始监视。
+
+        Returns:
+            :return 无返回值
+        """
+        if self._thread is not None:
+            return
+        self.alive = True
+        self._last_received = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止监视。
+
+        Returns:
+            :return 无返回值
+        """
+        self._stop.set()
+
+    def on_received(self) -> None:
+        """收到任意数据包时调用，刷新最后接收时间。
+
+        Returns:
+            :return 无返回值
+        """
+        self._last_received = time.monotonic()
+
+    def on_probe_answered(self) -> None:
+        """探测请求收到响应时调用。
+
+        Returns:
+            :return 无返回值
+        """
+        self.answers_probes = True
+
+    def on_probe_timeout(self) -> None:
+        """探测请求超时时调用：服务器回复过探测请求时判定连接已断开，否则忽略。
+
+        Returns:
+            :return 无返回值
+        """
+        if not self.answers_probes or not self.alive:
+            logger.debug("探测请求没有响应，服务器可能不回复探测请求")
+            return
+        self._declare_dead(f"探测请求{PROBE_TIMEOUT:.0f}秒内没有响应")
+
+    def _declare_dead(self, reason: str) -> None:
+        """判定连接已断开并通知网络模块。"""
+        self.alive = False
+        self._stop.set()
+        logger.warning(f"判定连接已断开: {reason}")
+        self.on_dead(reason)
+
+    def record_rtt(self, rtt: float) -> None:
+        """记录一个请求的往返时延。
+
+        Args:
+            :param rtt: 往返时延（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            self.estimator.sample(rtt)
+
+    def status(self) -> ConnectionStatus:
+        """当前连接状态快照，可以从任意线程调用。
+
+        Returns:
+            :return 连接状态
+        """
+        with self._lock:
+            return ConnectionStatus(self.alive, self.estimator.srtt, self.estimator.rttvar,
+                                    time.monotonic() - self._last_received, self.estimator.samples)
+
+    def _run(self) -> None:
+        """监视线程主循环。"""
+        while not self._stop.wait(CHECK_INTERVAL):
+            now = time.monotonic()
+            idle = now - self._last_received
+            if self.answers_probes and self.dead_timeout is not None and idle > self.dead_timeout:
+                self._declare_dead(f"{idle:.0f}秒未收到服务器数据")
+                return
+            if idle > self.probe_interval and now - self._last_probe > self.probe_interval:
+                self._last_probe = now
+                logger.debug(f"连接已空闲{idle:.0f}秒，发送探测请求")
+                self.send_probe()
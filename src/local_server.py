@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/30
+# @File    : local_server.py
+# @Software: PyCharm
+# @Desc    : WritePapers本地替身服务器模块
+# @Author  : Kevin Chang
+
+"""WritePapers本地替身服务器模块。
+
+本模块在本机实现networking.py中描述的协议，用于没有线上服务器时的联调和压力测试：
+    login / register_account / send_message（转发为new_message）/ get_offline_messages /
+    heartbeat / add_friend / get_friend_token / change_friend_token。
+带有request_id的请求在响应中原样带回request_id。数据只保存在内存中，重启后清空。
+
+压力测试模式模拟N个好友，每个好友按给定速率向目标用户发送消息，
+用于在一台Linux机器上测量客户端的吞吐量和延迟（new_message中的send_time就是发送时刻）。
+
+用法：
+    python local_server.py                                   # 只提供协议
+    python local_server.py --peers 50 --rate 2 --duration 60 # 50个好友每人每秒2条，持续60秒
+"""
+
+import argparse
+import base64
+import itertools
+import os
+import random
+import secrets
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+import codec
+
+logger = structlog.get_logger()
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 3624
+# 向每个在线客户端发送心跳的间隔（秒）
+HEARTBEAT_INTERVAL = 30.0
+# 新注册用户的起始UID
+FIRST_UID = 10000
+# 压力测试账号的用户名前缀和密码（用户名为load0、load1……）
+LOAD_ACCOUNT_PREFIX = "load"
+LOAD_ACCOUNT_PASSWORD = "load"
+
+
+class User:
+    """服务器端的用户记录。"""
+
+    __slots__ = ("uid", "username", "password", "name", "friend_token", "friends")
+
+    def __init__(self, uid: int, username: str, password: str) -> None:
+        self.uid = uid
+        self.username = username
+        self.password = password
+        self.name = username
+        self.friend_token = secrets.token_hex(4)
+        self.friends: set = set()
+
+
+class UserStore:
+    """内存中的用户、会话令牌和离线消息，所有方法都可以从多个连接线程调用。"""
+
+    def __init__(self) -> None:
+        """初始化空的用户表。
+
+        Returns:
+            :return 无返回值
+        """
+        self._lock = threading.Lock()
+        self._uids = itertools.count(FIRST_UID)
+        self.users: Dict[int, User] = {}
+        self._by_username: Dict[str, User] = {}
+        self._tokens: Dict[str, int] = {}
+        # 离线消息格式与客户端一致: [content, from_user, to_user, timestamp, message_type]
+        self._offline: Dict[int, List[list]] = {}
+
+    def register(self, username: str, password: str) -> Optional[User]:
+        """注册新用户。
+
+        Args:
+            :param username: 用户名
+            :param password: 密码
+
+        Returns:
+            :return 新用户，用户名已被使用时返回None
+        """
+        with self._lock:
+            if not username or username in self._by_username:
+                return None
+            user = User(next(self._uids), username, password)
+            self.users[user.uid] = user
+            self._by_username[username] = user
+            return user
+
+    def authenticate(self, username: str, password: str) -> Optional[str]:
+        """校验用户名和密码，成功时发放新的令牌。
+
+        Args:
+            :param username: 用户名
+            :param password: 密码
+
+        Returns:
+            :return 令牌，校验失败返回None
+        """
+        with self._lock:
+            user = self._by_username.get(username)
+            if user is None or user.password != password:
+                return None
+            token = secrets.token_hex(16)
+            self._tokens[token] = user.uid
+            return token
+
+    def uid_for_token(self, token: Optional[str]) -> Optional[int]:
+        """根据令牌查找用户UID。"""
+        return self._tokens.get(token)
+
+    def find(self, id_type: str, value: Any) -> Optional[User]:
+        """按UID或用户名查找用户。
+
+        Args:
+            :param id_type: "uid"或"username"
+            :param value: UID或用户名
+
+        Returns:
+            :return 用户，不存在时返回None
+        """
+        if id_type == "uid":
+            try:
+                return self.users.get(int(value))
+            except (TypeError, ValueError):
+                return None
+        return self._by_username.get(value)
+
+    def befriend(self, a: User, b: User) -> None:
+        """建立双向好友关系。"""
+        with self._lock:
+            a.friends.add(b.uid)
+            b.friends.add(a.uid)
+
+    def store_offline(self, to_uid: int, record: list) -> None:
+        """保存一条离线消息。"""
+        with self._lock:
+            self._offline.setdefault(to_uid, []).append(record)
+
+    def take_offline(self, uid: int) -> List[list]:
+        """取出并清空某用户的离线消息。"""
+        with self._lock:
+            return self._offline.pop(uid, [])
+
+
+def provision_load_accounts(store: UserStore, count: int) -> List[User]:
+    """注册压力测试账号，已存在的账号直接返回。
+
+    Args:
+        :param store: 用户表
+        :param count: 账号数量
+
+    Returns:
+        :return 按编号排列的账号列表
+    """
+    accounts = []
+    for i in range(count):
+        username = f"{LOAD_ACCOUNT_PREFIX}{i}"
+        accounts.append(store.find("username", username) or store.register(username, LOAD_ACCOUNT_PASSWORD))
+    return accounts
+
+
+class Session:
+    """一个客户端连接。"""
+
+    def __init__(self, conn: socket.socket, address, encoder: codec.EnvelopeEncoder) -> None:
+        """初始化会话。
+
+        Args:
+            :param conn: 客户端套接字
+            :param address: 客户端地址
+            :param encoder: 数据包编码器
+
+        Returns:
+            :return 无返回值
+        """
+        self.conn = conn
+        self.address = address
+        self.encoder = encoder
+        self.uid: Optional[int] = None
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message_type: str, payload: Any, request_id: Optional[int] = None) -> bool:
+        """向客户端发送一个数据包（服务端数据包的token为null）。
+
+        Args:
+            :param message_type: 消息类型
+            :param payload: 消息载荷数据
+            :param request_id: 原样带回的请求ID
+
+        Returns:
+            :return 发送成功返回True
+        """
+        frame = self.encoder.frame(message_type, None, payload, request_id)
+        try:
+            with self._send_lock:
+                self.conn.sendall(frame)
+            return True
+        except OSError:
+            self.closed = True
+            return False
+
+
+class LocalServer:
+    """WritePapers本地替身服务器类，每个连接一个线程。"""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL) -> None:
+        """初始化服务器。
+
+        Args:
+            :param host: 监听地址
+            :param port: 监听端口，0表示由系统分配
+            :param heartbeat_interval: 心跳间隔（秒），0表示不发送心跳
+
+        Returns:
+            :return 无返回值
+        """
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.store = UserStore()
+        self.codec = codec.get_codec()
+        self.encoder = codec.EnvelopeEncoder(self.codec)
+        self._sessions: Dict[int, Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._stop = threading.Event()
+        self.handlers: Dict[str, Callable[[Session, Dict[str, Any], Dict[str, Any]], None]] = {
+            "login": self._handle_login,
+            "register_account": self._handle_register,
+            "send_message": self._handle_send_message,
+            "get_offline_messages": self._handle_get_offline_messages,
+            "heartbeat": self._handle_heartbeat,
+            "add_friend": self._handle_add_friend,
+            "get_friend_token": self._handle_get_friend_token,
+            "change_friend_token": self._handle_change_friend_token,
+        }
+        # 不需要令牌的请求
+        self.public_types = {"login", "register_account", "heartbeat"}
+
+    def start(self) -> int:
+        """开始监听并在后台线程中接受连接。
+
+        Returns:
+            :return 实际监听的端口
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen()
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="accept", daemon=True).start()
+        if self.heartbeat_interval > 0:
+            threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True).start()
+        logger.info(f"本地服务器已在{self.host}:{self.port}监听")
+        return self.port
+
+    def stop(self) -> None:
+        """停止服务器并断开所有连接。
+
+        Returns:
+            :return 无返回值
+        """
+        self._stop.set()
+        if self._sock is not None:
+            self._sock.close()
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            try:
+                session.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def online(self, uid: int) -> Optional[Session]:
+        """某用户的在线会话。"""
+        return self._sessions.get(uid)
+
+    def deliver(self, from_uid: int, to_uid: int, content: str, message_type: str = "text",
+                send_time: Optional[float] = None) -> bool:
+        """把一条消息投递给接收者，不在线时保存为离线消息。
+
+        Args:
+            :param from_uid: 发送者UID
+            :param to_uid: 接收者UID
+            :param content: 消息内容，图片为base64字符串
+            :param message_type: "text"或"image"
+            :param send_time: 发送时间戳，None表示当前时间
+
+        Returns:
+            :return 实时送达返回True，保存为离线消息返回False
+        """
+        send_time = time.time() if send_time is None else send_time
+        session = self.online(to_uid)
+        if session is not None and session.send("new_message", {
+            "from_user": from_uid,
+            "send_time": send_time,
+            "message_type": message_type,
+            "message_content": content,
+        }):
+            return True
+        self.store.store_offline(to_uid, [content, from_uid, to_uid, send_time, message_type])
+        return False
+
+    def _accept_loop(self) -> None:
+        """接受新连接。"""
+        while not self._stop.is_set():
+            try:
+                conn, address = self._sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = Session(conn, address, self.encoder)
+            threading.Thread(target=self._serve, args=(session,), name=f"session-{address[1]}",
+                             daemon=True).start()
+
+    def _serve(self, session: Session) -> None:
+        """连接线程主循环：读取数据包并按类型分发。"""
+        logger.info(f"客户端{session.address}已连接")
+        session.send("server_hello", {"message": "Hello from local server"})
+        conn = session.conn
+        try:
+            while not self._stop.is_set():
+                length_bytes = conn.recv(4, socket.MSG_WAITALL)
+                if len(length_bytes) < 4:
+                    break
+                length = int.from_bytes(length_bytes, byteorder="big")
+                body = conn.recv(length, socket.MSG_WAITALL)
+                if len(body) < length:
+                    break
+                try:
+                    msg = self.codec.loads(body)
+                except ValueError as e:
+                    logger.warning(f"来自{session.address}的数据包无法解析: {e}")
+                    continue
+                self._dispatch(session, msg)
+        except OSError as e:
+            logger.warning(f"客户端{session.address}连接错误: {e}")
+        finally:
+            session.closed = True
+            with self._sessions_lock:
+                if session.uid is not None and self._sessions.get(session.uid) is session:
+                    del self._sessions[session.uid]
+            conn.close()
+            logger.info(f"客户端{session.address}已断开")
+
+    def _dispatch(self, session: Session, msg: Dict[str, Any]) -> None:
+        """校验令牌并调用对应的处理函数。"""
+        message_type = msg.get("type", "")
+        handler = self.handlers.get(message_type)
+        if handler is None:
+            logger.warning(f"收到未知请求类型: {message_type}")
+            return
+        if message_type not in self.public_types and self.store.uid_for_token(msg.get("token")) is None:
+            logger.warning(f"请求{message_type}的令牌无效，已忽略")
+            return
+        try:
+            handler(session, msg.get("payload") or {}, msg)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"请求{message_type}的格式错误: {e}")
+
+    def _handle_login(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """登录：校验成功后登记在线会话并发送欢迎消息。"""
+        token = self.store.authenticate(payload.get("username", ""), payload.get("password", ""))
+        if token is None:
+            session.send("login_result", {"success": False}, msg.get("request_id"))
+            return
+        uid = self.store.uid_for_token(token)
+        session.uid = uid
+        with self._sessions_lock:
+            self._sessions[uid] = session
+        session.send("login_result", {"success": True, "uid": uid, "token": token}, msg.get("request_id"))
+        session.send("welcome_back", {"message": f"欢迎回来，{self.store.users[uid].name}"})
+
+    def _handle_register(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """注册账号。"""
+        user = self.store.register(payload.get("username", ""), payload.get("password", ""))
+        if user is None:
+            session.send("register_result", {"success": False}, msg.get("request_id"))
+            return
+        session.send("register_result", {"success": True, "uid": user.uid, "username": user.username,
+                                         "password": user.password}, msg.get("request_id"))
+
+    def _handle_send_message(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """发送消息：转发给接收者或保存为离线消息。"""
+        from_uid = self.store.uid_for_token(msg.get("token"))
+        to_uid = int(payload["to_user"])
+        success = to_uid in self.store.users
+        if success:
+            self.deliver(from_uid, to_uid, payload["message"], payload.get("type", "text"))
+        session.send("send_message_result", {"success": success}, msg.get("request_id"))
+
+    def _handle_get_offline_messages(self, session: Session, payload: Dict[str, Any],
+                                     msg: Dict[str, Any]) -> None:
+        """拉取并清空离线消息。"""
+        uid = self.store.uid_for_token(msg.get("token"))
+        session.send("offline_messages", self.store.take_offline(uid), msg.get("request_id"))
+
+    def _handle_heartbeat(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """心跳：客户端的探测请求带有request_id，需要回复；对服务器心跳的回复无需处理。"""
+        if msg.get("request_id") is not None:
+            session.send("heartbeat_result", {"content": "pong"}, msg["request_id"])
+
+    def _handle_add_friend(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """添加好友：校验对方的好友口令。"""
+        user = self.store.users[self.store.uid_for_token(msg.get("token"))]
+        friend = self.store.find(payload.get("friend_id_type", "uid"), payload.get("friend_id"))
+        if friend is None or friend is user or friend.friend_token != payload.get("verify_token"):
+            session.send("add_friend_result", {"success": False}, msg.get("request_id"))
+            return
+        self.store.befriend(user, friend)
+        session.send("add_friend_result", {"success": True, "friend_uid": friend.uid,
+                                           "friend_username": friend.username, "friend_name": friend.name},
+                     msg.get("request_id"))
+
+    def _handle_get_friend_token(self, session: Session, payload: Dict[str, Any], msg: Dict[str, Any]) -> None:
+        """获取自己的好友口令。"""
+        user = self.store.users[self.store.uid_for_token(msg.get("token"))]
+        session.send("friend_token_result", {"friend_token": user.friend_token}, msg.get("request_id"))
+
+    def _handle_change_friend_token(self, session: Session, payload: Dict[str, Any],
+                                    msg: Dict[str, Any]) -> None:
+        """修改自己的好友口令。"""
+        user = self.store.users[self.store.uid_for_token(msg.get("token"))]
+        user.friend_token = str(payload["new_friend_token"])
+
+    def _heartbeat_loop(self) -> None:
+        """定时向所有在线客户端发送心跳。"""
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._sessions_lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                session.send("heartbeat", {"content": "Health check"})
+
+
+class LoadGenerator:
+    """压力测试类：模拟多个好友按固定速率向目标用户发送消息。"""
+
+    def __init__(self, server: LocalServer, target: User, peers: int = 10, rate: float = 1.0,
+                 image_ratio: float = 0.0, image_size: int = 64 * 1024) -> None:
+        """创建模拟好友并与目标用户建立好友关系。
+
+        Args:
+            :param server: 本地服务器
+            :param target: 接收消息的目标用户
+            :param peers: 模拟好友数量
+            :param rate: 每个好友每秒发送的消息数
+            :param image_ratio: 图片消息所占比例（0~1）
+            :param image_size: 图片消息的原始字节数
+
+        Returns:
+            :return 无返回值
+        """
+        self.server = server
+        self.target = target
+        self.rate = rate
+        self.image_ratio = image_ratio
+        self.peers: List[User] = []
+        for i in range(peers):
+            peer = server.store.find("username", f"peer{i}") or server.store.register(f"peer{i}", "peer")
+            server.store.befriend(target, peer)
+            self.peers.append(peer)
+        self._image = base64.b64encode(os.urandom(image_size)).decode("ascii") if image_ratio > 0 else ""
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.delivered = 0
+
+    def run(self, duration: float) -> None:
+        """运行压力测试，阻塞直到结束。
+
+        每个好友一个线程，按rate均匀发送；结束后打印实际发送速率。
+
+        Args:
+            :param duration: 持续时间（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        logger.info(f"开始压力测试：{len(self.peers)}个好友，每人{self.rate}条/秒，持续{duration}秒")
+        start = time.monotonic()
+        deadline = start + duration
+        threads = [threading.Thread(target=self._peer_loop, args=(peer, deadline), daemon=True)
+                   for peer in self.peers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        logger.info(f"压力测试结束：共发送{self.sent}条（{self.sent / elapsed:.1f}条/秒），"
+                    f"实时送达{self.delivered}条，其余保存为离线消息")
+
+    def _peer_loop(self, peer: User, deadline: float) -> None:
+        """单个模拟好友的发送循环。"""
+        interval = 1.0 / self.rate if self.rate > 0 else float("inf")
+        # 随机错开各好友的起始时间，避免所有消息同时到达
+        next_send = time.monotonic() + random.uniform(0, min(interval, 1.0))
+        sequence = 0
+        while True:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if time.monotonic() >= deadline:
+                return
+            sequence += 1
+            if self._image and random.random() < self.image_ratio:
+                delivered = self.server.deliver(peer.uid, self.target.uid, self._image, "image")
+            else:
+                delivered = self.server.deliver(peer.uid, self.target.uid, f"{peer.username}的第{sequence}条消息")
+            with self._lock:
+                self.sent += 1
+                self.delivered += delivered
+            next_send += interval
+
+
+def main(argv: Optional[list] = None) -> None:
+    """命令行入口。"""
+    parser = argparse.ArgumentParser(description="WritePapers本地替身服务器")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--user", default="admin:admin", help="预先注册的账号，格式为用户名:密码")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL, help="心跳间隔（秒），0表示不发送")
+    parser.add_argument("--peers", type=int, default=0, help="压力测试的模拟好友数量，0表示不进行压力测试")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个模拟好友每秒发送的消息数")
+    parser.add_argument("--duration", type=float, default=60.0, help="压力测试持续时间（秒）")
+    parser.add_argument("--image-ratio", type=float, default=0.0, help="图片消息所占比例（0~1）")
+    parser.add_argument("--wait-login", action="store_true", help="目标用户登录后才开始压力测试")
+    parser.add_argument("--accounts", type=int, default=0,
+                        help=f"预先注册的压力测试账号数量（{LOAD_ACCOUNT_PREFIX}0、{LOAD_ACCOUNT_PREFIX}1……，"
+                             f"密码为{LOAD_ACCOUNT_PASSWORD}），供多客户端压力测试使用")
+    args = parser.parse_args(argv)
+
+    server = LocalServer(args.host, args.port, args.heartbeat)
+    username, _, password = args.user.partition(":")
+    target = server.store.register(username, password)
+    logger.info(f"已注册账号{username}，UID为{target.uid}，好友口令为{target.friend_token}")
+    if args.accounts > 0:
+        provision_load_accounts(server.store, args.accounts)
+        logger.info(f"已注册{args.accounts}个压力测试账号")
+    server.start()
+    try:
+        if args.peers > 0:
+            generator = LoadGenerator(server, target, args.peers, args.rate, args.image_ratio)
+            if args.wait_login:
+                logger.info(f"等待{username}登录")
+                while server.online(target.uid) is None:
+                    time.sleep(0.1)
+            generator.run(args.duration)
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/1
+# @File    : log_setup.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端日志配置模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端日志配置模块。
+
+热路径上的日志开销分三部分，分别处理：
+    格式化：按级别过滤的BoundLogger在调用时就判断级别，被过滤的方法是空函数；
+            事件名使用固定字符串，变量作为字段传入，只有真正输出时才由ConsoleRenderer格式化。
+            代价高的字段（大段消息内容、图片数据）用lazy()包装，输出前才计算；
+    数量：逐条消息的事件带上per_message=True，同一事件每SAMPLE_EVERY条只输出一条，并附带sampled字段；
+    I/O：渲染好的日志行放入有界队列，由log-writer线程写出，界面线程和网络线程不会阻塞在终端输出上。
+         队列满时丢弃并计入log.dropped指标。
+
+级别默认由debug/enabled决定（调试模式为debug，否则为info），可以用debug/log_level覆盖；
+采样间隔可以用debug/log_sample覆盖，1表示不采样。
+
+用法：
+    log_setup.configure()
+    logger.debug("加载历史消息", message=log_setup.lazy(log_setup.truncate, msg), per_message=True)
+"""
+
+import atexit
+import logging
+import queue
+import sys
+import threading
+from typing import Any, Callable, Dict, Optional, TextIO
+
+import structlog
+
+import metrics
+import paperlib as lib
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+# 逐条消息事件的默认采样间隔：每SAMPLE_EVERY条输出一条
+SAMPLE_EVERY = 20
+# 日志队列长度，超过后丢弃新日志
+QUEUE_SIZE = 10000
+# truncate保留的最大字符数
+TRUNCATE_LIMIT = 250
+
+_dropped = metrics.registry.counter("log.dropped")
+
+
+class Lazy:
+    """延迟计算的日志字段，只有事件真正输出时才调用func。"""
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: Callable[..., Any], *args) -> None:
+        self.func = func
+        self.args = args
+
+    def __call__(self) -> Any:
+        return self.func(*self.args)
+
+
+def lazy(func: Callable[..., Any], *args) -> Lazy:
+    """把日志字段包装为延迟计算。
+
+    Args:
+        :param func: 计算字段值的函数
+        :param args: 传给func的参数
+
+    Returns:
+        :return 延迟字段
+    """
+    return Lazy(func, *args)
+
+
+def truncate(value: Any, limit: int = TRUNCATE_LIMIT) -> str:
+    """把字段值转为有限长度的文本，二进制数据只解码前limit个字节。
+
+    Args:
+        :param value: 字段值
+        :param limit: 保留的最大字符数
+
+    Returns:
+        :return 文本，被截断时在末尾注明总长度
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        total = len(value)
+        text = bytes(value[:limit]).decode("utf-8", "replace")
+    else:
+        text = repr(value)
+        total = len(text)
+        text = text[:limit]
+    if total > limit:
+        return f"{text}...（共{total}字符）"
+    return text
+
+
+def resolve_lazy(_, __, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """structlog处理器：计算事件中的延迟字段。"""
+    for key, value in event_dict.items():
+        if isinstance(value, Lazy):
+            try:
+                event_dict[key] = value()
+            except Exception as e:
+                event_dict[key] = f"<计算日志字段失败: {e}>"
+    return event_dict
+
+
+class Sampler:
+    """structlog处理器：对带per_message=True的事件按事件名采样。"""
+
+    def __init__(self, every: int = SAMPLE_EVERY) -> None:
+        """初始化采样处理器。
+
+        Args:
+            :param every: 每隔多少条输出一条，1表示全部输出
+
+        Returns:
+            :return 无返回值
+        """
+        self.every = max(1, every)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, _, __, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        if not event_dict.pop("per_message", False) or self.every == 1:
+            return event_dict
+        event = str(event_dict.get("event"))
+        with self._lock:
+            count = self._counts.get(event, 0)
+            self._counts[event] = count + 1
+        if count % self.every:
+            raise structlog.DropEvent
+        event_dict["sampled"] = f"1/{self.every}"
+        return event_dict
+
+
+class QueueSink:
+    """日志队列类，后台线程把渲染好的日志行写入输出流。"""
+
+    def __init__(self, stream: Optional[TextIO] = None, size: int = QUEUE_SIZE) -> None:
+        """初始化并启动写出线程。
+
+        Args:
+            :param stream: 输出流，默认为sys.stdout
+            :param size: 队列长度
+
+        Returns:
+            :return 无返回值
+        """
+        self.stream = stream
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(size)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        metrics.registry.gauge("log.queue_depth", self._queue.qsize)
+
+    def put(self, line: str) -> None:
+        """放入一行日志，队列满时丢弃。"""
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            _dropped.inc()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """写完队列中剩余的日志后停止写出线程。"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        """写出线程主循环，一次取出队列中已有的所有日志行后再刷新输出流。"""
+        while True:
+            lines = [self._queue.get()]
+            try:
+                while True:
+                    lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stream = self.stream or sys.stdout
+            for line in lines:
+                if line is None:
+                    stream.flush()
+                    return
+                stream.write(line + "\n")
+            stream.flush()
+
+
+class QueueLogger:
+    """把渲染结果交给QueueSink的structlog底层日志器。"""
+
+    def __init__(self, sink: QueueSink) -> None:
+        self._sink = sink
+
+    def msg(self, message: str) -> None:
+        """写出一行日志。"""
+        self._sink.put(message)
+
+    log = debug = info = warn = warning = error = err = critical = fatal = exception = failure = msg
+
+
+_sink: Optional[QueueSink] = None
+
+
+def _level_from_config() -> int:
+    """从配置文件读取日志级别。"""
+    config = lib.get_config()
+    default = "debug" if config.get_bool("debug/enabled") else "info"
+    name = (config.get("debug/log_level", default) or default).lower()
+    return LEVELS.get(name, LEVELS[default])
+
+
+def _sample_from_config() -> int:
+    """从配置文件读取采样间隔。"""
+    try:
+        return int(lib.get_config().get("debug/log_sample", SAMPLE_EVERY) or SAMPLE_EVERY)
+    except ValueError:
+        return SAMPLE_EVERY
+
+
+def configure(level: Optional[str] = None, sample_every: Optional[int] = None, use_queue: bool = True) -> None:
+    """配置structlog，应在第一次输出日志之前调用。
+
+    Args:
+        :param level: 日志级别名称，None时读取配置文件
+        :param sample_every: 逐条消息事件的采样间隔，None时读取配置文件
+        :param use_queue: 是否通过后台线程写出日志
+
+    Returns:
+        :return 无返回值
+
+    Raises:
+        :raise ValueError: 日志级别名称无效时抛出
+    """
+    global _sink
+    if level is None:
+        level_number = _level_from_config()
+    elif level.lower() in LEVELS:
+        level_number = LEVELS[level.lower()]
+    else:
+        raise ValueError(f"无效的日志级别: {level}，可选值: {', '.join(LEVELS)}")
+    if sample_every is None:
+        sample_every = _sample_from_config()
+
+    if use_queue and _sink is None:
+        _sink = QueueSink()
+        atexit.register(_sink.close)
+    if use_queue:
+        sink = _sink
+        logger_factory = lambda *args: QueueLogger(sink)  # noqa: E731
+    else:
+        logger_factory = structlog.PrintLoggerFactory()
+
+    structlog.configure(
+        processors=[
+            structlog.contextvars.merge_contextvars,
+            Sampler(sample_every),
+            resolve_lazy,
+            structlog.processors.add_log_level,
+            structlog.processors.StackInfoRenderer(),
+            structlog.dev.set_exc_info,
+            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S", utc=False),
+            structlog.dev.ConsoleRenderer(),
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(level_number),
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
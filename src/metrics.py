@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/1
+# @File    : metrics.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端运行指标模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端运行指标模块。
+
+进程内的轻量指标注册表，提供三种指标：
+    Counter：只增不减的计数（数据包数、字节数、错误数）；
+    Gauge：瞬时值，可以直接设置，也可以在读取时调用函数取值（队列长度）；
+    Histogram：耗时分布，使用与tracing相同的对数分桶（相对误差约25%），记录只需一次二分查找。
+
+网络、数据库和界面模块在模块加载时从默认注册表registry取得各自的指标，热路径上只调用inc/record。
+Reporter按固定间隔把快照通过structlog输出，debug_ui.MetricsWindow实时显示。
+
+用法：
+    packets = metrics.registry.counter("net.packets_received")
+    packets.inc()
+
+    with metrics.registry.histogram("db.query").time():
+        ...
+
+    @metrics.timed("ui.render_message")
+    def display_message(self, message):
+        ...
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+import structlog
+
+import tracing
+
+logger = structlog.get_logger()
+
+# 周期输出快照的间隔（秒）
+REPORT_INTERVAL = 60.0
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Counter:
+    """计数器类。"""
+
+    __slots__ = ("name", "value", "_lock")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """增加计数。"""
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        """清零。"""
+        with self._lock:
+            self.value = 0
+
+
+class Gauge:
+    """瞬时值类，设置了取值函数时每次读取都调用该函数。"""
+
+    __slots__ = ("name", "value", "func")
+
+    def __init__(self, name: str, func: Optional[Callable[[], float]] = None) -> None:
+        self.name = name
+        self.value: float = 0
+        self.func = func
+
+    def set(self, value: float) -> None:
+        """设置当前值。"""
+        self.value = value
+
+    def read(self) -> float:
+        """读取当前值，取值函数出错时返回上一次的值。"""
+        if self.func is not None:
+            try:
+                self.value = self.func()
+            except Exception as e:
+                logger.debug(f"读取指标{self.name}失败: {e}")
+        return self.value
+
+    def reset(self) -> None:
+        """瞬时值不需要清零。"""
+
+
+class Histogram:
+    """耗时分布类。"""
+
+    __slots__ = ("name", "_histogram", "_lock")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._histogram = tracing.Histogram()
+        self._lock = threading.Lock()
+
+    def record(self, value: float) -> None:
+        """记录一个样本（秒）。"""
+        with self._lock:
+            self._histogram.record(value)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """记录with代码块的执行时间。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def snapshot(self) -> tracing.HistogramSnapshot:
+        """生成快照。"""
+        with self._lock:
+            return self._histogram.snapshot()
+
+    def reset(self) -> None:
+        """清空样本。"""
+        with self._lock:
+            self._histogram = tracing.Histogram()
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricsRegistry:
+    """指标注册表类，同名指标只创建一次，可以从任意线程使用。"""
+
+    def __init__(self) -> None:
+        """初始化空的注册表。
+
+        Returns:
+            :return 无返回值
+        """
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, kind: type, *args) -> Metric:
+        """取得指定名称的指标，不存在时创建。"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, *args)
+            elif not isinstance(metric, kind):
+                raise TypeError(f"指标{name}已登记为{type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str) -> Counter:
+        """取得计数器。
+
+        Args:
+            :param name: 指标名称
+
+        Returns:
+            :return 计数器
+
+        Raises:
+            :raise TypeError: 同名指标是其他类型时抛出
+        """
+        return self._get(name, Counter)
+
+    def gauge(self, name: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        """取得瞬时值，提供func时替换原有的取值函数。
+
+        Args:
+            :param name: 指标名称
+            :param func: 读取时调用的取值函数
+
+        Returns:
+            :return 瞬时值
+
+        Raises:
+            :raise TypeError: 同名指标是其他类型时抛出
+        """
+        gauge = self._get(name, Gauge)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name: str) -> Histogram:
+        """取得耗时分布。
+
+        Args:
+            :param name: 指标名称
+
+        Returns:
+            :return 耗时分布
+
+        Raises:
+            :raise TypeError: 同名指标是其他类型时抛出
+        """
+        return self._get(name, Histogram)
+
+    def snapshot(self) -> Dict[str, Union[int, float, tracing.HistogramSnapshot]]:
+        """所有指标的快照，按名称排序。
+
+        Returns:
+            :return 指标名称到数值（计数器、瞬时值）或分布快照（耗时分布）的字典
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        result: Dict[str, Union[int, float, tracing.HistogramSnapshot]] = {}
+        for name, metric in metrics:
+            if isinstance(metric, Counter):
+                result[name] = metric.value
+            elif isinstance(metric, Gauge):
+                result[name] = metric.read()
+            else:
+                result[name] = metric.snapshot()
+        return result
+
+    def reset(self) -> None:
+        """清零所有计数器和耗时分布。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def emit(self) -> None:
+        """通过structlog输出一次快照，耗时分布只输出有样本的。
+
+        Returns:
+            :return 无返回值
+        """
+        fields = {}
+        for name, value in self.snapshot().items():
+            if isinstance(value, tracing.HistogramSnapshot):
+                if value.count:
+                    fields[name] = {"count": value.count, "p50_ms": round(value.p50 * 1000, 3),
+                                    "p99_ms": round(value.p99 * 1000, 3), "max_ms": round(value.max * 1000, 3)}
+            else:
+                fields[name] = value
+        logger.info("运行指标", **fields)
+
+
+class Reporter:
+    """定时输出指标快照的后台线程类。"""
+
+    def __init__(self, metrics: MetricsRegistry, interval: float = REPORT_INTERVAL) -> None:
+        """初始化输出线程。
+
+        Args:
+            :param metrics: 指标注册表
+            :param interval: 输出间隔（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """启动输出线程。"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止输出线程。"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        """输出线程主循环。"""
+        while not self._stop.wait(self.interval):
+            self.metrics.emit()
+
+
+registry = MetricsRegistry()
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """装饰器：把函数每次调用的耗时记录到默认注册表的耗时分布中。
+
+    Args:
+        :param name: 耗时分布的名称
+
+    Returns:
+        :return 装饰器
+    """
+    histogram = registry.histogram(name)
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.record(time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorator
@@ -10,14 +10,25 @@
 本模块包含客户端的网络通信功能，包括数据包发送接收、消息队列管理等。
 """
 
-import json
+import itertools
 import queue
 import socket
 import sys
+import threading
+import time
+from concurrent.futures import Future
 from typing import Any, Callable, Dict, Optional
 
+import capture
+import codec
+import handlers
+import keepalive
+import log_setup
+import metrics
 import paperlib as lib
+import profiling
 import structlog
+import tracing
 
 """
     网络部分的模块
@@ -38,6 +49,10 @@ import structlog
         }
     }
     --------------------------------------------------------------------------------------------------------------------
+    需要等待响应的请求在顶层附带"request_id"字段（客户端生成的递增整数），
+    服务端在响应中原样带回时按request_id匹配，未带回时按期望的响应类型匹配最早的请求。
+    带回的request_id已经不在等待中（例如请求已经超时）时，响应被丢弃，不会交给同类型的其他请求。
+    --------------------------------------------------------------------------------------------------------------------
     以下为不同类型的数据包格式
     模板：
     {
@@ -78,6 +93,42 @@ def get_logger() -> structlog.BoundLogger:
 
 logger = get_logger()
 temp_xml_dir = "data/"
+# 发送数据包时等待连接建立的最长时间（秒）
+CONNECT_TIMEOUT = 10.0
+# 等待服务器响应的默认超时时间（秒）
+REQUEST_TIMEOUT = 10.0
+# 发送队列的优先级：心跳回复优先于普通数据包发送
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+
+# 运行指标
+_packets_sent = metrics.registry.counter("net.packets_sent")
+_bytes_sent = metrics.registry.counter("net.bytes_sent")
+_packets_received = metrics.registry.counter("net.packets_received")
+_bytes_received = metrics.registry.counter("net.bytes_received")
+_decode_errors = metrics.registry.counter("net.decode_errors")
+_stale_responses = metrics.registry.counter("net.stale_responses")
+_request_latency = metrics.registry.histogram("net.request_latency")
+
+
+class PendingRequest:
+    """等待服务器响应的请求。"""
+
+    def __init__(self, request_id: Optional[int], expect: str) -> None:
+        """初始化等待中的请求。
+
+        Args:
+            :param request_id: 请求ID，只等待服务器推送的消息时为None
+            :param expect: 期望的响应消息类型
+
+        Returns:
+            :return 无返回值
+        """
+        self.request_id = request_id
+        self.expect = expect
+        self.future: Future = Future()
+        self.timer: Optional[threading.Timer] = None
+        self.sent_at = time.monotonic()
 
 
 class ClientNetwork:
@@ -86,86 +137,377 @@ class ClientNetwork:
     负责管理客户端与服务器之间的网络通信，包括连接管理、数据包收发、消息队列等。
     """
     
-    def __init__(self) -> None:
+    def __init__(self, json_codec: Optional[str] = None, capture_path: Optional[str] = None) -> None:
         """初始化客户端网络连接。
 
+        Args:
+            :param json_codec: JSON编解码器名称（"orjson"或"json"），None表示使用已安装的最快实现
+            :param capture_path: 录制收发数据帧的文件路径，None时读取环境变量WRITEPAPERS_CAPTURE，都没有则不录制
+
         Returns:
             :return 无返回值
         """
         # 回调函数和配置
         self.is_debug: Optional[Callable[[], bool]] = None
         self.token: Optional[str] = None
+
+        # 数据包编解码：payload以外的外层字段预先编码，收到的数据直接从bytes解析
+        self.codec = codec.get_codec(json_codec)
+        self.envelopes = codec.EnvelopeEncoder(self.codec)
+
+        # 数据包录制（可选），录制文件可由capture.py回放
+        capture_path = capture_path or capture.capture_path_from_env()
+        self.capture: Optional[capture.CaptureWriter] = None
+        if capture_path:
+            try:
+                self.capture = capture.CaptureWriter(capture_path)
+            except OSError as e:
+                logger.error(f"无法创建录制文件{capture_path}: {e}")
         
         # 服务器配置
-        self.server_host: str = lib.read_xml("server/ip", temp_xml_dir) or "127.0.0.1"
-        try:
-            port_str = lib.read_xml("server/port", temp_xml_dir)
-            self.server_port: int = int(port_str) if port_str else 3624
-        except (TypeError, ValueError):
+        config = lib.get_config(temp_xml_dir)
+        self.server_host: str = config.get("server/ip", None) or "127.0.0.1"
+        self.server_port: int = config.get_int("server/port", 0)
+        if not self.server_port:
             logger.warning("配置文件中的端口无效，正在使用默认端口3624")
             self.server_port = 3624
+        config.subscribe("server/ip", self._on_server_config_changed)
+        config.subscribe("server/port", self._on_server_config_changed)
+
+        # 消息处理器注册表：网络模块登记心跳等即时处理器，客户端登记聊天消息、各类结果等延迟处理器
+        self.handlers = handlers.HandlerRegistry()
+        self.handlers.register("server_hello", lambda m: logger.critical("服务器给你发了个Hello!"))
+        self.handlers.register("heartbeat", self._handle_heartbeat)
+        self.handlers.register("welcome_back", self._keep_unclaimed)
+        self.handlers.register("heartbeat_result", lambda m: logger.debug("探测请求的响应在超时后才到达"))
+
+        # 等待响应的请求表：按请求ID索引，并按发送顺序保留以便按类型匹配
+        self._pending: Dict[int, PendingRequest] = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        # 尚无人等待的服务器推送消息（如welcome_back），按类型保留最新一条
+        self._unclaimed: Dict[str, Dict[str, Any]] = {}
+
+        # 网络连接，由connect_async在后台线程中建立
+        self.sock: socket.socket = self._new_socket()
+        self.connected = threading.Event()
+        self.connect_error: Optional[BaseException] = None
+        self._connect_done = threading.Event()
+        self._connect_thread: Optional[threading.Thread] = None
+        self._connect_lock = threading.Lock()
+        self.closed = threading.Event()
 
-        # 消息队列
-        self.message_queue: queue.Queue = queue.Queue()
-        self.return_queue: queue.Queue = queue.Queue()
-        self.offline_message_queue: queue.Queue = queue.Queue()
-        self.friend_token_queue: queue.Queue = queue.Queue()
-        self.welcome_back_queue: queue.Queue = queue.Queue()
+        # 发送队列：所有数据包由写线程按优先级依次发送，接收线程和界面线程都不会被发送阻塞
+        self._outbox: queue.PriorityQueue = queue.PriorityQueue()
+        self._outbox_seq = itertools.count()
+        self._writer_thread: Optional[threading.Thread] = None
+        metrics.registry.gauge("net.outbox_depth", self._outbox.qsize)
+        metrics.registry.gauge("net.pending_requests", lambda: len(self._pending))
 
-        # 网络连接
-        self.sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # 连接保活：空闲时发送探测请求，服务器回复过探测请求后探测超时才主动判定断开
+        # server/dead_timeout可以额外按空闲时间判定，默认不启用
+        self.keepalive = keepalive.Keepalive(self._send_probe, self._on_connection_lost,
+                                             dead_timeout=config.get_float("server/dead_timeout", None))
+
+    @staticmethod
+    def _new_socket() -> socket.socket:
+        """创建一个尚未连接的TCP套接字。"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        return sock
+
+    def connect_async(self) -> None:
+        """在后台线程中连接服务器，不阻塞登录界面的显示。
+
+        连接正在进行或已经成功时直接返回；上一次连接失败时发起新的尝试。
+
+        Returns:
+            :return 无返回值
+        """
+        with self._connect_lock:
+            if self._connect_thread is not None:
+                return
+            self.connect_error = None
+            self._connect_done.clear()
+            self._connect_thread = threading.Thread(target=self._connect, name="connect", daemon=True)
+            self._connect_thread.start()
+
+    def _connect(self) -> None:
+        """连接服务器（在后台线程中执行）。"""
         try:
             self.sock.connect((self.server_host, self.server_port))
+            self._writer_thread = threading.Thread(target=self._write_loop, name="writer", daemon=True)
+            self._writer_thread.start()
+            self.keepalive.start()
+            self.connected.set()
+            self._connect_done.set()
             logger.info("成功连接到服务器")
-        except ConnectionRefusedError:
-            logger.critical("无法连接到服务器")
-            sys.exit(1)
+        except OSError as e:
+            logger.critical(f"无法连接到服务器: {e}")
+            # 连接失败的套接字不能再次connect，换一个新的以便下次重试
+            self.sock.close()
+            with self._connect_lock:
+                self.sock = self._new_socket()
+                self.connect_error = e
+                self._connect_thread = None
+                self._connect_done.set()
+
+    def wait_connected(self, timeout: Optional[float] = CONNECT_TIMEOUT) -> bool:
+        """等待后台连接完成。
+
+        尚未连接或上一次连接失败时会先发起新的连接。
+
+        Args:
+            :param timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            :return 连接成功返回True，连接失败或超时返回False
+        """
+        self.connect_async()
+        self._connect_done.wait(timeout)
+        return self.connected.is_set()
+
+    def _on_server_config_changed(self, keyword: str, value: Optional[str]) -> None:
+        """配置文件中的服务器地址或端口变化时更新连接参数。
 
-    def send_packet(self, message_type: str, payload: Dict[str, Any], token: Optional[str] = None) -> None:
-        """发送数据包到服务器。
+        已建立的连接不受影响，新的地址在下次连接时生效。
+
+        Args:
+            :param keyword: 发生变化的配置关键字
+            :param value: 新的配置值
+
+        Returns:
+            :return 无返回值
+        """
+        if keyword == "server/ip":
+            self.server_host = value or "127.0.0.1"
+        elif keyword == "server/port":
+            try:
+                self.server_port = int(value)
+            except (TypeError, ValueError):
+                logger.warning(f"配置文件中的端口无效: {value}")
+                return
+        logger.info(f"服务器地址已更改为 {self.server_host}:{self.server_port}，将在下次连接时生效")
+
+    def send_packet(self, message_type: str, payload: Dict[str, Any], token: Optional[str] = None,
+                    request_id: Optional[int] = None, priority: int = PRIORITY_NORMAL,
+                    trace: Optional[tracing.Trace] = None) -> bool:
+        """编码数据包并放入发送队列，由写线程发送到服务器。
         
         Args:
             :param message_type: 消息类型
             :param payload: 消息载荷数据
             :param token: 认证令牌
+            :param request_id: 请求ID，需要匹配响应时由request生成
+            :param priority: 发送优先级，数值越小越先发送
+            :param trace: 调用方已经开始的追踪，None时按需新建
             
         Returns:
-            :return 无返回值
+            :return 成功放入发送队列返回True
         """
         if message_type == "login":
             token = "LOGIN"
         if token is None:
             token = self.token
-            
-        packet_data = {
-            "type": message_type,
-            "token": token,
-            "payload": payload
-        }
-        
+
+        if not self.wait_connected():
+            logger.error(f"未连接到服务器，数据包{message_type}未发送")
+            return False
+        if self.closed.is_set():
+            logger.error(f"连接已断开，数据包{message_type}未发送")
+            return False
+
         try:
-            packet_json = json.dumps(packet_data)
-            packet_bytes = packet_json.encode("utf-8")
-            
-            # 发送4字节的数据长度
-            length = len(packet_bytes)
-            length_bytes = length.to_bytes(4, byteorder='big')
-            
-            self.sock.sendall(length_bytes)
-            # 发送实际数据
-            self.sock.sendall(packet_bytes)
-            
-            if self.is_debug and self.is_debug():
-                logger.debug(f"发送数据{packet_json}成功")
-                
-        except (ConnectionResetError, BrokenPipeError) as e:
-            logger.error(f"服务器连接错误: {e}")
-            sys.exit(1)
-        except UnicodeEncodeError as e:
+            # 4字节的数据长度加实际数据，一次写入
+            frame = self.envelopes.frame(message_type, token, payload, request_id)
+        except (TypeError, ValueError) as e:
             logger.error(f"数据编码错误: {e}")
-        except Exception as e:
-            logger.error(f"发送数据包时发生未知错误: {e}")
+            return False
+
+        if trace is None:
+            trace = tracing.begin(f"send:{message_type}")
+        tracing.stamp(trace, "enqueue")
+        self._outbox.put((priority, next(self._outbox_seq), frame, trace))
+        return True
+
+    def _write_loop(self) -> None:
+        """写线程主循环：按优先级依次发送队列中的数据包。"""
+        while True:
+            _, _, frame, trace = self._outbox.get()
+            if frame is None:
+                return
+            try:
+                self.sock.sendall(frame)
+            except OSError as e:
+                logger.error(f"服务器连接错误: {e}")
+                self._on_connection_lost(f"发送失败: {e}")
+                return
+            _packets_sent.inc()
+            _bytes_sent.inc(len(frame))
+            tracing.stamp(trace, "socket_write")
+            tracing.finish(trace)
+            if self.capture is not None:
+                self.capture.record(capture.OUTBOUND, frame[4:])
+            if self.is_debug and self.is_debug():
+                logger.debug("发送数据成功", data=log_setup.lazy(log_setup.truncate, memoryview(frame)[4:]),
+                             per_message=True)
+
+    def _send_probe(self) -> None:
+        """连接空闲时发送探测请求，响应同时提供一个RTT样本。"""
+        future = self.request("heartbeat", {"content": "ping"}, expect="heartbeat_result",
+                              timeout=keepalive.PROBE_TIMEOUT)
+        future.add_done_callback(self._on_probe_done)
+
+    def _on_probe_done(self, future: Future) -> None:
+        """探测请求完成：记录服务器是否回复探测请求，超时交给保活模块判定。"""
+        error = future.exception()
+        if error is None:
+            self.keepalive.on_probe_answered()
+        elif isinstance(error, TimeoutError):
+            self.keepalive.on_probe_timeout()
+
+    def _on_connection_lost(self, reason: str) -> None:
+        """判定连接断开：让等待中的请求失败，停止写线程并关闭套接字使接收线程退出。
+
+        Args:
+            :param reason: 断开原因
+
+        Returns:
+            :return 无返回值
+        """
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.keepalive.alive = False
+        self.keepalive.stop()
+        self._fail_pending(ConnectionError(f"连接已断开: {reason}"))
+        self._outbox.put((-1, -1, None, None))
+        self.stop_capture()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stop_capture(self) -> None:
+        """结束数据包录制并关闭录制文件。
+
+        Returns:
+            :return 无返回值
+        """
+        if self.capture is not None:
+            self.capture.close()
+
+    def request(self, message_type: str, payload: Dict[str, Any], expect: str,
+                timeout: Optional[float] = REQUEST_TIMEOUT) -> Future:
+        """发送需要响应的请求，返回代表响应的Future。
+
+        调用方可以在后台线程中future.result(timeout)等待，也可以用add_done_callback附加回调。
+        回调在接收线程中调用，操作Tk控件前需要通过after交回主线程。
+
+        Args:
+            :param message_type: 请求消息类型
+            :param payload: 请求载荷数据
+            :param expect: 期望的响应消息类型
+            :param timeout: 超时时间（秒），超时后Future以TimeoutError失败；None表示不超时
+
+        Returns:
+            :return 结果为完整响应消息字典的Future
+        """
+        pending = PendingRequest(next(self._request_ids), expect)
+        self._add_pending(pending, timeout)
+        if not self.send_packet(message_type, payload, request_id=pending.request_id):
+            self._resolve(pending, error=ConnectionError(f"请求{message_type}发送失败"))
+        return pending.future
+
+    def wait_for(self, message_type: str, timeout: Optional[float] = REQUEST_TIMEOUT) -> Future:
+        """等待服务器主动推送的某类消息，返回代表该消息的Future。
+
+        消息在调用前已经到达时Future立即完成。
+
+        Args:
+            :param message_type: 消息类型
+            :param timeout: 超时时间（秒），None表示不超时
+
+        Returns:
+            :return 结果为完整消息字典的Future
+        """
+        pending = PendingRequest(None, message_type)
+        with self._pending_lock:
+            msg = self._unclaimed.pop(message_type, None)
+            if msg is None:
+                self._pending[self._pending_key(pending)] = pending
+        if msg is not None:
+            pending.future.set_result(msg)
+        else:
+            self._start_timer(pending, timeout)
+        return pending.future
+
+    @staticmethod
+    def _pending_key(pending: PendingRequest) -> int:
+        """请求表中的键：请求ID，没有请求ID的推送等待者使用负数的对象标识。"""
+        return pending.request_id if pending.request_id is not None else -id(pending)
+
+    def _add_pending(self, pending: PendingRequest, timeout: Optional[float]) -> None:
+        """登记等待中的请求并启动超时计时器。"""
+        with self._pending_lock:
+            self._pending[self._pending_key(pending)] = pending
+        self._start_timer(pending, timeout)
+
+    def _start_timer(self, pending: PendingRequest, timeout: Optional[float]) -> None:
+        """启动请求的超时计时器。"""
+        if timeout is not None:
+            pending.timer = threading.Timer(
+                timeout, self._resolve, args=(pending,),
+                kwargs={"error": TimeoutError(f"等待{pending.expect}超时（{timeout}秒）")})
+            pending.timer.daemon = True
+            pending.timer.start()
+
+    def _match_pending(self, msg: Dict[str, Any]) -> Optional[PendingRequest]:
+        """为收到的消息查找等待中的请求：带request_id的只按request_id匹配，否则按期望类型匹配最早的请求。"""
+        msg_type = msg.get("type", "")
+        request_id = msg.get("request_id")
+        with self._pending_lock:
+            if request_id is not None:
+                pending = self._pending.get(request_id)
+                return pending if pending is not None and pending.expect == msg_type else None
+            # 字典保持插入顺序，第一个类型相同的就是最早的请求
+            for pending in self._pending.values():
+                if pending.expect == msg_type:
+                    return pending
+        return None
+
+    def _is_pending(self, request_id: int) -> bool:
+        """请求ID是否仍在等待响应。请求ID只增不减，不在等待中的ID不会再次出现。"""
+        with self._pending_lock:
+            return request_id in self._pending
+
+    def _resolve(self, pending: PendingRequest, msg: Optional[Dict[str, Any]] = None,
+                 error: Optional[BaseException] = None) -> None:
+        """完成等待中的请求并从请求表中移除。"""
+        key = self._pending_key(pending)
+        with self._pending_lock:
+            if self._pending.get(key) is not pending:
+                # 已经被响应、超时或连接断开处理过
+                return
+            del self._pending[key]
+        if pending.timer is not None:
+            pending.timer.cancel()
+        if error is not None:
+            logger.warning(f"请求失败: {error}")
+            pending.future.set_exception(error)
+        else:
+            if pending.request_id is not None:
+                rtt = time.monotonic() - pending.sent_at
+                self.keepalive.record_rtt(rtt)
+                _request_latency.record(rtt)
+            pending.future.set_result(msg)
+
+    def _fail_pending(self, error: BaseException) -> None:
+        """连接断开时让所有等待中的请求失败。"""
+        with self._pending_lock:
+            pendings = list(self._pending.values())
+        for pending in pendings:
+            self._resolve(pending, error=error)
 
     def receive_packet(self) -> None:
         """接收消息的线程主循环。
@@ -173,92 +515,123 @@ class ClientNetwork:
         Returns:
             :return 无返回值
         """
+        # 连接失败时由界面提示用户并重新发起连接，接收线程一直等到某次连接成功
+        self.connect_async()
+        self.connected.wait()
         try:
             while True:
                 """
                 通过消息前4字节的数据来接收完整数据包
                 """
                 # 先接收4字节的数据长度
-                length_bytes = self.sock.recv(4)
-                if not length_bytes:
-                    continue
-
-                # 解析数据长度
-                data_length = int.from_bytes(length_bytes, byteorder='big')
-
-                # 接收实际数据
-                buffer = b''
-                while len(buffer) < data_length:
-                    remaining = data_length - len(buffer)
-                    chunk = self.sock.recv(min(1024, remaining))
-                    if not chunk:
-                        break
-                    buffer += chunk
-
-                if len(buffer) != data_length:
-                    logger.warning(f"接收到的数据长度不匹配：预期{data_length}字节，实际接收{len(buffer)}字节")
-                    continue
+                data_length = int.from_bytes(self._recv_exact(4), byteorder='big')
+                self.keepalive.on_received()
+                profiling.checkpoint()
 
-                try:
-                    raw_msg = buffer.decode("utf-8")
-                except UnicodeDecodeError as e:
-                    logger.warning(f"UTF-8解码失败: {e}")
-                    continue
+                # 接收实际数据，直接写入预先分配的缓冲区
+                trace = tracing.begin("recv")
+                buffer = self._recv_exact(data_length)
+                tracing.stamp(trace, "socket_read")
+                _packets_received.inc()
+                _bytes_received.inc(data_length + 4)
+                if self.capture is not None:
+                    self.capture.record(capture.INBOUND, buffer)
 
-                # 此时已获取到一个完整的数据包
+                # 此时已获取到一个完整的数据包，交给编解码器解析（orjson直接解析字节，标准库json先解码为str）
                 try:
-                    msg = json.loads(raw_msg)
-                except json.JSONDecodeError as e:
-                    logger.warning(f"JSON 解析失败: {e}, 数据内容: {raw_msg}")
+                    msg = self.codec.loads(buffer)
+                except ValueError as e:
+                    _decode_errors.inc()
+                    logger.warning(f"JSON 解析失败: {e}, 数据内容: {bytes(buffer[:256])!r}")
                     continue
+                if trace is not None:
+                    trace.kind = f"recv:{msg.get('type', '')}"
+                    trace.stamp("decode")
                 # 调试 打印消息
                 if self.is_debug and self.is_debug():
-                    logger.debug("收到消息:" + raw_msg)
-                
+                    logger.debug("收到消息", data=log_setup.lazy(log_setup.truncate, buffer), per_message=True)
+
                 # 处理消息
-                self._handle_received_message(msg)
+                self._handle_received_message(msg, trace)
 
         except (BrokenPipeError, ConnectionResetError, ConnectionError) as e:
             logger.warning(f"服务器连接断开: {e}")
+            self._on_connection_lost(str(e))
             sys.exit(1)
         except Exception as e:
             logger.error(f"接收消息时发生未知错误: {e}")
+            self._on_connection_lost(f"接收消息时发生错误: {e}")
             sys.exit(1)
     
-    def _handle_received_message(self, msg: Dict[str, Any]) -> None:
+    def _recv_exact(self, size: int) -> bytearray:
+        """从套接字读取恰好size字节。
+
+        Args:
+            :param size: 要读取的字节数
+
+        Returns:
+            :return 读取到的数据
+
+        Raises:
+            :raise ConnectionError: 读满之前连接被关闭时抛出
+        """
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise ConnectionError("服务器关闭了连接")
+            received += count
+        return buffer
+
+    def _handle_received_message(self, msg: Dict[str, Any], trace: Optional[tracing.Trace] = None) -> None:
         """处理接收到的消息。
         
         Args:
             :param msg: 接收到的消息字典
+            :param trace: 该消息的追踪，交给处理器注册表在处理完成后结束
             
         Returns:
             :return 无返回值
         """
-        msg_type = msg.get("type", "")
-        
-        if msg_type.endswith("result") or msg_type.endswith("return"):
-            # 某些函数需要的返回值
-            if msg_type == "friend_token_result":
-                self.friend_token_queue.put(msg)
-                return
-            self.return_queue.put(msg)
+        # 有请求正在等待这条消息时直接交给对应的Future
+        pending = self._match_pending(msg)
+        if pending is not None:
+            self._resolve(pending, msg)
+            tracing.finish(trace)
             return
-            
-        # 处理不同类型的消息
-        message_handlers = {
-            "new_message": lambda m: self.message_queue.put(m),
-            "server_hello": lambda m: logger.critical("服务器给你发了个Hello!"),
-            "heartbeat": self._handle_heartbeat,
-            "offline_messages": self._handle_offline_messages,
-            "welcome_back": lambda m: self.welcome_back_queue.put(m)
-        }
-        
-        handler = message_handlers.get(msg_type)
-        if handler:
-            handler(msg)
-        else:
-            logger.warning(f"收到未知消息类型: {msg_type}, full content:{msg}")
-    
+        request_id = msg.get("request_id")
+        if request_id is not None and not self._is_pending(request_id):
+            # 请求已经超时或失败，迟到的响应不能交给其他请求，否则会完成错误的Future并记录错误的RTT
+            _stale_responses.inc()
+            tracing.finish(trace)
+            logger.warning("丢弃迟到的响应", type=msg.get("type", ""), request_id=request_id)
+            return
+
+        # 其余消息按类型交给注册表分发
+        if not self.handlers.dispatch(msg, trace):
+            tracing.finish(trace)
+            logger.warning(f"收到未知消息类型: {msg.get('type', '')}, full content:{msg}")
+
+    def _keep_unclaimed(self, msg: Dict[str, Any]) -> None:
+        """保留尚无人等待的服务器推送消息，供之后的wait_for直接取用。
+
+        Args:
+            :param msg: 推送消息
+
+        Returns:
+            :return 无返回值
+        """
+        msg_type = msg.get("type", "")
+        with self._pending_lock:
+            # 收到消息后才登记的等待者不会被_match_pending匹配到，这里再检查一次
+            pending = next((p for p in self._pending.values() if p.expect == msg_type), None)
+            if pending is None:
+                self._unclaimed[msg_type] = msg
+        if pending is not None:
+            self._resolve(pending, msg)
+
     def _handle_heartbeat(self, msg: Dict[str, Any]) -> None:
         """处理心跳包。
         
@@ -270,20 +643,8 @@ class ClientNetwork:
         """
         if self.is_debug and self.is_debug():
             logger.debug("收到心跳包，正在回复")
-        self.send_packet("heartbeat", {"content": "Health check received."})
-    
-    def _handle_offline_messages(self, msg: Dict[str, Any]) -> None:
-        """处理离线消息。
-        
-        Args:
-            :param msg: 离线消息
-            
-        Returns:
-            :return 无返回值
-        """
-        payload = msg.get("payload", [])
-        for message in payload:
-            self.offline_message_queue.put(message)
+        # 只放入发送队列并插到最前，由写线程回复，接收线程不会被发送阻塞
+        self.send_packet("heartbeat", {"content": "Health check received."}, priority=PRIORITY_URGENT)
 
 
 if __name__ == '__main__':
@@ -4,15 +4,393 @@
 # @Software: PyCharm
 # @Desc    :
 # @Author  : Kevin Chang
+from contextlib import contextmanager
 from xml.etree import ElementTree
 import os
+import shutil
+import tempfile
+import threading
+import time
+
+# 检查配置文件是否被外部修改的最小间隔（秒）
+CHECK_INTERVAL = 1.0
+
+_MISSING = object()
+
+
+class ConfigStore:
+    """
+    client.xml的内存配置存储
+
+    配置文件只解析一次，之后的读取都直接从内存返回；
+    每隔CHECK_INTERVAL秒检查一次文件的修改时间，文件被外部修改后自动重新加载。
+    写入时先写临时文件再重命名，保证配置文件不会只写了一半。
+    多个关键字可以通过edit()在一次事务中修改，值发生变化的关键字会通知订阅者。
+    """
+
+    def __init__(self, xml_path, check_interval=CHECK_INTERVAL):
+        """
+        初始化配置存储并加载配置文件
+
+        Args:
+            :param xml_path: client.xml的绝对路径
+            :param check_interval: 检查文件修改时间的最小间隔（秒）
+
+        Raises:
+            :raise FileNotFoundError: 当XML文件不存在时抛出
+            :raise ValueError: 当XML格式错误时抛出
+        """
+        self.xml_path = xml_path
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._tree = None
+        self._values = {}
+        self._mtime = None
+        self._next_check = 0.0
+        self._subscribers = {}
+
+        self._load()
+
+    def get(self, keyword, default=_MISSING):
+        """
+        读取指定关键字的文本值
+
+        Args:
+            :param keyword: 要查找的XML元素路径，如"server/ip"
+            :param default: 关键字不存在时返回的默认值，不提供时抛出异常
+        Returns:
+            :return str: 匹配到的XML元素文本内容
+
+        Raises:
+            ValueError: 当指定的关键字不存在且没有提供默认值时抛出
+        """
+        with self._lock:
+            changes = self._reload_if_changed()
+            try:
+                value = self._values[keyword]
+            except KeyError:
+                target = self._tree.getroot().find(f".//{keyword}")
+                if target is None:
+                    value = default
+                else:
+                    value = target.text
+                    self._values[keyword] = value
+        if changes:
+            self._notify(changes)
+        if value is _MISSING:
+            raise ValueError(f"Keyword '{keyword}' not found in XML or invalid format.")
+        return value
+
+    def get_int(self, keyword, default=_MISSING):
+        """
+        读取整数类型的配置值
+
+        Args:
+            :param keyword: 要查找的XML元素路径
+            :param default: 关键字不存在或不是整数时返回的默认值
+        Returns:
+            :return int: 配置值
+
+        Raises:
+            ValueError: 当值不是整数且没有提供默认值时抛出
+        """
+        value = self.get(keyword, default)
+        if value is default:
+            return default
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            if default is _MISSING:
+                raise ValueError(f"Keyword '{keyword}' is not an integer: {value!r}")
+            return default
+
+    def get_float(self, keyword, default=_MISSING):
+        """
+        读取浮点数类型的配置值
+
+        Args:
+            :param keyword: 要查找的XML元素路径
+            :param default: 关键字不存在或不是数字时返回的默认值
+        Returns:
+            :return float: 配置值
+
+        Raises:
+            ValueError: 当值不是数字且没有提供默认值时抛出
+        """
+        value = self.get(keyword, default)
+        if value is default:
+            return default
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            if default is _MISSING:
+                raise ValueError(f"Keyword '{keyword}' is not a number: {value!r}")
+            return default
+
+    def get_bool(self, keyword, default=False):
+        """
+        读取布尔类型的配置值，只有"true"/"True"视为真
+
+        Args:
+            :param keyword: 要查找的XML元素路径
+            :param default: 关键字不存在时返回的默认值
+        Returns:
+            :return bool: 配置值
+        """
+        value = self.get(keyword, None)
+        if value is None:
+            return default
+        return value in ("true", "True")
+
+    def set(self, keyword, value):
+        """
+        修改指定关键字的值并立即原子地写回文件
+
+        Args:
+            :param keyword: 要修改的XML元素路径
+            :param value: 要写入的新值
+
+        Raises:
+            :raise ValueError: 当关键字在XML中不存在时抛出
+        """
+        with self.edit() as editor:
+            editor.set(keyword, value)
+
+    @contextmanager
+    def edit(self):
+        """
+        以事务方式修改多个关键字
+
+        with块正常结束时，所有修改在一次序列化中原子地写回文件，然后通知订阅者；
+        with块中抛出异常时，所有修改都被丢弃。with块执行期间不持有配置锁，其他线程的读取不会被阻塞，
+        只有结束时应用和保存修改才加锁，因此不要在with块中等待网络等耗时操作的结果来决定是否提交。用法：
+            with config.edit() as c:
+                c.set("account/username", username)
+                c.set("account/password", password)
+
+        Returns:
+            :return ConfigEditor: 收集修改的编辑器
+
+        Raises:
+            :raise ValueError: 当某个关键字在XML中不存在时抛出，此时不会写入任何修改
+        """
+        editor = ConfigEditor(self)
+        yield editor
+        with self._lock:
+            reload_changes = self._reload_if_changed()
+            changes = self._apply(editor.changes)
+        if reload_changes:
+            self._notify(reload_changes)
+        if changes:
+            self._notify(changes)
+
+    def subscribe(self, keyword, callback):
+        """
+        订阅某个关键字的变化
+
+        回调在修改生效后于修改方的线程中调用，参数为(关键字, 新值)。
+
+        Args:
+            :param keyword: 要订阅的XML元素路径
+            :param callback: 值变化时调用的回调函数
+        """
+        with self._lock:
+            self._subscribers.setdefault(keyword, []).append(callback)
+
+    def unsubscribe(self, keyword, callback):
+        """
+        取消订阅某个关键字的变化
+
+        Args:
+            :param keyword: XML元素路径
+            :param callback: 之前订阅的回调函数
+        """
+        with self._lock:
+            callbacks = self._subscribers.get(keyword, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def save(self):
+        """
+        把内存中的配置原子地写回文件（先写临时文件，再重命名覆盖）
+        """
+        with self._lock:
+            directory = os.path.dirname(self.xml_path)
+            fd, temp_path = tempfile.mkstemp(prefix=".client.xml.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "wb") as temp_file:
+                    # 写回文件（保留XML声明和编码格式）
+                    self._tree.write(temp_file, encoding="utf-8", xml_declaration=True)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                # mkstemp创建的文件权限为0600，沿用原配置文件的权限
+                if os.path.exists(self.xml_path):
+                    shutil.copymode(self.xml_path, temp_path)
+                os.replace(temp_path, self.xml_path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+            self._mtime = os.stat(self.xml_path).st_mtime_ns
+
+    def reload(self):
+        """
+        强制从磁盘重新加载配置文件
+        """
+        with self._lock:
+            self._load()
+
+    def _apply(self, pending):
+        """把编辑器收集的修改应用到内存并写回文件，返回值发生变化的关键字"""
+        if not pending:
+            return {}
+        root = self._tree.getroot()
+        # 先确认所有关键字都存在，避免只应用了一部分修改
+        targets = {}
+        for keyword in pending:
+            target = root.find(f".//{keyword}")
+            if target is None:
+                raise ValueError(f"Keyword '{keyword}' not found in XML")
+            targets[keyword] = target
+
+        changes = {}
+        for keyword, value in pending.items():
+            target = targets[keyword]
+            if target.text != value:
+                changes[keyword] = value
+            target.text = value
+            self._values[keyword] = value
+        if changes:
+            self.save()
+        return changes
+
+    def _notify(self, changes):
+        """通知订阅者关键字的变化"""
+        with self._lock:
+            calls = [(callback, keyword, value)
+                     for keyword, value in changes.items()
+                     for callback in self._subscribers.get(keyword, [])]
+        for callback, keyword, value in calls:
+            callback(keyword, value)
+
+    def _load(self):
+        """解析配置文件并清空读取缓存"""
+        if not os.path.exists(self.xml_path):
+            raise FileNotFoundError(f"XML file not found at {self.xml_path}")
+        try:
+            tree = ElementTree.parse(self.xml_path)
+        except ElementTree.ParseError as e:
+            raise ValueError(f"Invalid XML format: {str(e)}") from e
+        self._tree = tree
+        self._values = {}
+        self._mtime = os.stat(self.xml_path).st_mtime_ns
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _reload_if_changed(self):
+        """按间隔检查文件修改时间，文件被外部修改时重新加载，返回被订阅的关键字中发生变化的部分"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return {}
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.stat(self.xml_path).st_mtime_ns
+        except OSError:
+            # 文件暂时不可用时继续使用内存中的配置
+            return {}
+        if mtime == self._mtime:
+            return {}
+
+        root = self._tree.getroot()
+        before = {keyword: getattr(root.find(f".//{keyword}"), "text", None) for keyword in self._subscribers}
+        try:
+            self._load()
+        except (OSError, ValueError):
+            # 文件正在被外部程序写入，下次检查时再重新加载
+            return {}
+        root = self._tree.getroot()
+        changes = {}
+        for keyword, value in before.items():
+            current = getattr(root.find(f".//{keyword}"), "text", None)
+            if current != value:
+                changes[keyword] = current
+        return changes
+
+
+class ConfigEditor:
+    """
+    配置事务编辑器，由ConfigStore.edit()创建
+
+    修改先收集在编辑器中，事务提交时才统一写入。
+    """
+
+    def __init__(self, store):
+        """
+        初始化编辑器
+
+        Args:
+            :param store: 所属的配置存储
+        """
+        self._store = store
+        self.changes = {}
+
+    def set(self, keyword, value):
+        """
+        记录一个关键字的新值
+
+        Args:
+            :param keyword: 要修改的XML元素路径
+            :param value: 要写入的新值
+        """
+        self.changes[keyword] = str(value)
+
+    def get(self, keyword, default=_MISSING):
+        """
+        读取关键字的值，事务中已修改的关键字返回新值
+
+        Args:
+            :param keyword: XML元素路径
+            :param default: 关键字不存在时返回的默认值
+        Returns:
+            :return str: 配置值
+        """
+        if keyword in self.changes:
+            return self.changes[keyword]
+        return self._store.get(keyword, default)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_config(path="data/"):
+    """
+    获取指定目录下client.xml对应的配置存储（每个文件只创建一次）
+
+    Args:
+        :param path: client.xml的相对路径
+    Returns:
+        :return ConfigStore: 配置存储
+    """
+    # 构建XML文件绝对路径：参数指定的目录 + client.xml
+    xml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{path}client.xml')
+    store = _stores.get(xml_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(xml_path)
+            if store is None:
+                store = ConfigStore(xml_path)
+                _stores[xml_path] = store
+    return store
 
 
 def read_xml(keyword, path="data/"):
     """
     从指定侧的XML文件中读取对应关键字的值
 
-    通过解析项目data目录下的client.xml文件，使用XPath查找指定关键字的文本内容。
+    读取由get_config返回的内存配置存储完成，文件只在首次读取或被外部修改后才重新解析。
     若XML结构不符合预期或关键字不存在，将抛出可追踪的异常。
 
     Args:
@@ -25,25 +403,13 @@ def read_xml(keyword, path="data/"):
         ValueError: 当指定的关键字在XML中不存在或XML格式不符合预期时抛出
 
     """
-    try:
-        # 构建XML文件绝对路径：参数指定的目录 + client.xml
-        xml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{path}client.xml')
-
-        # 解析XML文档并获取根节点
-        tree = ElementTree.parse(xml_path)
-        root = tree.getroot()
-
-        # 使用XPath语法递归搜索指定关键字节点
-        return root.find(f".//{keyword}").text
-    except AttributeError as e:
-        # 转换底层解析异常为更有业务意义的错误类型，保留原始异常堆栈信息
-        raise ValueError(f"Keyword '{keyword}' not found in XML or invalid format.") from e
+    return get_config(path).get(keyword)
 
 def write_xml(keyword, value, path="data/"):
     """
     将指定关键字的值写入XML文件
 
-    通过解析项目data目录下的client.xml文件，使用XPath定位指定关键字节点并更新其文本内容。
+    修改内存配置存储中的值，并通过临时文件加重命名的方式原子地写回client.xml。
     若关键字不存在或XML格式异常，将抛出可追踪的异常。
 
     Args:
@@ -55,33 +421,4 @@ def write_xml(keyword, value, path="data/"):
         :raise ValueError: 当关键字在XML中不存在时抛出
         :raise FileNotFoundError: 当XML文件不存在时抛出
     """
-    try:
-        # 构建XML文件绝对路径
-        xml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{path}client.xml')
-
-        # 检查文件是否存在
-        if not os.path.exists(xml_path):
-            raise FileNotFoundError(f"XML file not found at {xml_path}")
-
-        # 解析XML文档
-        tree = ElementTree.parse(xml_path)
-        root = tree.getroot()
-
-        # 查找目标节点
-        target = root.find(f".//{keyword}")
-        if target is None:
-            raise ValueError(f"Keyword '{keyword}' not found in XML")
-
-        # 更新节点文本内容
-        target.text = str(value)
-
-        # 写回文件（保留XML声明和编码格式）
-        tree.write(
-            xml_path,
-            encoding="utf-8",
-            xml_declaration=True
-        )
-
-    except ElementTree.ParseError as e:
-        raise ValueError(f"Invalid XML format: {str(e)}") from e
-
+    get_config(path).set(keyword, value)
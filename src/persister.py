@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/2
+# @File    : persister.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端聊天消息延迟写入模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端聊天消息延迟写入模块。
+
+收到或发出的聊天消息不再逐条写入SQLite并提交，而是：
+    1. 追加到日志文件（只写入操作系统缓存，不等待磁盘），同时放入内存中的待写队列；
+    2. 后台persister线程每隔FLUSH_INTERVAL把队列中的消息在一个事务中写入chat_history；
+    3. 事务中同时更新journal_state表中已写入的最大序号，提交后丢弃日志中已写入的部分：
+       队列已空时清空日志文件，否则把仍在队列中的记录写入新文件再替换日志文件，
+       持续有消息时日志文件也不会无限增长。
+这样界面可以立即显示消息，磁盘延迟不再出现在每条消息的处理路径上。
+
+读取聊天记录前Database会先调用flush()，保证读到所有已经保存的消息；
+退出时Database.close()调用close()写完剩余的消息。
+进程异常退出时日志文件中还留有未写入的消息，下一次启动时recover()把序号大于journal_state的记录补写进数据库，
+已经写入的记录按序号跳过，不会重复。日志只写入操作系统缓存，可以防止进程崩溃，但不能防止断电。
+
+日志格式：
+    文件头为MAGIC；
+    之后每条记录为16字节的记录头（序号8字节、数据长度4字节、数据的CRC32 4字节，均为大端）加上JSON数据。
+    最后一条记录不完整或校验失败时视为写到一半崩溃，丢弃该记录及其后的内容。
+"""
+
+import base64
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, NamedTuple, Optional
+
+import structlog
+
+import metrics
+from chat_message import Message
+
+if TYPE_CHECKING:
+    from database import Database
+
+logger = structlog.get_logger()
+
+MAGIC = b"WPJRN\x01"
+# 序号、数据长度、CRC32
+RECORD_HEADER = struct.Struct(">QII")
+# 日志文件名后缀（SQLite自己使用-journal和-wal后缀，这里避开）
+JOURNAL_SUFFIX = ".pending"
+# 后台写入间隔（秒）
+FLUSH_INTERVAL = 0.2
+# 待写消息达到这么多条时立即唤醒后台线程
+FLUSH_BATCH = 200
+
+_batch_size = metrics.registry.histogram("persister.batch_size")
+_flush_time = metrics.registry.histogram("persister.flush")
+_recovered = metrics.registry.counter("persister.recovered")
+
+
+class JournalRecord(NamedTuple):
+    """一条等待写入数据库的聊天消息。"""
+    seq: int  # 日志序号，单调递增
+    message: Message
+
+
+def encode_record(record: JournalRecord) -> bytes:
+    """把消息编码为一条日志记录。
+
+    Args:
+        :param record: 待写消息
+
+    Returns:
+        :return 记录头加JSON数据
+    """
+    message = record.message
+    content = message.content
+    is_bytes = isinstance(content, (bytes, bytearray))
+    if is_bytes:
+        content = base64.b64encode(content).decode("ascii")
+    body = json.dumps([message.from_user, message.to_user, message.type, content,
+                       message.send_time, is_bytes], ensure_ascii=False).encode("utf-8")
+    return RECORD_HEADER.pack(record.seq, len(body), zlib.crc32(body)) + body
+
+
+def read_journal(path: str) -> Iterator[JournalRecord]:
+    """按顺序读出日志文件中的完整记录。
+
+    Args:
+        :param path: 日志文件路径
+
+    Returns:
+        :return 待写消息的迭代器，文件不存在或文件头不符时为空
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            seq, length, crc = RECORD_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length or zlib.crc32(body) != crc:
+                logger.warning(f"消息日志{path}在序号{seq}处不完整，丢弃之后的内容")
+                return
+            from_user, to_user, message_type, content, send_time, is_bytes = json.loads(body)
+            if is_bytes:
+                content = base64.b64decode(content)
+            yield JournalRecord(seq, Message(None, from_user, to_user, message_type, content, send_time))
+
+
+class WriteBehindPersister:
+    """聊天消息延迟写入类，append可以从任意线程调用。"""
+
+    def __init__(self, db: "Database", journal_path: str, interval: float = FLUSH_INTERVAL,
+                 sync: bool = False) -> None:
+        """初始化延迟写入器，需要先调用start()。
+
+        Args:
+            :param db: 已经建好表的数据库
+            :param journal_path: 日志文件路径
+            :param interval: 后台写入间隔（秒）
+            :param sync: 每次追加后是否调用fsync（可以防止断电，但会把磁盘延迟带回消息处理路径）
+
+        Returns:
+            :return 无返回值
+        """
+        self.db = db
+        self.journal_path = journal_path
+        self.interval = interval
+        self.sync = sync
+        self._pending: List[JournalRecord] = []
+        self._next_seq = 1
+        self._file: Optional[BinaryIO] = None
+        # _lock保护待写队列和日志文件，_flush_lock保证同一时间只有一个线程在写数据库
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.registry.gauge("persister.pending", lambda: len(self._pending))
+
+    def start(self) -> int:
+        """补写上一次未写入的消息，然后启动后台写入线程。
+
+        Returns:
+            :return 补写的消息条数
+        """
+        recovered = self.recover()
+        self._file = open(self.journal_path, "wb")
+        self._file.write(MAGIC)
+        self._file.flush()
+        self._thread = threading.Thread(target=self._run, name="persister", daemon=True)
+        self._thread.start()
+        return recovered
+
+    def recover(self) -> int:
+        """把日志中序号大于已写入序号的消息补写进数据库。
+
+        Returns:
+            :return 补写的消息条数
+        """
+        applied = self.db.get_journal_seq()
+        records = list(read_journal(self.journal_path))
+        last_seq = max([applied] + [record.seq for record in records])
+        self._next_seq = last_seq + 1
+        missing = [record for record in records if record.seq > applied]
+        if missing:
+            if not self.db.save_chat_messages([record.message for record in missing], last_seq):
+                raise RuntimeError(f"无法补写消息日志{self.journal_path}中的{len(missing)}条消息")
+            _recovered.inc(len(missing))
+            logger.warning(f"从消息日志中补写了{len(missing)}条上次未保存的消息")
+        return len(missing)
+
+    def append(self, message: Message) -> None:
+        """记录一条消息：写入日志文件并放入待写队列。
+
+        Args:
+            :param message: 聊天消息
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            record = JournalRecord(self._next_seq, message)
+            self._next_seq += 1
+            if self._file is not None:
+                self._file.write(encode_record(record))
+                self._file.flush()
+                if self.sync:
+                    os.fsync(self._file.fileno())
+            self._pending.append(record)
+            pending = len(self._pending)
+        if pending >= FLUSH_BATCH:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """在一个事务中写入所有待写消息，写完后清空日志文件。
+
+        Returns:
+            :return 写入的消息条数
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            with _flush_time.time():
+                saved = self.db.save_chat_messages([record.message for record in batch], batch[-1].seq)
+            with self._lock:
+                if not saved:
+                    # 写入失败时放回队列，消息仍在日志中，下一次重试
+                    self._pending[:0] = batch
+                    return 0
+                if self._file is not None:
+                    self._compact()
+            _batch_size.record(len(batch))
+            return len(batch)
+
+    def _compact(self) -> None:
+        """丢弃日志中已经写入数据库的记录，调用时需持有_lock。
+
+        先把仍在队列中的记录写入临时文件再替换日志文件，替换前崩溃时原日志仍然完整。
+        """
+        if not self._pending:
+            self._file.seek(len(MAGIC))
+            self._file.truncate()
+            self._file.flush()
+            return
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "wb") as temp:
+            temp.write(MAGIC)
+            for record in self._pending:
+                temp.write(encode_record(record))
+            temp.flush()
+            if self.sync:
+                os.fsync(temp.fileno())
+        self._file.close()
+        os.replace(temp_path, self.journal_path)
+        self._file = open(self.journal_path, "ab")
+
+    def close(self) -> None:
+        """停止后台线程并写完剩余的消息。"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._pending:
+            logger.error(f"退出时仍有{len(self._pending)}条消息未写入数据库，将在下次启动时补写")
+
+    def _run(self) -> None:
+        """后台写入线程主循环。"""
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入聊天消息失败: {e}")
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/31
+# @File    : profiling.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端性能剖析模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端性能剖析模块。
+
+提供两种剖析方式，由client.xml中的debug/profile配置（off、sampling、cprofile）在启动时开启，
+或在主界面中按Ctrl+Shift+P随时开始/停止：
+
+    sampling：后台线程定时读取sys._current_frames()，只统计主线程（Tk事件循环）、接收线程和消息处理线程，
+              停止时输出折叠栈文件（每行"线程;调用栈 样本数"），可直接交给flamegraph.pl或speedscope生成火焰图；
+    cprofile：Python 3.12之前为上述线程分别启用cProfile。cProfile只能在被剖析的线程内部开启和关闭，
+              因此接收线程和消息处理线程在每次循环时调用checkpoint()同步剖析状态，
+              停止后各线程在下一次被唤醒时写出自己的.prof文件；
+              Python 3.12起cProfile基于进程级的sys.monitoring，同一时间只能启用一个Profile，
+              它在开启剖析的线程中启用即可覆盖所有线程，停止时写出一个合并的-all.prof文件。
+              checkpoint()中的任何错误都只记录日志，不会中断调用它的线程主循环。
+
+剖析期间同时运行LoopLagMonitor，测量Tk事件循环中定时回调的延迟，记录界面卡顿的时长分布。
+所有输出写入PROFILE_DIR，文件名以开始时间为前缀。
+cProfile和pstats在首次使用时才导入，checkpoint()会在启动早期被调用，不能拖慢登录窗口的显示。
+"""
+
+import collections
+import io
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Counter, List, Optional
+
+import structlog
+
+import tracing
+
+if TYPE_CHECKING:
+    import cProfile
+
+logger = structlog.get_logger()
+
+MODES = ("off", "sampling", "cprofile")
+PROFILE_DIR = "data/profiles"
+# 需要剖析的线程：Tk事件循环所在的主线程、接收线程和消息处理线程
+TARGET_THREADS = ("MainThread", "receive", "messages")
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+# cProfile是否需要在每个线程中分别启用（3.12起一个Profile覆盖所有线程）
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+# 事件循环延迟的测量间隔（毫秒）和视为卡顿的阈值（秒）
+LAG_INTERVAL_MS = 50
+STALL_THRESHOLD = 0.2
+
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """把一个线程的调用栈折叠为"线程;外层函数;...;内层函数"的形式。
+
+    Args:
+        :param frame: 最内层的栈帧
+        :param thread_name: 线程名称
+
+    Returns:
+        :return 折叠后的调用栈
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """采样剖析器类，定时采集目标线程的调用栈。"""
+
+    def __init__(self, threads=TARGET_THREADS, interval: float = SAMPLE_INTERVAL) -> None:
+        """初始化采样剖析器。
+
+        Args:
+            :param threads: 要采样的线程名称
+            :param interval: 采样间隔（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        self.threads = set(threads)
+        self.interval = interval
+        self.samples: Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """开始采样。"""
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止采样并等待采样线程退出。"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        """采样线程主循环。"""
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident)
+                if name in self.threads:
+                    self.samples[collapse_stack(frame, name)] += 1
+            self.sample_count += 1
+
+    def dump(self, prefix: str) -> List[str]:
+        """写出折叠栈文件。
+
+        Args:
+            :param prefix: 输出文件路径前缀
+
+        Returns:
+            :return 写出的文件路径列表
+        """
+        path = f"{prefix}.collapsed"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return [path]
+
+
+class CProfileSession:
+    """cProfile剖析会话类，3.12之前按线程启用，3.12起只在开启剖析的线程中启用一个。"""
+
+    def __init__(self, threads=TARGET_THREADS) -> None:
+        """初始化会话。
+
+        Args:
+            :param threads: 要剖析的线程名称
+
+        Returns:
+            :return 无返回值
+        """
+        self.threads = set(threads)
+        self.prefix: Optional[str] = None
+        self.active = False
+        # 3.12起覆盖所有线程的唯一剖析器
+        self._profile: Optional["cProfile.Profile"] = None
+
+    def start(self) -> None:
+        """开始剖析，当前线程立即开始，其余目标线程在下一次checkpoint时开始。"""
+        self.active = True
+        if not PER_THREAD_PROFILES:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return
+        _bump_generation()
+        checkpoint()
+
+    def stop(self) -> None:
+        """停止剖析，当前线程立即写出结果，其余线程在下一次checkpoint时写出。"""
+        self.active = False
+        if self._profile is not None:
+            profile, self._profile = self._profile, None
+            profile.disable()
+            self._write(profile, "all")
+            return
+        _bump_generation()
+        checkpoint()
+
+    def attach(self) -> Optional["cProfile.Profile"]:
+        """在当前线程中创建并启用剖析器（由checkpoint调用）。"""
+        import cProfile
+
+        if not PER_THREAD_PROFILES or not self.active or threading.current_thread().name not in self.threads:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def detach(self, profile: "cProfile.Profile") -> None:
+        """在当前线程中停止剖析器并写出结果（由checkpoint调用）。"""
+        profile.disable()
+        self._write(profile, threading.current_thread().name)
+
+    def _write(self, profile: "cProfile.Profile", name: str) -> None:
+        """写出剖析结果和按累计时间排序的文本摘要。"""
+        import pstats
+
+        if self.prefix is None:
+            return
+        path = f"{self.prefix}-{name}.prof"
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(50)
+        with open(f"{self.prefix}-{name}.txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        logger.info(f"{name}的剖析结果已写入{path}")
+
+    def dump(self, prefix: str) -> List[str]:
+        """记录输出路径前缀，停止剖析时写出文件。"""
+        self.prefix = prefix
+        if not PER_THREAD_PROFILES:
+            return [f"{prefix}-all.prof"]
+        return [f"{prefix}-{name}.prof" for name in sorted(self.threads)]
+
+
+_generation = 0
+_session: Optional[CProfileSession] = None
+_local = threading.local()
+
+
+def _bump_generation() -> None:
+    """剖析状态变化，各线程在下一次checkpoint时同步。"""
+    global _generation
+    _generation += 1
+
+
+def checkpoint() -> None:
+    """在线程的主循环中调用，按需在当前线程中开启或关闭cProfile。
+
+    没有状态变化时只比较一次整数，开销可以忽略。剖析出错时只记录日志，不影响调用方的主循环。
+
+    Returns:
+        :return 无返回值
+    """
+    if getattr(_local, "generation", 0) == _generation:
+        return
+    _local.generation = _generation
+    try:
+        profile = getattr(_local, "profile", None)
+        if profile is not None:
+            _local.profile = None
+            _local.owner.detach(profile)
+        if _session is not None and _session.active:
+            _local.profile = _session.attach()
+            _local.owner = _session
+    except Exception as e:
+        logger.error(f"线程{threading.current_thread().name}切换剖析状态失败: {e}")
+
+
+class LoopLagMonitor:
+    """Tk事件循环延迟监视类。
+
+    每隔interval_ms安排一个after回调，实际执行时间比预期晚多少就是事件循环被阻塞的时长。
+    """
+
+    def __init__(self, root, interval_ms: int = LAG_INTERVAL_MS, threshold: float = STALL_THRESHOLD) -> None:
+        """初始化监视器。
+
+        Args:
+            :param root: Tk根窗口
+            :param interval_ms: 测量间隔（毫秒）
+            :param threshold: 视为卡顿的延迟（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self.threshold = threshold
+        self.histogram = tracing.Histogram()
+        self.stalls = 0
+        self._expected = 0.0
+        self._after_id: Optional[str] = None
+
+    def start(self) -> None:
+        """开始监视（在主线程中调用）。"""
+        self._schedule()
+
+    def stop(self) -> None:
+        """停止监视（在主线程中调用）。"""
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _schedule(self) -> None:
+        """安排下一次测量。"""
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def _tick(self) -> None:
+        """测量本次回调的延迟。"""
+        lag = max(0.0, time.perf_counter() - self._expected)
+        self.histogram.record(lag)
+        if lag > self.threshold:
+            self.stalls += 1
+            logger.warning(f"界面卡顿{lag * 1000:.0f}ms")
+        self._schedule()
+
+    def summary(self) -> str:
+        """延迟分布的文本摘要。"""
+        stats = self.histogram.snapshot()
+        return (f"事件循环延迟: 测量{stats.count}次，卡顿(>{self.threshold * 1000:.0f}ms){self.stalls}次，"
+                f"p50={stats.p50 * 1000:.1f}ms p90={stats.p90 * 1000:.1f}ms "
+                f"p99={stats.p99 * 1000:.1f}ms 最大={stats.max * 1000:.1f}ms")
+
+
+class ProfilingController:
+    """剖析控制类，管理一次剖析的开始、停止和结果输出。所有方法都在主线程中调用。"""
+
+    def __init__(self, root, output_dir: str = PROFILE_DIR) -> None:
+        """初始化控制器。
+
+        Args:
+            :param root: Tk根窗口，用于测量事件循环延迟
+            :param output_dir: 结果输出目录
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = root
+        self.output_dir = output_dir
+        self.mode = "off"
+        self._profiler = None
+        self._lag_monitor: Optional[LoopLagMonitor] = None
+        self._prefix: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        """是否正在剖析。"""
+        return self._profiler is not None
+
+    def start(self, mode: str = "sampling") -> None:
+        """开始剖析。
+
+        Args:
+            :param mode: 剖析方式，"sampling"或"cprofile"
+
+        Returns:
+            :return 无返回值
+
+        Raises:
+            :raise ValueError: 剖析方式无效时抛出
+        """
+        global _session
+        if mode not in MODES:
+            raise ValueError(f"无效的剖析方式: {mode}，可选值: {', '.join(MODES)}")
+        if self.running or mode == "off":
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._prefix = os.path.join(self.output_dir, time.strftime("%Y%m%d-%H%M%S") + f"-{mode}")
+        if mode == "sampling":
+            self._profiler = SamplingProfiler()
+        else:
+            self._profiler = _session = CProfileSession()
+        self.mode = mode
+        self._profiler.start()
+        self._lag_monitor = LoopLagMonitor(self.root)
+        self._lag_monitor.start()
+        logger.info(f"开始性能剖析（{mode}）")
+
+    def stop(self) -> List[str]:
+        """停止剖析并写出结果。
+
+        Returns:
+            :return 写出（或即将写出）的文件路径列表
+        """
+        if not self.running:
+            return []
+        profiler, self._profiler = self._profiler, None
+        paths = profiler.dump(self._prefix)
+        profiler.stop()
+        self._lag_monitor.stop()
+        summary_path = f"{self._prefix}-lag.txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(self._lag_monitor.summary() + "\n")
+        logger.info(f"性能剖析（{self.mode}）已停止，{self._lag_monitor.summary()}")
+        self.mode = "off"
+        return paths + [summary_path]
+
+    def toggle(self, mode: str = "sampling") -> List[str]:
+        """正在剖析时停止，否则开始。
+
+        Args:
+            :param mode: 开始剖析时使用的方式
+
+        Returns:
+            :return 停止时写出的文件路径列表，开始时为空列表
+        """
+        if self.running:
+            return self.stop()
+        self.start(mode)
+        return []
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/26
+# @File    : startup.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端启动耗时统计模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端启动耗时统计模块。
+
+本模块记录客户端冷启动各阶段的耗时，并可以统计每个模块的导入耗时，
+输出类似`python -X importtime`的启动报告。StartupGraph把互不依赖的启动步骤
+（连接数据库、建表、预取联系人、拉取离线消息等）按依赖关系并发执行，
+并记录每个步骤的开始和结束时间。
+
+设置环境变量WRITEPAPERS_STARTUP_REPORT=1后，client.py会在导入其他模块之前
+安装导入计时器，登录窗口显示后打印完整报告。
+"""
+
+import importlib.abc
+import importlib.util
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 进程启动的参考时间点（本模块被导入的时刻）
+_START = time.perf_counter()
+
+# 登录窗口可见的目标耗时（毫秒）
+TARGET_MS = 200.0
+# 与目标耗时比较的阶段名称
+TARGET_PHASE = "登录窗口可见"
+# 启动步骤使用的线程数
+DEFAULT_WORKERS = 3
+# 报告中列出的最慢模块数
+REPORT_TOP = 15
+# 控制是否统计导入耗时的环境变量
+REPORT_ENV = "WRITEPAPERS_STARTUP_REPORT"
+
+# (阶段名称, 距启动的毫秒数)
+_marks: List[Tuple[str, float]] = []
+# 模块名 -> [自身耗时, 累计耗时]（微秒）
+_import_times: Dict[str, List[float]] = {}
+_import_stack: List[str] = []
+_finder: Optional["_TimingFinder"] = None
+
+
+def elapsed_ms() -> float:
+    """距启动经过的毫秒数。
+
+    Returns:
+        :return 毫秒数
+    """
+    return (time.perf_counter() - _START) * 1000
+
+
+def mark(phase: str) -> float:
+    """记录一个启动阶段完成的时间点。
+
+    Args:
+        :param phase: 阶段名称
+
+    Returns:
+        :return 距启动的毫秒数
+    """
+    now = elapsed_ms()
+    _marks.append((phase, now))
+    return now
+
+
+def report_enabled() -> bool:
+    """是否需要统计导入耗时并输出启动报告。
+
+    Returns:
+        :return 设置了WRITEPAPERS_STARTUP_REPORT时返回True
+    """
+    return os.environ.get(REPORT_ENV, "") not in ("", "0")
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """包装原始加载器，统计模块执行耗时。"""
+
+    def __init__(self, loader: importlib.abc.Loader) -> None:
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        name = module.__name__
+        _import_stack.append(name)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = (time.perf_counter() - start) * 1e6
+            _import_stack.pop()
+            entry = _import_times.setdefault(name, [0.0, 0.0])
+            entry[1] += cumulative
+            entry[0] += cumulative
+            # 父模块的自身耗时不包含子模块的导入
+            if _import_stack:
+                parent = _import_times.setdefault(_import_stack[-1], [0.0, 0.0])
+                parent[0] -= cumulative
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """在其他查找器之前拦截模块查找，为找到的模块包装计时加载器。"""
+
+    def find_spec(self, fullname, path, target=None):
+        if _finder is not self:
+            return None
+        # 暂时移除自身，交给真正的查找器
+        sys.meta_path.remove(self)
+        try:
+            spec = importlib.util.find_spec(fullname)
+        except (ImportError, ValueError):
+            spec = None
+        finally:
+            sys.meta_path.insert(0, self)
+        if spec is None or spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return None
+        spec.loader = _TimingLoader(spec.loader)
+        return spec
+
+
+def install_import_timer() -> None:
+    """安装导入计时器，之后导入的模块都会被统计耗时。
+
+    Returns:
+        :return 无返回值
+    """
+    global _finder
+    if _finder is not None:
+        return
+    _finder = _TimingFinder()
+    sys.meta_path.insert(0, _finder)
+
+
+def uninstall_import_timer() -> None:
+    """移除导入计时器。
+
+    Returns:
+        :return 无返回值
+    """
+    global _finder
+    if _finder is not None and _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    _finder = None
+
+
+def format_report(top: int = REPORT_TOP) -> str:
+    """生成启动报告文本。
+
+    Args:
+        :param top: 列出的最慢模块数
+
+    Returns:
+        :return 报告文本
+    """
+    lines = ["启动阶段耗时:"]
+    previous = 0.0
+    for phase, at in _marks:
+        lines.append(f"  {at:8.1f} ms  (+{at - previous:7.1f} ms)  {phase}")
+        previous = at
+    visible = next((at for phase, at in _marks if phase == TARGET_PHASE), None)
+    if visible is not None:
+        status = "达标" if visible <= TARGET_MS else "超出目标"
+        lines.append(f"  {TARGET_PHASE}: 目标 {TARGET_MS:.0f} ms，实际 {visible:.1f} ms，{status}")
+
+    if _import_times:
+        lines.append("导入耗时（与-X importtime相同，单位微秒）:")
+        lines.append("  import time: self [us] | cumulative | imported package")
+        slowest = sorted(_import_times.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        for name, (self_us, cumulative_us) in slowest:
+            lines.append(f"  import time: {self_us:9.0f} | {cumulative_us:10.0f} | {name}")
+    return "\n".join(lines)
+
+
+class _Step:
+    """启动依赖图中的一个步骤。"""
+
+    def __init__(self, name: str, func: Optional[Callable[[], Any]], deps: Tuple[str, ...]) -> None:
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.future: Future = Future()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.scheduled = False
+
+
+class StartupGraph:
+    """启动步骤依赖图。
+
+    每个步骤在其依赖全部完成后立即提交到线程池执行，因此总耗时取决于最慢的依赖链，
+    而不是所有步骤耗时之和。没有函数的步骤是外部里程碑（例如登录成功），
+    由complete/fail手动标记完成。依赖失败的步骤不会执行，直接以RuntimeError失败。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS) -> None:
+        """初始化依赖图。
+
+        Args:
+            :param max_workers: 执行启动步骤的线程数
+
+        Returns:
+            :return 无返回值
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self._lock = threading.Lock()
+        self._steps: Dict[str, _Step] = {}
+
+    def add(self, name: str, func: Optional[Callable[[], Any]] = None, deps: Iterable[str] = ()) -> Future:
+        """添加一个启动步骤。
+
+        Args:
+            :param name: 步骤名称
+            :param func: 步骤要执行的函数，None表示外部里程碑
+            :param deps: 依赖的步骤名称，必须已经添加
+
+        Returns:
+            :return 步骤对应的Future，结果为func的返回值
+
+        Raises:
+            :raise ValueError: 步骤重名或依赖的步骤不存在时抛出
+        """
+        deps = tuple(deps)
+        with self._lock:
+            if name in self._steps:
+                raise ValueError(f"启动步骤{name}已存在")
+            for dep in deps:
+                if dep not in self._steps:
+                    raise ValueError(f"启动步骤{name}依赖的步骤{dep}不存在")
+            step = _Step(name, func, deps)
+            step.started = elapsed_ms()
+            self._steps[name] = step
+            dep_steps = [self._steps[dep] for dep in deps]
+        # 已经完成的依赖会立即调用回调，因此必须在释放锁之后注册
+        for dep in dep_steps:
+            dep.future.add_done_callback(lambda _, s=step: self._try_schedule(s))
+        self._try_schedule(step)
+        return step.future
+
+    def complete(self, name: str, result: Any = None) -> None:
+        """标记外部里程碑完成。
+
+        Args:
+            :param name: 步骤名称
+            :param result: 步骤结果
+
+        Returns:
+            :return 无返回值
+        """
+        step = self._steps[name]
+        if step.future.done():
+            return
+        step.finished = elapsed_ms()
+        step.future.set_result(result)
+
+    def fail(self, name: str, error: BaseException) -> None:
+        """标记外部里程碑失败。
+
+        Args:
+            :param name: 步骤名称
+            :param error: 失败原因
+
+        Returns:
+            :return 无返回值
+        """
+        step = self._steps[name]
+        if step.future.done():
+            return
+        step.finished = elapsed_ms()
+        step.future.set_exception(error)
+
+    def done(self, name: str) -> bool:
+        """步骤是否已经结束（成功或失败）。
+
+        Args:
+            :param name: 步骤名称
+
+        Returns:
+            :return 已结束返回True
+        """
+        step = self._steps.get(name)
+        return step is not None and step.future.done()
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """等待步骤完成并返回结果。
+
+        Args:
+            :param name: 步骤名称
+            :param timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            :return 步骤结果
+
+        Raises:
+            步骤失败时抛出步骤的异常，超时时抛出TimeoutError
+        """
+        return self._steps[name].future.result(timeout)
+
+    def timings(self) -> Dict[str, Tuple[float, float]]:
+        """已完成步骤的(开始, 结束)时间，单位为距启动的毫秒数。
+
+        Returns:
+            :return 步骤名称到时间的字典
+        """
+        with self._lock:
+            steps = list(self._steps.values())
+        return {step.name: (step.started, step.finished) for step in steps if step.finished is not None}
+
+    def format_timings(self) -> str:
+        """生成各步骤耗时的文本。
+
+        Returns:
+            :return 报告文本
+        """
+        lines = ["启动步骤耗时:"]
+        for name, (started, finished) in sorted(self.timings().items(), key=lambda item: item[1][0]):
+            step = self._steps[name]
+            status = "失败" if step.future.exception() is not None else "完成"
+            deps = f"  依赖: {', '.join(step.deps)}" if step.deps else ""
+            lines.append(f"  {started:8.1f} -> {finished:8.1f} ms  ({finished - started:7.1f} ms)  "
+                         f"{name} {status}{deps}")
+        return "\n".join(lines)
+
+    def shutdown(self) -> None:
+        """关闭线程池，不等待未完成的步骤。
+
+        Returns:
+            :return 无返回值
+        """
+        self._executor.shutdown(wait=False)
+
+    def _try_schedule(self, step: _Step) -> None:
+        """依赖全部完成时提交步骤。"""
+        with self._lock:
+            if step.scheduled or step.func is None:
+                return
+            deps = [self._steps[dep] for dep in step.deps]
+            if not all(dep.future.done() for dep in deps):
+                return
+            step.scheduled = True
+        failed = [dep.name for dep in deps if dep.future.exception() is not None]
+        if failed:
+            step.started = step.finished = elapsed_ms()
+            step.future.set_exception(RuntimeError(f"启动步骤{step.name}依赖的步骤{', '.join(failed)}失败"))
+            return
+        try:
+            self._executor.submit(self._run, step)
+        except RuntimeError as e:
+            # 线程池已经关闭
+            step.started = step.finished = elapsed_ms()
+            step.future.set_exception(e)
+
+    @staticmethod
+    def _run(step: _Step) -> None:
+        """执行步骤（在线程池中执行）。"""
+        step.started = elapsed_ms()
+        try:
+            result = step.func()
+        except BaseException as e:
+            step.finished = elapsed_ms()
+            step.future.set_exception(e)
+        else:
+            step.finished = elapsed_ms()
+            step.future.set_result(result)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/8/31
+# @File    : tracing.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端消息延迟追踪模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端消息延迟追踪模块。
+
+每个数据包在经过各个阶段时记录一个单调时钟时间戳：
+    发送：enqueue（放入发送队列）-> socket_write（写入套接字）
+    接收：socket_read（读完整帧）-> decode（JSON解析）-> dispatch（处理器开始执行）
+          -> db_commit（写入数据库）-> render（显示到界面）-> done
+追踪结束时相邻时间戳之差按"类型:阶段"计入直方图，并通过structlog输出一条记录。
+
+追踪默认关闭，此时begin返回None，各处的stamp只做一次None判断，开销可以忽略。
+设置环境变量WRITEPAPERS_TRACE=1或调用set_enabled(True)开启。
+
+处理器内部通过current()取得正在处理的消息的追踪对象，无需修改处理器的参数。
+"""
+
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+TRACE_ENV = "WRITEPAPERS_TRACE"
+# 直方图桶的上界（秒）：从1µs开始每个桶扩大1.25倍，直到约10秒
+BUCKET_BOUNDS: Tuple[float, ...] = tuple(1e-6 * 1.25 ** i for i in range(73))
+
+_enabled = os.environ.get(TRACE_ENV, "") not in ("", "0")
+_local = threading.local()
+
+
+def enabled() -> bool:
+    """追踪是否开启。"""
+    return _enabled
+
+
+def set_enabled(value: bool) -> None:
+    """开启或关闭追踪，已经开始的追踪不受影响。
+
+    Args:
+        :param value: 是否开启
+
+    Returns:
+        :return 无返回值
+    """
+    global _enabled
+    _enabled = bool(value)
+    logger.info(f"消息延迟追踪已{'开启' if _enabled else '关闭'}")
+
+
+class Trace:
+    """一个数据包的追踪记录。"""
+
+    __slots__ = ("kind", "stamps")
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.stamps: List[Tuple[str, float]] = [("start", time.perf_counter())]
+
+    def stamp(self, stage: str) -> None:
+        """记录到达某一阶段的时间。"""
+        self.stamps.append((stage, time.perf_counter()))
+
+    def spans(self) -> List[Tuple[str, float]]:
+        """各阶段的耗时（秒），即与上一阶段时间戳之差。"""
+        return [(stage, end - start) for (_, start), (stage, end) in zip(self.stamps, self.stamps[1:])]
+
+
+def begin(kind: str) -> Optional[Trace]:
+    """开始追踪一个数据包。
+
+    Args:
+        :param kind: 追踪类型，如"send:send_message"、"recv:new_message"
+
+    Returns:
+        :return 追踪对象，追踪关闭时返回None
+    """
+    return Trace(kind) if _enabled else None
+
+
+def stamp(trace: Optional[Trace], stage: str) -> None:
+    """记录阶段时间戳，trace为None时什么也不做。
+
+    Args:
+        :param trace: 追踪对象
+        :param stage: 阶段名称
+
+    Returns:
+        :return 无返回值
+    """
+    if trace is not None:
+        trace.stamps.append((stage, time.perf_counter()))
+
+
+def finish(trace: Optional[Trace]) -> None:
+    """结束追踪：各阶段耗时计入直方图并输出日志。
+
+    Args:
+        :param trace: 追踪对象，None时什么也不做
+
+    Returns:
+        :return 无返回值
+    """
+    if trace is None:
+        return
+    spans = trace.spans()
+    total = trace.stamps[-1][1] - trace.stamps[0][1]
+    for stage, duration in spans:
+        registry.record(f"{trace.kind}:{stage}", duration)
+    registry.record(f"{trace.kind}:total", total)
+    logger.debug("消息追踪", kind=trace.kind, total_ms=round(total * 1000, 3),
+                 spans={stage: round(duration * 1000, 3) for stage, duration in spans})
+
+
+def current() -> Optional[Trace]:
+    """当前线程正在处理的消息的追踪对象。"""
+    return getattr(_local, "trace", None)
+
+
+def activate(trace: Optional[Trace]) -> Optional[Trace]:
+    """把追踪对象设为当前线程正在处理的消息，返回之前的追踪对象以便恢复。
+
+    Args:
+        :param trace: 追踪对象
+
+    Returns:
+        :return 之前的追踪对象
+    """
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    return previous
+
+
+class HistogramSnapshot(NamedTuple):
+    """直方图快照。"""
+    count: int  # 样本数
+    total: float  # 总耗时（秒）
+    max: float  # 最大耗时（秒）
+    p50: float  # 中位数（秒，桶上界的近似值）
+    p90: float
+    p99: float
+
+    @property
+    def mean(self) -> float:
+        """平均耗时（秒）。"""
+        return self.total / self.count if self.count else 0.0
+
+
+class Histogram:
+    """对数分桶的耗时直方图，记录只需要一次二分查找。"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """记录一个样本（秒）。"""
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """分位数的近似值（所在桶的上界，不超过最大值）。
+
+        Args:
+            :param q: 百分位（0~100）
+
+        Returns:
+            :return 耗时（秒）
+        """
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> HistogramSnapshot:
+        """生成快照。"""
+        return HistogramSnapshot(self.count, self.total, self.max,
+                                 self.percentile(50), self.percentile(90), self.percentile(99))
+
+
+class HistogramRegistry:
+    """按名称保存直方图的注册表，可以从任意线程记录和读取。"""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float) -> None:
+        """向指定名称的直方图记录一个样本，直方图不存在时创建。
+
+        Args:
+            :param name: 直方图名称
+            :param value: 样本（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(value)
+
+    def snapshot(self) -> Dict[str, HistogramSnapshot]:
+        """所有直方图的快照，按首次记录的顺序（同一类型的各阶段按处理顺序排列）。"""
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in self._histograms.items()}
+
+    def reset(self) -> None:
+        """清空所有直方图。"""
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = HistogramRegistry()
@@ -11,15 +11,22 @@
 """
 
 import _tkinter
+import bisect
 import time
 import tkinter as tk
-from io import BytesIO
 from tkinter import messagebox, ttk
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-import ImageViewer as imageviewer
+import contact_manager
+import metrics
 import toast_ui
-from PIL import Image, ImageTk, ImageSequence
+from chat_message import Message
+
+
+def _contact_key(contact: Dict[str, Any]) -> Tuple[float, int]:
+    """联系人列表项的排序键，与ContactManager.ordered()的顺序相同。"""
+    return contact_manager.recency_key(contact.get('activity', 0.0), contact['id'])
+
 
 class GUI:
     """WritePapers客户端图形用户界面类。
@@ -53,15 +60,25 @@ class GUI:
         
         # 数据
         self.contacts = contacts
+        # 联系人列表项：ID -> (排序键, 列表项)；_contact_keys与contacts一一对应，是各联系人的排序键
+        self._contact_items: Dict[Any, Tuple[Tuple[float, int], tk.Frame]] = {}
+        self._contact_keys: List[Tuple[float, int]] = []
         self.current_chat: Optional[Dict[str, Any]] = None
         self.messages: Dict[str, List[Dict[str, Any]]] = {}
         self.add_friend_handler: Optional[Callable] = None
+        self.debug_panel_handler: Optional[Callable] = None
+        self.profile_handler: Optional[Callable] = None
         
         # UI组件
         self.root = root
         self.toast = toast_ui.Toast(self.root)
+        # 图片相关服务在首次显示图片时才创建，见_ensure_image_support
+        self.image_cache = None
+        self.image_decoder = None
+        self.animations = None
         self.user_frame: Optional[tk.Frame] = None
         self.username_label: Optional[tk.Label] = None
+        self.status_label: Optional[tk.Label] = None
         self.text_input: Optional[tk.Text] = None
         self.msg_frame: Optional[tk.Frame] = None
         self.msg_canvas: Optional[tk.Canvas] = None
@@ -198,6 +215,8 @@ class GUI:
             # ("👥", "联系人", self.show_contacts),
             ("⚙️", "设置", self.show_settings)
         ]
+        if self.is_debug():
+            nav_buttons.append(("📊", "调试面板", self.show_debug_panel))
 
         self.nav_frame = tk.Frame(self.sidebar, bg=self.colors['primary'])
         self.nav_frame.pack(pady=30, padx=5, fill='x')
@@ -211,6 +230,11 @@ class GUI:
             btn.pack(pady=5)
             self.create_tooltip(btn, tooltip)
 
+        # 连接状态（往返时延和抖动）
+        self.status_label = tk.Label(self.sidebar, text="", font=self.fonts['small'],
+                                     bg=self.colors['primary'], fg='white', wraplength=76, justify='center')
+        self.status_label.pack(side='bottom', pady=10)
+
     def create_contact_list(self) -> None:
         """创建联系人列表区域。
         
@@ -397,6 +421,50 @@ class GUI:
 
         self.add_friend_handler = handler
 
+    def set_connection_status(self, text: str, status: str = 'success') -> None:
+        """更新侧边栏底部的连接状态。
+
+        Args:
+            :param text: 状态文本
+            :param status: 状态类型 ('success', 'warning', 'danger')
+
+        Returns:
+            :return 无返回值
+        """
+        if self.status_label is not None:
+            self.status_label.config(text=text, fg=self.colors.get(status, 'white'))
+
+    def set_debug_panel_handler(self, handler: Callable) -> None:
+        """设置打开调试面板的处理函数。
+
+        Args:
+            :param handler: 打开调试面板的回调函数
+
+        Returns:
+            :return 无返回值
+        """
+        self.debug_panel_handler = handler
+
+    def set_profile_handler(self, handler: Callable) -> None:
+        """设置开始/停止性能剖析的处理函数（快捷键Ctrl+Shift+P）。
+
+        Args:
+            :param handler: 开始或停止剖析的回调函数
+
+        Returns:
+            :return 无返回值
+        """
+        self.profile_handler = handler
+
+    def show_debug_panel(self) -> None:
+        """打开调试面板（仅调试模式下显示入口）。
+
+        Returns:
+            :return 无返回值
+        """
+        if self.debug_panel_handler:
+            self.debug_panel_handler()
+
     def create_chat_area(self) -> None:
         """创建聊天区域。
         
@@ -546,6 +614,7 @@ class GUI:
         except _tkinter.TclError:
             pass
 
+    @metrics.timed("ui.load_contacts")
     def load_contacts(self) -> None:
         """加载联系人列表。
         
@@ -559,20 +628,50 @@ class GUI:
             for widget in self.scrollable_frame.winfo_children():
                 widget.destroy()
 
-            for contact in self.contacts:
-                self.create_contact_item(contact)
+            self._contact_items.clear()
+            self._contact_keys = [_contact_key(contact) for contact in self.contacts]
+            for key, contact in zip(self._contact_keys, self.contacts):
+                self._contact_items[contact['id']] = (key, self.create_contact_item(contact))
+
+    @metrics.timed("ui.move_contact")
+    def move_contact(self, contact: Dict[str, Any]) -> None:
+        """联系人收发了新消息：只重建这一个列表项，并放到按最后活动时间排列的位置。
+
+        Args:
+            :param contact: 联系人信息字典，包含新的最后一条消息和activity
 
-    def create_contact_item(self, contact: Dict[str, Any]) -> None:
+        Returns:
+            :return 无返回值
+        """
+        if not self.scrollable_frame:
+            return
+        entry = self._contact_items.pop(contact['id'], None)
+        if entry is not None:
+            old_key, item_frame = entry
+            index = bisect.bisect_left(self._contact_keys, old_key)
+            del self._contact_keys[index]
+            del self.contacts[index]
+            item_frame.destroy()
+
+        key = _contact_key(contact)
+        index = bisect.bisect_left(self._contact_keys, key)
+        self._contact_keys.insert(index, key)
+        self.contacts.insert(index, contact)
+        before = self._contact_items[self.contacts[index + 1]['id']][1] if index + 1 < len(self.contacts) else None
+        self._contact_items[contact['id']] = (key, self.create_contact_item(contact, before))
+
+    def create_contact_item(self, contact: Dict[str, Any], before: Optional[tk.Widget] = None) -> tk.Frame:
         """创建联系人列表项。
         
         Args:
             :param contact: 联系人信息字典
+            :param before: 列表项放在这个控件之前，None时放在末尾
             
         Returns:
-            :return 无返回值
+            :return 列表项
         """
         item_frame = tk.Frame(self.scrollable_frame, bg='white', cursor='hand2')
-        item_frame.pack(fill='x', padx=15, pady=2)
+        item_frame.pack(fill='x', padx=15, pady=2, before=before)
         item_frame.bind("<Button-1>", lambda e, c=contact: self.select_contact(c))
 
         # 主要内容区域
@@ -661,6 +760,7 @@ class GUI:
 
         item_frame.bind("<Enter>", on_enter)
         item_frame.bind("<Leave>", on_leave)
+        return item_frame
 
     def select_contact(self, contact: Dict[str, Any]) -> None:
         """选择联系人并切换到对应聊天。
@@ -671,6 +771,10 @@ class GUI:
         Returns:
             :return 无返回值
         """
+        # 取消上一个聊天中尚未完成的图片解码，并停止其中的动图
+        if self.current_chat and self.image_decoder is not None:
+            self.image_decoder.cancel_group(self.current_chat['id'])
+            self.animations.remove_group(self.current_chat['id'])
         self.current_chat = contact
         self.create_active_chat(contact)
 
@@ -690,62 +794,94 @@ class GUI:
             self.display_message(msg)
     """
 
-    def display_message(self, message: Dict[str, Any]) -> None:
+    def _ensure_image_support(self) -> None:
+        """首次显示图片时导入图片模块并创建缩略图缓存、解码服务和动图播放引擎。
+
+        Returns:
+            :return 无返回值
+        """
+        if self.image_decoder is not None:
+            return
+        import animation
+        import image_cache
+        import image_decoder
+
+        self.image_cache = image_cache.ImageCache()
+        self.image_decoder = image_decoder.ImageDecoder(self.root)
+        self.animations = animation.AnimationEngine(self.root, self.image_decoder, self._is_message_visible)
+
+    @metrics.timed("ui.render_message")
+    def display_message(self, message: Message, sent: bool) -> None:
         """显示消息到聊天界面。
         
         Args:
-            :param message: 消息信息字典，包含content、time、status、sender、type等字段
+            :param message: 聊天消息
+            :param sent: 是否为当前用户发送的消息（右对齐显示）
             
         Returns:
             :return 无返回值
         """
+        time_text = message.time_label()
         msg_container = tk.Frame(self.msg_frame, bg=self.colors['secondary'])
         # msg_container = tk.Frame(self.msg_frame, bg="#030507")
         msg_container.pack(fill='x', padx=20, pady=8)
         def show_image() -> None:
-            """显示图片消息的内部函数。"""
+            """显示图片消息的内部函数。
+
+            先按缩略图尺寸绘制占位图，解码在后台线程完成后再替换为真实图片。
+            """
             try:
+                self._ensure_image_support()
+                # 图片模块依赖PIL，只在第一次显示图片时导入
+                import animation
+                import image_cache
+                import image_decoder
+                from PIL import ImageTk
+
                 def on_click(event) -> None:
                     """点击图片时打开图片查看器。"""
-                    viewer = imageviewer.ImageViewer(self.root, False)
-                    viewer.load_image(message['content'])
+                    import ImageViewer as imageviewer
+
+                    viewer = imageviewer.ImageViewer(self.root, False, decoder=self.image_decoder)
+                    viewer.load_image(message.content)
                     viewer.show()
-                
-                image = Image.open(BytesIO(message['content']))
-                # 获取图像的所有帧
-                frames = []
-                for frame in ImageSequence.Iterator(image):
-                    frames.append(ImageTk.PhotoImage(frame))
-                
-                if len(frames) > 1:
-                    # 动图处理
-                    image_label = tk.Label(msg_bubble, image=frames[0])
-                    image_label.image = frames[0]  # 保持引用
-                else:
-                    # 静态图处理
-                    image.thumbnail((300, 300))
-                    tk_image = ImageTk.PhotoImage(image)
-                    image_label = tk.Label(msg_bubble, image=tk_image)
+
+                def show_thumbnail(thumbnail: image_cache.Thumbnail) -> None:
+                    """显示缩略图，动图交给播放引擎按需解码后续帧。"""
+                    if not image_label.winfo_exists():
+                        return
+                    tk_image = ImageTk.PhotoImage(thumbnail.image)
+                    image_label.configure(image=tk_image)
                     image_label.image = tk_image  # 保持引用
-                
+                    if thumbnail.is_animated:
+                        self.animations.add(animation.GifAnimation(message.content, image_label),
+                                            group=chat_id)
+
+                def on_error(error: BaseException) -> None:
+                    """后台解码失败时提示用户。"""
+                    self.show_toast(f"图片显示失败: {str(error)}", toast_type="error")
+
+                chat_id = self.current_chat['id'] if self.current_chat else None
+                cached = self.image_cache.peek(image_cache.content_key(message.content))
+                if cached is not None:
+                    # 内存缓存命中时直接显示，无需占位
+                    image_label = tk.Label(msg_bubble)
+                    show_thumbnail(cached)
+                else:
+                    # 绘制与缩略图同尺寸的占位图，避免图片到达后布局跳动
+                    width, height = image_decoder.probe_thumbnail_size(message.content)
+                    placeholder = tk.PhotoImage(width=width, height=height)
+                    image_label = tk.Label(msg_bubble, image=placeholder, bg=self.colors['border'])
+                    image_label.image = placeholder  # 保持引用
+                    self.image_decoder.submit(image_decoder.load_bubble_image, self.image_cache,
+                                              message.content, callback=show_thumbnail,
+                                              on_error=on_error, group=chat_id)
+
                 image_label.bind("<Button-1>", on_click)
                 image_label.pack()
-
-                # 播放动画（仅对动图）
-                if len(frames) > 1:
-                    def update_frame(frame_index: int) -> None:
-                        """更新动画帧。"""
-                        try:
-                            image_label.configure(image=frames[frame_index])
-                            next_frame_index = (frame_index + 1) % len(frames)
-                            self.root.after(100, update_frame, next_frame_index)
-                        except Exception:
-                            pass  # 忽略更新错误
-                    
-                    update_frame(0)
             except Exception as e:
                 self.show_toast(f"图片显示失败: {str(e)}", toast_type="error")
-        if message['status'] == 'sent':
+        if sent:
             # 发送的消息（右对齐）
             msg_wrapper = tk.Frame(msg_container, bg=self.colors['secondary'])
             msg_wrapper.pack(anchor='e')
@@ -753,15 +889,15 @@ class GUI:
             msg_bubble = tk.Frame(msg_wrapper, bg=self.colors['primary'], padx=15, pady=10)
             msg_bubble.pack(side='right', anchor='e')
 
-            match message['type']:
+            match message.type:
                 case 'text':
-                    msg_label = tk.Label(msg_bubble, text=message['content'], font=self.fonts['default'],
+                    msg_label = tk.Label(msg_bubble, text=message.content, font=self.fonts['default'],
                                          bg=self.colors['primary'], fg='white', wraplength=3000, justify='left')
                     msg_label.pack()
                 case 'image':
                     show_image()
 
-            time_label = tk.Label(msg_wrapper, text=message['time'], font=self.fonts['small'],
+            time_label = tk.Label(msg_wrapper, text=time_text, font=self.fonts['small'],
                                   bg=self.colors['secondary'], fg=self.colors['light'])
             time_label.pack(side='right', padx=(0, 10), pady=(5, 0), anchor='e')
 
@@ -772,15 +908,15 @@ class GUI:
 
             msg_bubble = tk.Frame(msg_wrapper, bg='white', padx=15, pady=10)
             msg_bubble.pack(side='left')
-            match message['type']:
+            match message.type:
                 case 'text':
-                    msg_label = tk.Label(msg_bubble, text=message['content'], font=self.fonts['default'],
+                    msg_label = tk.Label(msg_bubble, text=message.content, font=self.fonts['default'],
                                          bg='white', fg=self.colors['dark'], wraplength=3000, justify='left')
                     msg_label.pack()
                 case 'image':
                     show_image()
 
-            time_label = tk.Label(msg_wrapper, text=message['time'], font=self.fonts['small'],
+            time_label = tk.Label(msg_wrapper, text=time_text, font=self.fonts['small'],
                                   bg=self.colors['secondary'], fg=self.colors['light'])
             time_label.pack(side='left', padx=(10, 0), pady=(5, 0))
 
@@ -815,6 +951,23 @@ class GUI:
         self.text_input.delete("1.0", tk.END)
     """
 
+    def _is_message_visible(self, widget: tk.Widget) -> bool:
+        """判断消息区域中的控件当前是否在可视范围内。
+
+        Args:
+            :param widget: 消息区域中的控件
+
+        Returns:
+            :return 控件至少有一部分在消息画布的可视区域内时返回True
+        """
+        if self.msg_canvas is None or not widget.winfo_ismapped():
+            return False
+        top = widget.winfo_rooty()
+        bottom = top + widget.winfo_height()
+        canvas_top = self.msg_canvas.winfo_rooty()
+        canvas_bottom = canvas_top + self.msg_canvas.winfo_height()
+        return bottom > canvas_top and top < canvas_bottom
+
     def create_tooltip(self, widget: tk.Widget, text: str) -> None:
         """为控件创建工具提示。
         
@@ -855,6 +1008,8 @@ class GUI:
         # 快捷键绑定
         self.root.bind('<Control-Return>',
                        lambda e: self.send_message_handler(self.current_chat) if self.current_chat else None)
+        # Shift使按键变为大写P
+        self.root.bind('<Control-P>', lambda e: self.profile_handler() if self.profile_handler else None)
 
     def show_toast(self, message: str, duration: int = 3000, position: str = 'bottom-right', 
                    bg_color: str = '#333333', text_color: str = 'white', 
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2025/9/1
+# @File    : ui_watchdog.py
+# @Software: PyCharm
+# @Desc    : WritePapers客户端界面卡顿看门狗模块
+# @Author  : Kevin Chang
+
+"""WritePapers客户端界面卡顿看门狗模块。
+
+Tk主线程用after每隔PING_INTERVAL执行一次心跳，把当前时间记录在属性中；
+看门狗线程只读取这个时间，不调用任何Tk接口（多线程Tcl中从其他线程调用after会被转交主线程执行，
+事件循环阻塞期间调用本身也会阻塞，因而无法发现卡顿）。
+心跳超过阈值仍未更新说明事件循环被同步工作阻塞（解码图片、重建联系人列表等），
+此时通过sys._current_frames()取得主线程当前的调用栈并记录下来；
+心跳恢复后以本次卡顿的时长连同调用栈通过structlog输出，并按阻塞位置累计次数和总时长，
+用于找出最常导致界面卡顿的代码路径。
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# 主线程心跳的间隔（秒）
+PING_INTERVAL = 0.1
+# 心跳比预期晚到超过该时间视为卡顿（秒）
+STALL_THRESHOLD = 0.25
+# 项目源码所在目录，用于在调用栈中定位阻塞位置
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StallSite(NamedTuple):
+    """某一阻塞位置的卡顿统计。"""
+    count: int  # 卡顿次数
+    total: float  # 总卡顿时长（秒）
+    max: float  # 最长一次卡顿（秒）
+
+
+def blocking_site(frame) -> str:
+    """在调用栈中找出阻塞位置：最内层的项目源码帧，没有时取最内层的帧。
+
+    Args:
+        :param frame: 最内层的栈帧
+
+    Returns:
+        :return "文件:函数:行号"形式的位置
+    """
+    innermost = frame
+    while frame is not None:
+        if os.path.dirname(os.path.abspath(frame.f_code.co_filename)) == SOURCE_DIR:
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+class TkWatchdog:
+    """Tk事件循环看门狗类。"""
+
+    def __init__(self, root, threshold: float = STALL_THRESHOLD, interval: float = PING_INTERVAL) -> None:
+        """初始化看门狗。
+
+        Args:
+            :param root: Tk根窗口
+            :param threshold: 视为卡顿的心跳延迟（秒）
+            :param interval: 心跳间隔（秒）
+
+        Returns:
+            :return 无返回值
+        """
+        self.root = root
+        self.threshold = threshold
+        self.interval = interval
+        # 在主线程中创建，记录主线程的标识
+        self.main_ident = threading.get_ident()
+        # 最近一次心跳的时间，只由主线程写入
+        self._beat = time.perf_counter()
+        self._after_id: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._sites: Dict[str, List[float]] = {}
+
+    def start(self) -> None:
+        """启动心跳和看门狗线程（在主线程中调用）。
+
+        Returns:
+            :return 无返回值
+        """
+        if self._thread is not None:
+            return
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止心跳和看门狗（在主线程中调用）。
+
+        Returns:
+            :return 无返回值
+        """
+        self._stop.set()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _heartbeat(self) -> None:
+        """主线程心跳：记录当前时间并安排下一次心跳。"""
+        self._beat = time.perf_counter()
+        if not self._stop.is_set():
+            self._after_id = self.root.after(int(self.interval * 1000), self._heartbeat)
+
+    def _run(self) -> None:
+        """看门狗线程主循环，只读取心跳时间，不调用Tk。"""
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            expected = beat + self.interval
+            if time.perf_counter() - expected < self.threshold:
+                continue
+
+            # 事件循环被阻塞：记录此刻主线程的调用栈，等到心跳恢复后再输出
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is None:
+                return
+            site = blocking_site(frame)
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+            while self._beat == beat:
+                if self._stop.wait(self.interval / 4):
+                    return
+            self._record(site, self._beat - expected, stack)
+
+    def _record(self, site: str, duration: float, stack: str) -> None:
+        """记录一次卡顿并输出日志。"""
+        with self._lock:
+            self._sites.setdefault(site, []).append(duration)
+            count = len(self._sites[site])
+        logger.warning(f"界面卡顿{duration * 1000:.0f}ms，阻塞位置{site}（第{count}次）",
+                       duration_ms=round(duration * 1000, 1), site=site, stack=stack)
+
+    def stats(self) -> Dict[str, StallSite]:
+        """各阻塞位置的卡顿统计。
+
+        Returns:
+            :return 阻塞位置到统计数据的字典
+        """
+        with self._lock:
+            return {site: StallSite(len(durations), sum(durations), max(durations))
+                    for site, durations in self._sites.items()}
+
+    def top(self, limit: int = 10) -> List[Tuple[str, StallSite]]:
+        """按总卡顿时长排序的阻塞位置。
+
+        Args:
+            :param limit: 返回的条目数
+
+        Returns:
+            :return [(阻塞位置, 统计数据), ...]
+        """
+        return sorted(self.stats().items(), key=lambda item: item[1].total, reverse=True)[:limit]
+
+    def report(self) -> str:
+        """生成卡顿统计的文本报告。
+
+        Returns:
+            :return 报告文本
+        """
+        lines = [f"{'阻塞位置':<48}{'次数':>6}{'总时长ms':>12}{'最长ms':>10}"]
+        for site, stats in self.top(limit=len(self._sites)):
+            lines.append(f"{site:<48}{stats.count:>6}{stats.total * 1000:>12.0f}{stats.max * 1000:>10.0f}")
+        return "\n".join(lines)